@@ -2,15 +2,12 @@
 
 """A classic fibonacci solver example.
 
-With MongoDB on the same host, this script should exhibit a ~2:1 speed-up.
+For performance figures, see the benchmark suite instead: ``python -m marrow.cache.benchmark --help``
 
-Example output of ``time python basic.py``::
+Example output of ``python basic.py``::
 
 	Connecting...
 	Preparing...
-	Cache Bypass: 100 loops, best of 3: 2.12 msec per loop
-	Cached: 1000 loops, best of 3: 1.07 msec per loop
-	Cached w/ Refresh: 1000 loops, best of 3: 1.43 msec per loop
 	The 50th fibonacci number is: 12586269025 or 12586269025
 	Total cached objects: 51
 	
@@ -20,20 +17,16 @@ Example output of ``time python basic.py``::
 	CacheKey(__main__:fibonacci, None, 92f4d3af051f64c9f17c61626606088937521b4c4b0606d72dddddc474bbcb8f)
 	
 	Cleaning up...
-	python basic.py  10.57s user 0.40s system 91% cpu 11.933 total
 
 """
 
 
 from __future__ import unicode_literals, print_function
 
-from timeit import main as timeit
 from mongoengine import connect
 
 from marrow.cache import Cache
 
-flush = __import__('sys').stdout.flush
-
 
 @Cache.memoize(minutes=5)
 def fibonacci(n):
@@ -46,9 +39,6 @@ def fibonacci(n):
 	return fibonacci(n-1) + fibonacci(n-2)
 
 
-fib_refresh = Cache.memoize(minutes=5, refresh=True)(fibonacci.__wrapped__)
-
-
 if __name__ == '__main__':
 	# First, open a database connection.
 	print("Connecting...")
@@ -59,18 +49,6 @@ if __name__ == '__main__':
 	Cache.drop_collection()
 	Cache.ensure_indexes()
 	
-	# First, the unoptimized approach.
-	print("Cache Bypass: ", end=''); flush()
-	timeit(('-s', 'from __main__ import fibonacci', 'fibonacci.__wrapped__(50)'))
-	
-	# Now, what happens when we use the cache?
-	print("Cached: ", end=''); flush()
-	timeit(('-s', 'from __main__ import fibonacci', 'fibonacci(50)'))
-	
-	# Lastly, what happens when we use the cache and allow it to update itself?
-	print("Cached w/ Refresh: ", end=''); flush()
-	timeit(('-s', 'from __main__ import fib_refresh', 'fib_refresh(50)'))
-	
 	print("The 50th fibonacci number is:", fibonacci(50), "or", fibonacci.__wrapped__(50))
 	
 	# Emit some interesting statistics:
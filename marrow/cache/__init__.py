@@ -3,4 +3,6 @@
 from .release import version as __version__
 
 from .model import Cache
-from .exc import CacheMiss
+from .exc import CacheMiss, CacheExpired
+from .local import LocalCache
+from .shared import SharedCache
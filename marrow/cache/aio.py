@@ -0,0 +1,367 @@
+# encoding: utf-8
+
+"""Caching of the results of coroutine functions.
+
+Decorating a coroutine function using ``Cache.memoize`` or ``Cache.method`` produces an ``AsyncCacheMark``, which awaits
+the coroutine and caches its result.  Storage is accessed through an asynchronous backend: that given using the
+``backend`` argument, otherwise ``Cache.ASYNC_BACKEND``, otherwise the synchronous backend that would have been used,
+operated from a thread pool so as not to block the event loop.
+"""
+
+# ## Imports
+
+from __future__ import unicode_literals
+
+from asyncio import ensure_future, get_event_loop, shield, sleep
+
+from .exc import CacheMiss
+from .model import MISSING, CacheMark, Raised
+from .scope import MEMO
+from .backend.aio import ThreadedBackend, asynchronous
+from .util import copy, time
+
+
+log = __import__('logging').getLogger(__name__)
+
+
+# ## Implementation
+
+class AsyncFlight(object):
+	"""Ensure only one task at a time performs the computation for any given key, sharing its result.
+	
+	The asynchronous counterpart to ``Flight``, coordinating tasks within an event loop using futures.  Futures may
+	only be awaited within the loop they belong to, so calls are coalesced per event loop; marks shared by coroutines
+	running in several loops (in several threads, say) perform the computation once within each.
+	"""
+	
+	def __init__(self):
+		self._calls = {}  # (loop, key): future
+		
+		super(AsyncFlight, self).__init__()
+	
+	def __len__(self):
+		return len(self._calls)
+	
+	async def run(self, key, fn, *args, **kw):
+		"""Await ``fn`` with the given arguments, unless a call for this hashable key is already in progress."""
+		
+		loop = get_event_loop()
+		slot = (loop, key)
+		future = self._calls.get(slot)
+		
+		if future is not None:
+			return await shield(future)  # The cancellation of one waiting task must not cancel the others.
+		
+		future = self._calls[slot] = loop.create_future()
+		
+		try:
+			result = await fn(*args, **kw)
+		
+		except Exception as e:
+			if not future.done():
+				future.set_exception(e)
+				future.exception()  # Mark the exception as retrieved, should no other task be waiting on it.
+			
+			raise
+		
+		except BaseException:  # Cancellation of the task performing the computation cancels those awaiting it.
+			future.cancel()
+			raise
+		
+		else:
+			if not future.done():
+				future.set_result(result)
+		
+		finally:
+			del self._calls[slot]
+		
+		return result
+
+
+class AsyncCacheMark(CacheMark):
+	"""The asynchronous variant of ``CacheMark``, used automatically when decorating coroutine functions.
+	
+	Only the awaiting of the wrapped coroutine and of the backend lives here; the decisions made along the way are
+	those of the synchronous helpers of ``CacheMark``.
+	"""
+	
+	@classmethod
+	def derive(cls, mark):
+		"""Produce an asynchronous mark sharing the configuration of the given one."""
+		
+		result = copy(mark)
+		result.__class__ = cls
+		result.flight = AsyncFlight() if mark.flight is not None else None
+		result.revalidating = set()
+		result.tasks = set()  # References to background tasks, which the event loop only weakly references.
+		result._adapted = None  # The synchronous backend last adapted for use by coroutines, and its adapter.
+		
+		return result
+	
+	def storage(self):
+		"""Identify the asynchronous backend to use."""
+		
+		if self.backend is not None:
+			source = self.backend
+		
+		elif self.manager.ASYNC_BACKEND is not None:
+			return self.manager.ASYNC_BACKEND
+		
+		else:
+			source = self.manager.BACKEND or self.manager
+		
+		adapted = self._adapted
+		
+		if adapted is None or adapted[0] is not source:
+			adapted = self._adapted = (source, asynchronous(source))
+		
+		return adapted[1]
+	
+	async def tagged_key(self, wrapped, instance, args, kw):
+		"""As per ``key``, retrieving the generations of the tags of the call, if any, asynchronously."""
+		
+		if not self.tags:
+			return self.key(wrapped, instance, args, kw)
+		
+		backend = self.storage()
+		source = backend.backend if isinstance(backend, ThreadedBackend) else backend  # Shared with synchronous use.
+		store = self.manager.TAGS
+		found, missing = store.cached(source, self.tagged(instance, args, kw))
+		
+		if missing:
+			found.update(store.retrieved(source, missing, await backend.get_many([store.key(tag) for tag in missing])))
+		
+		return self.key(wrapped, instance, args, kw, store.generations(found))
+	
+	async def wrapper(self, wrapped, instance, args, kw):
+		key = await self.tagged_key(wrapped, instance, args, kw)
+		
+		if key is None:
+			return await wrapped(*args, **kw)
+		
+		memo, value = self.recollect(key[0])
+		
+		if value is MISSING:
+			value = await self.lookup(key[0], key[1], wrapped, args, kw)
+			
+			if memo is not None:
+				memo[key[0].identity] = value
+		
+		return self.result(value)
+	
+	async def lookup(self, key, _args, wrapped, args, kw):
+		local = self.tier()
+		
+		try:
+			return self.recall(key, local)
+		except CacheMiss:
+			pass
+		
+		backend = self.storage()
+		refresh = self.refreshing()
+		start = time()
+		
+		try:
+			try:
+				value, expires = await backend.get(key, refresh=refresh, detail=True)
+			except CacheMiss:
+				if not self.manager.MIGRATE_KEYS:
+					raise
+				
+				value, expires = await self.migrate(backend, key, _args)
+		
+		except CacheMiss as e:
+			self.observed(key.prefix, start)
+			self.missed(key.prefix, e)
+			
+			if not self.populate:
+				raise
+		
+		else:
+			self.observed(key.prefix, start)
+			return await self.hit(backend, key, local, value, expires, wrapped, args, kw,
+					refreshed=refresh is not None)
+		
+		if self.flight is not None:
+			value, expires = await self.flight.run(key.identity, self.generate, backend, key, wrapped, args, kw)
+		else:
+			value, expires = await self.generate(backend, key, wrapped, args, kw)
+		
+		self.remember(local, key, value, self.fresh(expires))
+		
+		return value
+	
+	async def many(self, calls, executor=None):
+		"""Retrieve the results of many ``(wrapped, instance, args)`` calls, returning a list of results in order.
+		
+		As per ``CacheMark.many``, save that the misses are computed concurrently as tasks; ``executor`` is ignored.
+		"""
+		
+		local = self.tier()
+		backend = self.storage()
+		memo = MEMO.get()
+		keys = [(await self.tagged_key(call[0], call[1], call[2], {})) for call in calls]
+		order, results, pending, prefix = self.partition(calls, keys, local, memo)
+		
+		start = time()
+		found = (await backend.get_many([item[0] for item in pending.values()], detail=True)) if pending else {}
+		
+		if pending:
+			self.observed(prefix, start)
+		
+		for identity, (key, _args, call) in list(pending.items()):
+			try:
+				value, expires = found[identity]
+			except KeyError:
+				if not self.manager.MIGRATE_KEYS:
+					continue
+				
+				try:
+					value, expires = await self.migrate(backend, key, _args)
+				except CacheMiss:
+					continue
+			
+			results[identity] = await self.hit(backend, key, local, value, expires, call[0], call[2], {})
+			del pending[identity]
+		
+		if pending:
+			self.missed(prefix, count=len(pending))
+			
+			if not self.populate:
+				raise CacheMiss()
+		
+		if self.lease:
+			generated = [ensure_future(self.generate(backend, item[0], item[2][0], item[2][2], {}))
+					for item in pending.values()]
+			generated = [(await task) for task in generated]
+		
+		else:
+			packaged = [ensure_future(self.compute(item[2][0], item[2][2], {}, prefix)) for item in pending.values()]
+			packaged = [self.package((await task), prefix) for task in packaged]
+			generated = [(value, expires) for value, stored, expires in packaged]
+			
+			if packaged:
+				try:
+					await backend.set_many([(item[0], stored, expires) for item, (value, stored, expires) in
+							zip(pending.values(), packaged)])
+				except Exception:
+					self.failed(prefix, len(packaged))
+					raise
+		
+		self.settle(results, pending, generated, local, memo)
+		
+		return [(await call[0](*call[2])) if identity is None else self.result(results[identity])
+				for identity, call in order]
+	
+	async def discard(self, wrapped, instance, args, kw):
+		key = await self.tagged_key(wrapped, instance, args, kw)
+		
+		if key is None:
+			return
+		
+		self.evict(key[0])
+		await self.storage().delete(key[0])
+	
+	async def invalidate(self, wrapped):
+		return await self.storage().invalidate(self.sweep(wrapped))
+	
+	async def hit(self, backend, key, local, value, expires, wrapped, args, kw, refreshed=False):
+		try:
+			value = self.restore(value)
+		except CacheMiss:
+			value, expires = await self.generate(backend, key, wrapped, args, kw)
+		
+		fresh, stale, extended = self.assess(key, value, expires, refreshed)
+		
+		if stale:
+			self.revalidate(backend, key, local, wrapped, args, kw)
+		
+		elif extended is not None:
+			refresher = self.manager.REFRESH if self.refresh is not True else None
+			
+			if refresher is not None and isinstance(backend, ThreadedBackend):  # Merged with synchronous use.
+				refresher.touch(backend.backend, key, extended)
+			else:
+				await backend.touch(key, extended)
+		
+		self.remember(local, key, value, fresh)
+		
+		return value
+	
+	def revalidate(self, backend, key, local, wrapped, args, kw):
+		"""Regenerate a value in a background task, unless one is already doing so."""
+		
+		if not self.claim(key):
+			return
+		
+		async def revalidate_inner():
+			try:
+				value, expires = await self.generate(backend, key, wrapped, args, kw)
+				self.remember(local, key, value, self.fresh(expires))
+			
+			except Exception:
+				log.exception("Failed to revalidate cached value: %r", key)
+			
+			finally:
+				self.relinquish(key)
+		
+		task = ensure_future(revalidate_inner())
+		self.tasks.add(task)
+		task.add_done_callback(self.tasks.discard)
+	
+	async def generate(self, backend, key, wrapped, args, kw):
+		token = (await backend.lease(key, self.lease)) if self.lease else None
+		
+		if self.lease and token is None:
+			try:
+				return await self.wait(backend, key)
+			except CacheMiss:
+				pass
+		
+		try:
+			value, stored, expires = self.package((await self.compute(wrapped, args, kw, key.prefix)), key.prefix)
+			
+			try:
+				await backend.set(key, stored, expires)
+			except Exception:
+				self.failed(key.prefix)
+				raise
+		
+		finally:
+			if token is not None:
+				await backend.release(key, token)
+		
+		return value, expires
+	
+	async def compute(self, wrapped, args, kw, prefix=None):
+		start = time()
+		
+		try:
+			value = await wrapped(*args, **kw)
+		except self.exceptions as e:
+			value = Raised(e)
+		
+		self.measure(time() - start, prefix)
+		
+		return value
+	
+	async def wait(self, backend, key):
+		for delay in self.backoff():
+			await sleep(delay)
+			
+			try:
+				value, expires = await backend.get(key, detail=True)
+				return self.restore(value), expires
+			except CacheMiss:
+				pass
+		
+		raise CacheMiss()
+	
+	async def migrate(self, backend, key, arguments):
+		legacy = self.legacy(key, arguments)
+		value, expires = await backend.get(legacy, detail=True)
+		
+		await backend.set(key, value, expires)
+		await backend.delete(legacy)
+		
+		return value, expires
@@ -0,0 +1,51 @@
+# encoding: utf-8
+
+"""Storage backends for cached values.
+
+A backend is any object providing the following methods, each accepting ``CacheKey`` instances as keys:
+
+* ``get(key, refresh=None, detail=False)`` returns the stored value, or a ``(value, expires)`` tuple if ``detail`` is
+  truthy, raising ``CacheMiss`` if the value is absent or expired.  If ``refresh`` is given it is called to produce
+  a new expiry time for the record.
+
+* ``set(key, value, expires)`` stores a value, replacing any existing one.
+
+* ``delete(key)`` removes a value, if present.
+
+* ``set_many(entries)`` stores many ``(key, value, expires)`` tuples, ideally in a single request.
+
+* ``get_many(keys, detail=False)`` returns a dictionary mapping the ``identity`` of each key found to its value (or
+  ``(value, expires)`` tuple); missing and expired keys are omitted.
+
+* ``touch(key, expires)`` updates the expiry time of a value, if present.
+
+* ``touch_many(entries)`` updates the expiry times of many ``(key, expires)`` tuples, ideally in a single request
+  that leaves any expiry time already later unchanged.
+
+* ``invalidate(key)`` removes all values whose keys share the prefix and reference of the given key, ignoring those
+  which are ``None``, and returns the number removed.  At least one must be given.
+
+Backends whose values may be evicted by ``Bounded``, which enforces budgets on the number and size of values stored,
+implement ``usage(prefix=None, size=True)``, ``sample(prefix, count)``, ``evict(handles)`` and ``access(entries)``.
+
+Backends shared between processes may also coordinate the generation of values by implementing ``lease(key,
+duration)``, returning a token if an exclusive, expiring lease was acquired (otherwise ``None``), and ``release(key,
+token)``.
+
+The ``Cache`` document class itself is the default backend; ``MemoryBackend``, ``MongoBackend`` and
+``SQLiteBackend`` are also provided, as is ``WriteBehind``, which buffers writes made to another backend.  Subclassing
+``Backend`` provides default implementations of ``get_many``, ``set_many``, ``touch`` and ``touch_many`` in terms of
+the other methods, and of ``lease`` and ``release`` that perform no coordination.
+"""
+
+from .base import Backend
+from .memory import MemoryBackend
+from .mongo import MongoBackend
+from .sqlite import SQLiteBackend
+from .buffer import WriteBehind, Refresher
+from .evict import Bounded, Quota
+from ..compat import py35
+
+if py35:  # pragma: no cover
+	from .aio import AsyncBackend, AsyncMemoryBackend, ThreadedBackend
+	from .motor import MotorBackend
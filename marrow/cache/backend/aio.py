@@ -0,0 +1,168 @@
+# encoding: utf-8
+
+"""Asynchronous storage backends, for use by coroutine functions.
+
+The asynchronous backend protocol mirrors the synchronous one, with each method being a coroutine.  Synchronous
+backends may be used from coroutines by wrapping them in a ``ThreadedBackend``, which performs each operation in a
+thread pool rather than blocking the event loop; this is done automatically where required.
+"""
+
+# ## Imports
+
+from __future__ import unicode_literals
+
+from asyncio import get_event_loop
+from functools import partial
+from inspect import iscoroutinefunction
+
+from .memory import MemoryBackend
+from ..exc import CacheMiss
+
+
+# ## Implementation
+
+class AsyncBackend(object):
+	"""The abstract base class for asynchronous cache storage backends."""
+	
+	async def get(self, key, refresh=None, detail=False):
+		raise NotImplementedError()
+	
+	async def set(self, key, value, expires):
+		raise NotImplementedError()
+	
+	async def delete(self, key):
+		raise NotImplementedError()
+	
+	async def invalidate(self, key):
+		raise NotImplementedError()
+	
+	async def set_many(self, entries):
+		for key, value, expires in entries:
+			await self.set(key, value, expires)
+	
+	async def get_many(self, keys, detail=False):
+		result = {}
+		
+		for key in keys:
+			try:
+				result[key.identity] = await self.get(key, detail=detail)
+			except CacheMiss:
+				pass
+		
+		return result
+	
+	async def touch(self, key, expires):
+		try:
+			await self.get(key, refresh=lambda: expires)
+		except CacheMiss:
+			pass
+	
+	async def touch_many(self, entries):
+		for key, expires in entries:
+			await self.touch(key, expires)
+	
+	async def lease(self, key, duration):
+		return True
+	
+	async def release(self, key, token):
+		pass
+
+
+class ThreadedBackend(AsyncBackend):
+	"""Adapt a synchronous backend for use by coroutines, performing each operation using an executor.
+	
+	If no ``executor`` is given, the default executor of the event loop is used.
+	"""
+	
+	def __init__(self, backend, executor=None):
+		self.backend = backend
+		self.executor = executor
+		
+		super(ThreadedBackend, self).__init__()
+	
+	def __repr__(self):
+		return 'ThreadedBackend({0!r})'.format(self.backend)
+	
+	def _run(self, fn, *args):
+		return get_event_loop().run_in_executor(self.executor, partial(fn, *args))
+	
+	async def get(self, key, refresh=None, detail=False):
+		return await self._run(self.backend.get, key, refresh, detail)
+	
+	async def set(self, key, value, expires):
+		return await self._run(self.backend.set, key, value, expires)
+	
+	async def delete(self, key):
+		await self._run(self.backend.delete, key)
+	
+	async def invalidate(self, key):
+		return await self._run(self.backend.invalidate, key)
+	
+	async def set_many(self, entries):
+		await self._run(self.backend.set_many, list(entries))
+	
+	async def get_many(self, keys, detail=False):
+		return await self._run(self.backend.get_many, list(keys), detail)
+	
+	async def touch(self, key, expires):
+		await self._run(self.backend.touch, key, expires)
+	
+	async def touch_many(self, entries):
+		await self._run(self.backend.touch_many, list(entries))
+	
+	async def lease(self, key, duration):
+		return await self._run(self.backend.lease, key, duration)
+	
+	async def release(self, key, token):
+		await self._run(self.backend.release, key, token)
+
+
+class AsyncMemoryBackend(AsyncBackend):
+	"""Store cached values in a dictionary; the asynchronous counterpart to ``MemoryBackend``, useful in testing."""
+	
+	def __init__(self, copy=True):
+		self.memory = MemoryBackend(copy)
+		
+		super(AsyncMemoryBackend, self).__init__()
+	
+	def __repr__(self):
+		return 'AsyncMemoryBackend({0} entries)'.format(len(self.memory.data))
+	
+	@property
+	def data(self):
+		return self.memory.data
+	
+	async def get(self, key, refresh=None, detail=False):
+		return self.memory.get(key, refresh, detail)
+	
+	async def set(self, key, value, expires):
+		return self.memory.set(key, value, expires)
+	
+	async def delete(self, key):
+		self.memory.delete(key)
+	
+	async def invalidate(self, key):
+		return self.memory.invalidate(key)
+	
+	async def set_many(self, entries):
+		self.memory.set_many(entries)
+	
+	async def get_many(self, keys, detail=False):
+		return self.memory.get_many(keys, detail)
+	
+	async def touch(self, key, expires):
+		self.memory.touch(key, expires)
+	
+	async def touch_many(self, entries):
+		self.memory.touch_many(entries)
+
+
+# ## Utility Functions
+
+def asynchronous(backend):
+	"""Return the given backend if asynchronous, otherwise a ``ThreadedBackend`` wrapping it."""
+	
+	if iscoroutinefunction(getattr(backend, 'get', None)):
+		return backend
+	
+	return ThreadedBackend(backend)
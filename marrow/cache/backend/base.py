@@ -0,0 +1,146 @@
+# encoding: utf-8
+
+"""The common base class and utilities shared by storage backends."""
+
+# ## Imports
+
+from __future__ import unicode_literals
+
+from ..exc import CacheMiss
+from ..compat import unicode
+
+
+# ## Implementation
+
+class Backend(object):
+	"""The abstract base class for cache storage backends."""
+	
+	def get(self, key, refresh=None, detail=False):
+		raise NotImplementedError()
+	
+	def set(self, key, value, expires):
+		raise NotImplementedError()
+	
+	def delete(self, key):
+		raise NotImplementedError()
+	
+	def invalidate(self, key):
+		raise NotImplementedError()
+	
+	def set_many(self, entries):
+		for key, value, expires in entries:
+			self.set(key, value, expires)
+	
+	def get_many(self, keys, detail=False):
+		result = {}
+		
+		for key in keys:
+			try:
+				result[key.identity] = self.get(key, detail=detail)
+			except CacheMiss:
+				pass
+		
+		return result
+	
+	def touch(self, key, expires):
+		try:
+			self.get(key, refresh=lambda: expires)
+		except CacheMiss:
+			pass
+	
+	def touch_many(self, entries):
+		for key, expires in entries:
+			self.touch(key, expires)
+	
+	def usage(self, prefix=None, size=True):
+		"""Return the number of values stored under a prefix (or in total), and their size in bytes if ``size``.
+		
+		The totals exclude tag generations, stored under ``Generations.PREFIX``, which are never to be evicted.
+		"""
+		
+		raise NotImplementedError()
+	
+	def sample(self, prefix, count):
+		"""Return up to ``count`` randomly chosen values under a prefix (or of all) as ``(handle, accessed)`` tuples.
+		
+		Tag generations are never sampled from all values.
+		"""
+		
+		raise NotImplementedError()
+	
+	def evict(self, handles):
+		"""Remove the values identified by handles produced by ``sample``, returning the number removed."""
+		
+		raise NotImplementedError()
+	
+	def access(self, entries):
+		"""Record the last access times of many ``(key, accessed)`` entries, leaving any already later unchanged."""
+		
+		raise NotImplementedError()
+	
+	def scan(self, prefix=None, since=None, limit=None, keys=None):
+		"""Iterate unexpired values as ``(identity, value, expires)`` tuples, as stored, for use in warming.
+		
+		Values may be restricted to those under a prefix, those with a last access time (see ``access``) no earlier than
+		``since``, or those with the given keys, as produced by ``CacheKey.to_mongo``; at most ``limit`` are produced.
+		"""
+		
+		raise NotImplementedError()
+	
+	def lease(self, key, duration):
+		"""Attempt to acquire an exclusive lease, expiring after ``duration``, on generating the value for a key.
+		
+		Returns a token to later pass to ``release`` if acquired, otherwise ``None``.  Backends not shared between
+		processes have nothing to coordinate with, and always grant the lease.
+		"""
+		
+		return True
+	
+	def release(self, key, token):
+		"""Release a lease previously acquired using ``lease``."""
+		
+		pass
+
+
+# ## Utility Functions
+
+def matches(key):
+	"""Produce a predicate testing whether an identity shares the prefix and reference (where given) of a key."""
+	
+	prefix, reference = key.identity[:2]
+	
+	if prefix is None and reference is None:
+		raise ValueError("Refusing to invalidate every value; a prefix or reference is required.")
+	
+	predicate = lambda identity: ((prefix is None or identity[0] == prefix) and
+			(reference is None or identity[1] == reference))
+	predicate.prefix, predicate.reference = prefix, reference  # Allowing tiers to rule out values without their keys.
+	
+	return predicate
+
+
+def identify(criteria):
+	"""Produce the ``identity`` of a key from its stored form, as produced by ``CacheKey.to_mongo``.
+	
+	Referenced documents are not loaded; their class name is that recorded in the reference, as also used by the
+	``identity`` of keys as constructed.
+	"""
+	
+	reference = criteria.get('r')
+	
+	if reference is not None:
+		reference = (reference['_cls'], reference['_ref'].id)
+	
+	return (criteria.get('p'), reference, criteria.get('h'))
+
+
+def textual(key):
+	"""Produce a textual representation of a cache key, for use by backends that can only index strings."""
+	
+	prefix, reference, hash = key.identity
+	
+	if reference is not None:
+		reference = '{0[0]}:{0[1]}'.format(reference)
+	
+	return '\0'.join(unicode(i or '') for i in (prefix, reference, hash))
+
@@ -0,0 +1,382 @@
+# encoding: utf-8
+
+"""A write-behind buffer placed in front of another storage backend, and a buffer merging extensions of expiry."""
+
+# ## Imports
+
+from __future__ import unicode_literals
+
+from atexit import register
+from threading import Lock, Condition, Thread
+from collections import OrderedDict
+from weakref import WeakSet
+
+from .base import Backend, matches
+from ..exc import CacheExpired
+from ..util import utcnow, time
+
+
+log = __import__('logging').getLogger(__name__)
+_buffers = WeakSet()  # The buffers and refreshers to close at process exit, without keeping them alive until then.
+
+
+# ## Implementation
+
+class WriteBehind(Backend):
+	"""Queue writes in memory, storing them in bulk using the ``set_many`` method of the wrapped backend.
+	
+	Queued values are written by a background thread once ``size`` values are waiting, once the oldest has waited
+	``interval`` seconds, when ``flush`` is called, or at process exit.  At most ``limit`` values may be queued;
+	further writes block until the queue drains.  Reads (and other operations) consult the queue before the wrapped
+	backend, so that values written within this process are immediately visible to it.  Buffers no longer referenced
+	are collected once their background thread has been idle for ``IDLE`` seconds.
+	
+	To buffer all writes to the ``Cache`` collection::
+	
+		Cache.BACKEND = WriteBehind(Cache)
+	"""
+	
+	IDLE = 60.0  # Seconds the background thread waits without anything to write before exiting, until the next write.
+	
+	def __init__(self, backend, size=500, interval=1.0, limit=10000):
+		self.backend = backend
+		self.size = size
+		self.interval = interval
+		self.limit = limit
+		self.pending = OrderedDict()  # identity: (key, value, expires)
+		self.flushing = {}  # The values being written by a flush in progress.
+		self.extended = {}  # identity: (key, expires); refreshes of values being flushed, applied once written.
+		self.closed = False
+		self.thread = None
+		self._condition = Condition(Lock())
+		self._flush_lock = Lock()
+		
+		_buffers.add(self)
+		
+		super(WriteBehind, self).__init__()
+	
+	def __repr__(self):
+		return 'WriteBehind({0!r}, {1} pending)'.format(self.backend, len(self.pending))
+	
+	def _queued(self, identity):
+		"""Return the queued ``(key, value, expires)`` entry for an identity, or ``None``."""
+		
+		entry = self.pending.get(identity)
+		return self.flushing.get(identity) if entry is None else entry
+	
+	def get(self, key, refresh=None, detail=False):
+		identity = key.identity
+		
+		with self._condition:
+			entry = self._queued(identity)
+			
+			if entry is not None:
+				if entry[2] is not None and entry[2].replace(tzinfo=None) < utcnow():
+					raise CacheExpired()
+				
+				if refresh:
+					expires = refresh()
+					
+					if identity in self.pending:
+						self.pending[identity] = (key, entry[1], expires)
+					else:  # Being written by a flush in progress; extended once written, rather than written again.
+						self.extended[identity] = (key, expires)
+					
+					entry = (key, entry[1], expires)
+				
+				return entry[1:] if detail else entry[1]
+		
+		return self.backend.get(key, refresh, detail)
+	
+	def set(self, key, value, expires):
+		with self._condition:
+			while not self.closed and len(self.pending) >= self.limit:  # Apply backpressure until the queue drains.
+				self._condition.notify_all()
+				self._condition.wait()
+			
+			if not self.closed:  # Values queued once closed would never be written.
+				self.pending[key.identity] = (key, value, expires)
+				
+				if len(self.pending) == 1 or len(self.pending) >= self.size:
+					self._condition.notify_all()
+				
+				if self.thread is None:
+					self.thread = Thread(target=self._run, name='WriteBehind')
+					self.thread.daemon = True
+					self.thread.start()
+				
+				return value
+		
+		return self.backend.set(key, value, expires)
+	
+	def set_many(self, entries):
+		for key, value, expires in entries:
+			self.set(key, value, expires)
+	
+	def delete(self, key):
+		with self._condition:
+			self.pending.pop(key.identity, None)
+		
+		with self._flush_lock:  # Ensure a flush in progress can not restore the value.
+			self.backend.delete(key)
+	
+	def invalidate(self, key):
+		match = matches(key)
+		
+		with self._condition:
+			found = [identity for identity in self.pending if match(identity)]
+			
+			for identity in found:
+				del self.pending[identity]
+		
+		with self._flush_lock:
+			return self.backend.invalidate(key)
+	
+	def get_many(self, keys, detail=False):
+		keys = list(keys)
+		result = {}
+		now = utcnow()
+		
+		with self._condition:
+			queued = dict((key.identity, self._queued(key.identity)) for key in keys)
+		
+		remaining = [key for key in keys if queued[key.identity] is None]
+		
+		if remaining:
+			result.update(self.backend.get_many(remaining, detail))
+		
+		for identity, entry in queued.items():
+			if entry is None or (entry[2] is not None and entry[2].replace(tzinfo=None) < now):
+				continue
+			
+			result[identity] = entry[1:] if detail else entry[1]
+		
+		return result
+	
+	def touch(self, key, expires):
+		identity = key.identity
+		
+		with self._condition:
+			entry = self.pending.get(identity)
+			
+			if entry is not None:
+				self.pending[identity] = (key, entry[1], expires)
+				return
+		
+		with self._flush_lock:
+			self.backend.touch(key, expires)
+	
+	def touch_many(self, entries):
+		remaining = []
+		
+		with self._condition:
+			for key, expires in entries:
+				entry = self.pending.get(key.identity)
+				
+				if entry is None:
+					remaining.append((key, expires))
+					continue
+				
+				self.pending[key.identity] = (key, entry[1], expires)
+		
+		if remaining:
+			with self._flush_lock:
+				self.backend.touch_many(remaining)
+	
+	def lease(self, key, duration):
+		return self.backend.lease(key, duration)
+	
+	def release(self, key, token):
+		self.backend.release(key, token)
+	
+	def flush(self):
+		"""Write all queued values to the wrapped backend, returning the number written."""
+		
+		with self._flush_lock:
+			with self._condition:
+				entries, self.pending = self.pending, OrderedDict()
+				self.flushing = entries
+				self._condition.notify_all()  # Release any writers waiting on the queue to drain.
+			
+			try:
+				if entries:
+					self.backend.set_many(list(entries.values()))
+			
+			except Exception:
+				log.exception("Failed to write %d buffered values to %r.", len(entries), self.backend)
+			
+			finally:
+				with self._condition:
+					self.flushing = {}
+					extended, self.extended = self.extended, {}
+			
+			try:
+				if extended:
+					self.backend.touch_many(list(extended.values()))
+			
+			except Exception:
+				log.exception("Failed to extend the expiry of %d buffered values in %r.", len(extended), self.backend)
+		
+		return len(entries)
+	
+	def close(self):
+		"""Stop the background thread, writing any values still queued.  Further writes are not buffered."""
+		
+		with self._condition:
+			self.closed = True
+			self._condition.notify_all()
+			thread = self.thread
+		
+		if thread is not None:
+			thread.join()
+		
+		self.flush()
+	
+	def _run(self):
+		condition = self._condition
+		
+		while True:
+			with condition:
+				if not self.pending and not self.closed:
+					condition.wait(self.IDLE)
+					
+					if not self.pending and not self.closed:  # Idle; the next write starts another thread.
+						self.thread = None
+						return
+				
+				if self.closed:
+					return
+				
+				deadline = time() + self.interval
+				
+				while len(self.pending) < self.size and not self.closed:
+					remaining = deadline - time()
+					
+					if remaining <= 0:
+						break
+					
+					condition.wait(remaining)
+			
+			self.flush()
+
+
+@register
+def _close():
+	"""Close the write-behind buffers and refreshers still in use at process exit, writing anything still queued."""
+	
+	for buffer in list(_buffers):
+		buffer.close()
+
+
+class Refresher(object):
+	"""Merge extensions of the expiry times of values, applying them periodically in bulk using ``touch_many``.
+	
+	Repeated extensions of the same value, in the same backend, made within ``interval`` seconds of each other are
+	merged into one, retaining the latest expiry time; all those waiting are then written by a background thread using
+	a single request per backend, at process exit, or when ``flush`` is called.  Marks refreshing values by threshold
+	use the ``Cache.REFRESH`` instance.  Refreshers no longer referenced are collected once their background thread
+	has been idle for ``IDLE`` seconds.
+	"""
+	
+	IDLE = 60.0  # Seconds the background thread waits without extensions to apply before exiting, until the next.
+	
+	def __init__(self, interval=1.0):
+		self.interval = interval
+		self.pending = {}  # (id(backend), identity): (backend, key, expires)
+		self.closed = False
+		self.thread = None
+		self._condition = Condition(Lock())
+		
+		_buffers.add(self)
+		
+		super(Refresher, self).__init__()
+	
+	def __repr__(self):
+		return 'Refresher({0} pending)'.format(len(self.pending))
+	
+	def touch(self, backend, key, expires):
+		"""Extend the expiry time of the value cached under the given key, in the given backend, to at least that given."""
+		
+		if self.closed:
+			return backend.touch(key, expires)
+		
+		token = (id(backend), key.identity)
+		
+		with self._condition:
+			entry = self.pending.get(token)
+			
+			if entry is None or entry[2] < expires:
+				self.pending[token] = (backend, key, expires)
+			
+			if len(self.pending) == 1:
+				self._condition.notify_all()
+			
+			if self.thread is None:
+				self.thread = Thread(target=self._run, name='Refresher')
+				self.thread.daemon = True
+				self.thread.start()
+	
+	def flush(self):
+		"""Apply all waiting extensions, returning the number applied."""
+		
+		with self._condition:
+			entries, self.pending = self.pending, {}
+		
+		backends = {}  # id(backend): (backend, [(key, expires), ...])
+		
+		for backend, key, expires in entries.values():
+			backends.setdefault(id(backend), (backend, []))[1].append((key, expires))
+		
+		for backend, batch in backends.values():
+			try:
+				if hasattr(backend, 'touch_many'):
+					backend.touch_many(batch)
+					continue
+				
+				for key, expires in batch:
+					backend.touch(key, expires)
+			
+			except Exception:
+				log.exception("Failed to extend the expiry of %d values in %r.", len(batch), backend)
+		
+		return len(entries)
+	
+	def close(self):
+		"""Stop the background thread, applying any extensions still waiting.  Further extensions are applied at once."""
+		
+		with self._condition:
+			self.closed = True
+			self._condition.notify_all()
+			thread = self.thread
+		
+		if thread is not None:
+			thread.join()
+		
+		self.flush()
+	
+	def _run(self):
+		condition = self._condition
+		
+		while True:
+			with condition:
+				if not self.pending and not self.closed:
+					condition.wait(self.IDLE)
+					
+					if not self.pending and not self.closed:  # Idle; the next extension starts another thread.
+						self.thread = None
+						return
+				
+				if self.closed:
+					return
+				
+				deadline = time() + self.interval
+				
+				while not self.closed:
+					remaining = deadline - time()
+					
+					if remaining <= 0:
+						break
+					
+					condition.wait(remaining)
+			
+			self.flush()
@@ -0,0 +1,325 @@
+# encoding: utf-8
+
+"""Per-prefix and global budgets on cached values, enforced by approximate least-recently-used eviction."""
+
+# ## Imports
+
+from __future__ import unicode_literals
+
+from atexit import register
+from datetime import datetime
+from threading import Lock, Condition, Thread
+from weakref import WeakSet
+
+from .base import Backend
+from ..local import sizeof
+from ..util import utcnow, time
+
+
+log = __import__('logging').getLogger(__name__)
+_bounded = WeakSet()  # The budgets to close at process exit, without keeping them alive until then.
+
+
+# ## Implementation
+
+class Quota(object):
+	"""A budget on the number of ``entries`` and total ``size``, in bytes, of stored values; either may be ``None``."""
+	
+	__slots__ = ('entries', 'size')
+	
+	def __init__(self, entries=None, size=None):
+		self.entries = entries
+		self.size = size
+	
+	def __repr__(self):
+		return 'Quota({0.entries}, {0.size})'.format(self)
+	
+	def __bool__(self):
+		return self.entries is not None or self.size is not None
+	
+	__nonzero__ = __bool__
+	
+	def excess(self, entries, size, ratio=1.0):
+		"""The number of values to evict given the current usage, estimating the entries to remove to free bytes.
+		
+		A ``ratio`` below one measures the excess over that fraction of the budget instead.
+		"""
+		
+		result = (entries - int(self.entries * ratio)) if self.entries is not None else 0
+		limit = self.size * ratio if self.size is not None else None
+		
+		if limit is not None and size is not None and size > limit and entries:
+			average = size / float(entries)
+			result = max(result, int((size - limit) / average + 0.999))
+		
+		return max(result, 0)
+
+
+class Bounded(Backend):
+	"""Enforce budgets on the values stored in another backend, evicting those least recently used.
+	
+	Budgets are given per prefix as a dictionary of ``Quota`` instances (or ``(entries, size)`` tuples), and overall
+	using ``entries`` and ``size``.  Usage is estimated incrementally as values are stored or deleted through this
+	backend, measured again after invalidation through it, and measured exactly using the wrapped backend by a
+	background thread every ``interval`` seconds, or as soon as an estimate exceeds its budget (at most once every
+	``flush`` seconds).  Values over budget are then evicted in the style of Redis' approximate LRU: ``sample``
+	candidates are drawn at random for each value to evict, and the least recently accessed of them removed.  Usage is
+	reduced to the ``low`` fraction of each budget exceeded, so that values stored thereafter do not immediately
+	exceed it again.
+	
+	Access times are recorded in-process as values are retrieved or stored, merged, and written to the wrapped backend
+	in bulk every ``flush`` seconds.  The wrapped backend must implement ``usage``, ``sample``, ``evict`` and
+	``access``, as do ``MemoryBackend``, ``MongoBackend`` and the ``Cache`` document class::
+	
+		Cache.BACKEND = Bounded(Cache, {'app.search': Quota(entries=10000)}, size=2 ** 30)
+	
+	Measuring usage in bytes requires MongoDB 4.4 or later, for ``$bsonSize``.  The background thread exits once it has
+	had nothing to do for ``IDLE`` seconds, until values are next retrieved or stored.
+	"""
+	
+	IDLE = 60.0  # Seconds the background thread waits without access times to write or budgets due before exiting.
+	
+	def __init__(self, backend, quotas=None, entries=None, size=None, sample=5, interval=60.0, flush=1.0,
+			low=0.9):
+		self.backend = backend
+		self.quotas = dict((prefix, quota if isinstance(quota, Quota) else Quota(*quota))
+				for prefix, quota in (quotas or {}).items())
+		self.total = Quota(entries, size)
+		self.sample = sample
+		self.low = low
+		self.interval = interval
+		self.flush_interval = flush
+		self.estimates = {}  # prefix (None for all values): [entries, size], as last measured, then adjusted
+		self.accesses = {}  # identity: (key, accessed)
+		self.closed = False
+		self.thread = None
+		self.due = False  # An estimate has exceeded its budget, requiring prompt enforcement.
+		self._condition = Condition(Lock())
+		self._enforce_lock = Lock()
+		
+		_bounded.add(self)
+		
+		super(Bounded, self).__init__()
+	
+	def __repr__(self):
+		return 'Bounded({0!r}, {1} quotas)'.format(self.backend, len(self.quotas) + bool(self.total))
+	
+	def _accessed(self, keys):
+		now = utcnow()
+		
+		with self._condition:
+			for key in keys:
+				self.accesses[key.identity] = (key, now)
+			
+			self._start()
+	
+	def _stored(self, entries):
+		due = False
+		
+		with self._condition:
+			for key, value, expires in entries:
+				self.accesses[key.identity] = (key, utcnow())
+				size = len(value) if isinstance(value, (bytes, bytearray)) else sizeof(value)
+				
+				for prefix, quota in ((key.prefix, self.quotas.get(key.prefix)), (None, self.total)):
+					if not quota:
+						continue
+					
+					estimate = self.estimates.setdefault(prefix, [0, 0])
+					estimate[0] += 1
+					estimate[1] += size
+					due = due or quota.excess(*estimate) > 0
+			
+			if due and not self.due:
+				self.due = True
+				self._condition.notify_all()
+			
+			self._start()
+	
+	def _start(self):
+		if self.thread is None and not self.closed:
+			self.thread = Thread(target=self._run, name='Bounded')
+			self.thread.daemon = True
+			self.thread.start()
+	
+	def get(self, key, refresh=None, detail=False):
+		result = self.backend.get(key, refresh, detail)
+		self._accessed([key])
+		return result
+	
+	def get_many(self, keys, detail=False):
+		keys = list(keys)
+		result = self.backend.get_many(keys, detail)
+		self._accessed([key for key in keys if key.identity in result])
+		return result
+	
+	def set(self, key, value, expires):
+		result = self.backend.set(key, value, expires)
+		self._stored([(key, value, expires)])
+		return result
+	
+	def set_many(self, entries):
+		entries = list(entries)
+		self.backend.set_many(entries)
+		self._stored(entries)
+	
+	def delete(self, key):
+		with self._condition:
+			self.accesses.pop(key.identity, None)
+			
+			for prefix in ((key.prefix, None) if key.prefix is not None else (None, )):
+				estimate = self.estimates.get(prefix)
+				
+				if estimate and estimate[0] > 0:  # The size of the value removed is unknown; assume the average.
+					estimate[1] -= estimate[1] // estimate[0]
+					estimate[0] -= 1
+		
+		self.backend.delete(key)
+	
+	def invalidate(self, key):
+		"""Remove values in bulk, measuring the usage of the affected budgets again, as their sizes are unknown."""
+		
+		removed = self.backend.invalidate(key)
+		
+		if removed != 0:
+			for prefix, quota in list(self.quotas.items()) + [(None, self.total)]:
+				if quota and prefix in self.estimates and (key.prefix is None or prefix in (None, key.prefix)):
+					self.measure(prefix, quota)
+		
+		return removed
+	
+	def touch(self, key, expires):
+		self.backend.touch(key, expires)
+	
+	def touch_many(self, entries):
+		self.backend.touch_many(entries)
+	
+	def lease(self, key, duration):
+		return self.backend.lease(key, duration)
+	
+	def release(self, key, token):
+		self.backend.release(key, token)
+	
+	def flush(self):
+		"""Write the access times recorded in-process to the wrapped backend, returning the number written."""
+		
+		with self._condition:
+			entries, self.accesses = self.accesses, {}
+		
+		if entries:
+			try:
+				self.backend.access(list(entries.values()))
+			except Exception:
+				log.exception("Failed to record the access times of %d values in %r.", len(entries), self.backend)
+		
+		return len(entries)
+	
+	def enforce(self):
+		"""Measure usage, evicting values from each prefix (then overall) over budget, returning the number evicted.
+		
+		Each round of a budget exceeded evicts the estimated excess over its ``low`` fraction, chosen from a random
+		sample, then measures usage again; up to three rounds are performed per budget, as values may be concurrently
+		stored or expire.
+		"""
+		
+		self.flush()
+		evicted = 0
+		
+		with self._enforce_lock:
+			with self._condition:
+				self.due = False
+			
+			for prefix, quota in list(self.quotas.items()) + [(None, self.total)]:
+				if not quota:
+					continue
+				
+				for attempt in range(3):
+					usage = self.measure(prefix, quota)
+					
+					if not quota.excess(*usage):
+						break
+					
+					evicted += self.evict(prefix, quota.excess(*usage, ratio=self.low))
+		
+		return evicted
+	
+	def measure(self, prefix, quota):
+		"""Measure the usage of a prefix (or of all values) exactly, replacing its estimate; see ``Backend.usage``."""
+		
+		entries, size = self.backend.usage(prefix, quota.size is not None)
+		
+		with self._condition:
+			self.estimates[prefix] = [entries, size or 0]
+		
+		return entries, size
+	
+	def evict(self, prefix, count):
+		"""Evict the ``count`` least recently accessed of a random sample of the values under a prefix (or all)."""
+		
+		candidates = self.backend.sample(prefix, count * self.sample)
+		candidates.sort(key=lambda candidate: (candidate[1] or datetime.min).replace(tzinfo=None))
+		
+		return self.backend.evict([handle for handle, accessed in candidates[:count]])
+	
+	def close(self):
+		"""Stop the background thread, writing any access times still waiting.  Call ``enforce`` to evict thereafter."""
+		
+		with self._condition:
+			self.closed = True
+			self._condition.notify_all()
+			thread = self.thread
+		
+		if thread is not None:
+			thread.join()
+		
+		self.flush()
+	
+	def _run(self):
+		condition = self._condition
+		deadline = time() + self.interval
+		enforced = None  # Prompt enforcement is limited to once per flush interval, as measuring usage is costly.
+		idle = time() + self.IDLE
+		
+		while True:
+			with condition:
+				now = time()
+				ready = deadline  # When usage is next to be measured.
+				
+				if self.due:
+					ready = min(ready, now if enforced is None else enforced + self.flush_interval)
+				
+				if not self.closed and ready > now:
+					condition.wait(min(self.flush_interval, ready - now))
+				
+				if self.closed:
+					return
+				
+				now = time()
+				
+				if self.accesses or self.due:
+					idle = now + self.IDLE
+				
+				elif now >= idle:  # Idle; the next retrieval or store starts another thread.
+					self.thread = None
+					return
+				
+				due = now >= deadline or (self.due and (enforced is None or now >= enforced + self.flush_interval))
+			
+			try:
+				if due:
+					enforced = time()
+					deadline = enforced + self.interval
+					self.enforce()
+				else:
+					self.flush()
+			
+			except Exception:
+				log.exception("Failed to enforce the budgets of %r.", self)
+
+
+@register
+def _close():
+	"""Stop the background threads of the budgets still in use at process exit, writing any access times waiting."""
+	
+	for bounded in list(_bounded):
+		bounded.close()
@@ -0,0 +1,218 @@
+# encoding: utf-8
+
+"""A process-local dictionary-backed storage backend, primarily useful for testing and single-process deployments."""
+
+# ## Imports
+
+from __future__ import unicode_literals
+
+from copy import deepcopy
+from random import sample as choose
+from threading import Lock
+
+from .base import Backend, matches, identify
+from ..exc import CacheMiss, CacheExpired
+from ..local import sizeof
+from ..tag import Generations
+from ..util import utcnow
+
+
+# ## Implementation
+
+class MemoryBackend(Backend):
+	"""Store cached values in a dictionary.
+	
+	Unlike the ``LocalCache`` tier this is unbounded; expired values are removed as they are encountered or when
+	``purge`` is called.  By default values are copied on the way in and out to mimic the isolation provided by a
+	real database, ensuring callers can not mutate the cached copy.
+	"""
+	
+	def __init__(self, copy=True):
+		self.copy = deepcopy if copy else (lambda value: value)
+		self.data = {}  # identity: (value, expires)
+		self.accessed = {}  # identity: the last access time recorded using ``access``
+		self._lock = Lock()
+		
+		super(MemoryBackend, self).__init__()
+	
+	def __repr__(self):
+		return 'MemoryBackend({0} entries)'.format(len(self.data))
+	
+	def get(self, key, refresh=None, detail=False):
+		identity = key.identity
+		
+		with self._lock:
+			try:
+				value, expires = self.data[identity]
+			except KeyError:
+				raise CacheMiss()
+			
+			if expires is not None and expires.replace(tzinfo=None) < utcnow():
+				del self.data[identity]
+				self.accessed.pop(identity, None)
+				raise CacheExpired()
+			
+			if refresh:
+				expires = refresh()
+				self.data[identity] = (value, expires)
+		
+		value = self.copy(value)
+		
+		return (value, expires) if detail else value
+	
+	def set(self, key, value, expires):
+		self.data[key.identity] = (self.copy(value), expires)
+		return value
+	
+	def set_many(self, entries):
+		entries = [(key.identity, (self.copy(value), expires)) for key, value, expires in entries]
+		
+		with self._lock:
+			self.data.update(entries)
+	
+	def delete(self, key):
+		with self._lock:
+			self.data.pop(key.identity, None)
+			self.accessed.pop(key.identity, None)
+	
+	def invalidate(self, key):
+		match = matches(key)
+		
+		with self._lock:
+			found = [identity for identity in self.data if match(identity)]
+			
+			for identity in found:
+				del self.data[identity]
+				self.accessed.pop(identity, None)
+		
+		return len(found)
+	
+	def get_many(self, keys, detail=False):
+		now = utcnow()
+		result = {}
+		
+		with self._lock:
+			for key in keys:
+				identity = key.identity
+				
+				try:
+					value, expires = self.data[identity]
+				except KeyError:
+					continue
+				
+				if expires is None or expires.replace(tzinfo=None) >= now:
+					result[identity] = (value, expires)
+		
+		for identity, (value, expires) in result.items():
+			value = self.copy(value)
+			result[identity] = (value, expires) if detail else value
+		
+		return result
+	
+	def touch(self, key, expires):
+		identity = key.identity
+		
+		with self._lock:
+			if identity in self.data:
+				self.data[identity] = (self.data[identity][0], expires)
+	
+	def touch_many(self, entries):
+		with self._lock:
+			for key, expires in entries:
+				entry = self.data.get(key.identity)
+				
+				if entry is None or entry[1] is None:
+					continue
+				
+				if entry[1].replace(tzinfo=None) < expires.replace(tzinfo=None):
+					self.data[key.identity] = (entry[0], expires)
+	
+	def usage(self, prefix=None, size=True):
+		with self._lock:
+			values = [entry[0] for identity, entry in self.data.items() if self._budgeted(identity, prefix)]
+		
+		if not size:
+			return len(values), None
+		
+		return len(values), sum(len(i) if isinstance(i, (bytes, bytearray)) else sizeof(i) for i in values)
+	
+	def sample(self, prefix, count):
+		with self._lock:
+			identities = [i for i in self.data if self._budgeted(i, prefix)]
+			
+			if len(identities) > count:
+				identities = choose(identities, count)
+			
+			return [(identity, self.accessed.get(identity)) for identity in identities]
+	
+	@staticmethod
+	def _budgeted(identity, prefix):
+		"""Tag generations are excluded from the budget on all values; evicting them would invalidate their values."""
+		
+		return identity[0] == prefix if prefix is not None else identity[0] != Generations.PREFIX
+	
+	def evict(self, handles):
+		removed = 0
+		
+		with self._lock:
+			for identity in handles:
+				self.accessed.pop(identity, None)
+				
+				if self.data.pop(identity, None) is not None:
+					removed += 1
+		
+		return removed
+	
+	def access(self, entries):
+		with self._lock:
+			for key, accessed in entries:
+				identity = key.identity
+				
+				if identity in self.data and (self.accessed.get(identity) or accessed) <= accessed:
+					self.accessed[identity] = accessed
+	
+	def scan(self, prefix=None, since=None, limit=None, keys=None):
+		now = utcnow()
+		
+		with self._lock:
+			if keys is None:
+				entries = list(self.data.items())
+			else:
+				entries = [(i, self.data[i]) for i in (identify(criteria) for criteria in keys) if i in self.data]
+			
+			accessed = dict(self.accessed) if since is not None else None
+		
+		produced = 0
+		
+		for identity, (value, expires) in entries:
+			if limit and produced >= limit:
+				break
+			
+			if prefix is not None and identity[0] != prefix:
+				continue
+			
+			if expires is not None and expires.replace(tzinfo=None) < now:
+				continue
+			
+			if since is not None and (accessed.get(identity) is None or accessed[identity] < since):
+				continue
+			
+			produced += 1
+			yield identity, self.copy(value), expires
+	
+	def purge(self):
+		"""Remove all expired values."""
+		
+		now = utcnow()
+		
+		with self._lock:
+			for identity in [i for i, (v, e) in self.data.items() if e is not None and e.replace(tzinfo=None) < now]:
+				del self.data[identity]
+				self.accessed.pop(identity, None)
+	
+	def clear(self):
+		"""Remove all values."""
+		
+		with self._lock:
+			self.data.clear()
+			self.accessed.clear()
@@ -0,0 +1,531 @@
+# encoding: utf-8
+
+"""A storage backend speaking to MongoDB through PyMongo directly."""
+
+# ## Imports
+
+from __future__ import unicode_literals
+
+from bson import BSON, ObjectId, SON
+from bson.binary import Binary
+from pymongo import WriteConcern, ReturnDocument, ReplaceOne, UpdateOne, UpdateMany
+from pymongo.errors import DuplicateKeyError, DocumentTooLarge
+
+from .base import Backend, identify
+from ..exc import CacheMiss, CacheExpired
+from ..canonical import canonical
+from ..codec import Serializer, decode
+from ..compat import str as bytes_
+from ..tag import Generations
+from ..util import sha256, utcnow, as_delta
+
+
+# ## Implementation
+
+class MongoBackend(Backend):
+	"""Store cached values in a MongoDB collection, bypassing MongoEngine query and document construction.
+	
+	Records use the same layout as the ``Cache`` document, so this backend and the ``Cache`` document class may be
+	used against the same collection interchangeably.  Writes are unacknowledged unless ``acknowledge`` is truthy.
+	
+	If ``compact`` is truthy records instead use the compact layout: the ``_id`` is a 16 byte binary digest of the
+	prefix, reference and hash of the key, which are stored alongside the value as the top-level ``p``, ``r`` and ``h``
+	fields, each only if present.  Only the prefix and reference are indexed, as invalidation requires; the ``_id``
+	index, which must fit in memory to serve lookups well, shrinks to a fraction of its former size.  The layouts are
+	not interchangeable; see ``marrow.cache.migrate`` to convert a collection between them.
+	
+	Expired records are not retrieved, so are indistinguishable from missing ones.  If ``distinguish`` is truthy, each
+	miss is followed by a projected check for the record, raising ``CacheExpired`` if it remains; ``Cache`` does so
+	while collecting statistics, to count expired values.
+	
+	Leases on generating values are recorded in a companion collection, named after the first with a ``.lease``
+	suffix.
+	
+	Binary values larger than ``CHUNK`` bytes, and other values too large to store as a single document (which are
+	pickled to permit this, and unpickled on retrieval), are split into chunks stored in a second companion collection
+	with a ``.chunk`` suffix.
+	Each chunk records the key and expiry time of the value it belongs to, so is culled by a TTL index alongside it.
+	Chunks are reassembled on retrieval, or may be iterated using ``stream``.
+	"""
+	
+	PROJECTION = {'_id': 0, 'e': 1, 'v': 1, 'c': 1, 'g': 1, 't': 1, 's': 1}
+	CHUNK = 1024 * 1024  # The size, in bytes, of each chunk of a chunked value, and the size beyond which to chunk.
+	BATCH = 8  # The number of chunks written or retrieved at a time.
+	SCAN = 1000  # The number of records retrieved at a time by ``scan``.
+	INVALIDATE = 1000  # The number of values removed at a time by ``invalidate``.
+	
+	def __init__(self, collection, acknowledge=False, compact=False, distinguish=False):
+		self.collection = collection
+		self.writer = collection if acknowledge else collection.with_options(write_concern=WriteConcern(w=0))
+		self.leases = collection.database[collection.name + '.lease']
+		self.chunks = collection.database[collection.name + '.chunk']
+		self.chunk_writer = self.chunks if acknowledge else self.chunks.with_options(write_concern=WriteConcern(w=0))
+		self.compact = bool(compact)
+		self.path = '' if compact else '_id.'  # The path to the fields of the key within a record.
+		self.distinguish = bool(distinguish)
+		
+		super(MongoBackend, self).__init__()
+	
+	def __repr__(self):
+		return 'MongoBackend({0}{1})'.format(self.collection.full_name, ', compact' if self.compact else '')
+	
+	def ensure_indexes(self):
+		"""Create the TTL indexes responsible for culling expired values, and those used to locate chunks and to
+		invalidate values by prefix or reference."""
+		
+		self.collection.create_index('e', expireAfterSeconds=0)
+		self.collection.create_index(self.path + 'p', sparse=self.compact)
+		self.collection.create_index(self.path + 'r', sparse=self.compact)
+		self.leases.create_index('e', expireAfterSeconds=0)
+		self.chunks.create_index('e', expireAfterSeconds=0)
+		self.chunks.create_index('_id.k')
+	
+	def locate(self, key):
+		"""The ``_id`` of the record holding the value of the given key."""
+		
+		criteria = key.to_mongo()
+		return compact(criteria) if self.compact else criteria
+	
+	def stored(self, criteria):
+		"""The ``_id`` of the record holding the value of a key given in its BSON-encoded form, and the fields of the
+		key stored alongside the value, if any."""
+		
+		return (compact(criteria), criteria) if self.compact else (criteria, None)
+	
+	def get(self, key, refresh=None, detail=False):
+		"""Retrieve a value using a single round trip.
+		
+		Expiry is checked on the server, so expired records are never transferred; when refreshing, it is also
+		extended atomically there.  An expired record is treated as a miss but left in place, to be replaced by the
+		next ``set`` or culled by the TTL index.
+		"""
+		
+		identifier = self.locate(key)
+		
+		if refresh:
+			record = self.collection.find_one_and_update(
+					{'_id': identifier, 'e': {'$gt': utcnow()}},
+					{'$set': {'e': refresh()}},
+					self.PROJECTION,
+					return_document = ReturnDocument.AFTER
+				)
+			
+			if record is None:
+				raise self.missed(identifier)
+			
+			if 'c' in record:
+				self.chunk_writer.update_many({'_id.k': identifier}, {'$set': {'e': record['e']}})
+		
+		else:
+			record = self.collection.find_one({'_id': identifier, 'e': {'$gt': utcnow()}}, self.PROJECTION)
+			
+			if record is None:
+				raise self.missed(identifier)
+		
+		value = self.assemble(identifier, record) if 'c' in record else record.get('v')
+		
+		return (value, record['e']) if detail else value
+	
+	def missed(self, identifier):
+		"""The exception to raise for a record not found unexpired; see ``distinguish``."""
+		
+		if self.distinguish and self.collection.find_one({'_id': identifier}, {'_id': 1}) is not None:
+			return CacheExpired()
+		
+		return CacheMiss()
+	
+	def stream(self, key):
+		"""Retrieve a binary value as an iterator of ``bytes``, without assembling the chunks of a chunked value.
+		
+		Raises ``CacheMiss`` if the value is absent or expired, or if a chunk is found missing during iteration.  Values
+		encoded by a codec, or pickled as too large to store as a single document, are streamed in their encoded form.
+		"""
+		
+		identifier = self.locate(key)
+		record = self.collection.find_one({'_id': identifier, 'e': {'$gt': utcnow()}}, self.PROJECTION)
+		
+		if record is None:
+			raise CacheMiss()
+		
+		if 'c' in record:
+			return self.parts(identifier, record)
+		
+		return iter((bytes(record['v']), ))
+	
+	def set(self, key, value, expires):
+		self.store(key.to_mongo(), value, expires)
+		return value
+	
+	def store(self, criteria, value, expires):
+		"""Store a value under the given BSON-encoded key, chunking it if required."""
+		
+		identifier, fields = self.stored(criteria)
+		
+		if isinstance(value, (bytes_, bytearray)) and len(value) > self.CHUNK:
+			return self.split(identifier, fields, value, expires)
+		
+		try:
+			self.writer.replace_one({'_id': identifier}, compose(identifier, fields, v=value, e=expires), upsert=True)
+		
+		except DocumentTooLarge:
+			self.split(identifier, fields, Serializer('pickle').encode(value), expires, True)
+	
+	def split(self, identifier, fields, value, expires, serialized=False):
+		"""Store a binary value as a series of chunks, followed by the record referencing them.
+		
+		Each write of a value uses a distinct generation identifier, ensuring readers never assemble chunks of
+		differing values.  Chunks of prior generations are then removed.  Chunks of compact records note the prefix,
+		if any, of the value they belong to.
+		"""
+		
+		generation, batches, document = self.divide(identifier, fields, value, expires, serialized)
+		
+		for batch in batches:
+			self.chunks.insert_many(batch, ordered=False)
+		
+		self.writer.replace_one({'_id': identifier}, document, upsert=True)
+		self.chunk_writer.delete_many({'_id.k': identifier, '_id.g': {'$ne': generation}})
+	
+	def divide(self, identifier, fields, value, expires, serialized=False):
+		"""Divide a binary value into chunks, without storing them; see ``split``.
+		
+		Returns a ``(generation, batches, document)`` tuple: the generation identifier of the chunks, an iterator of
+		lists of at most ``BATCH`` chunks to insert, and the record referencing them.
+		"""
+		
+		size = self.CHUNK
+		count = (len(value) + size - 1) // size
+		generation = ObjectId()
+		view = memoryview(value)
+		prefix = {'p': fields['p']} if fields and 'p' in fields else None
+		
+		batches = ([compose(chunk(identifier, generation, j), prefix,
+				d = Binary(view[j * size:(j + 1) * size].tobytes()),
+				e = expires
+			) for j in range(i, min(i + self.BATCH, count))] for i in range(0, count, self.BATCH))
+		
+		document = compose(identifier, fields, e=expires, c=count, g=generation, t=getattr(value, 'subtype', 0))
+		
+		if serialized:  # Pickled by this backend, rather than by a mark, so decoded again on retrieval.
+			document['s'] = True
+		
+		return generation, batches, document
+	
+	def parts(self, identifier, record):
+		"""Iterate the chunks of a chunked value, retrieving a batch at a time."""
+		
+		for indexes, query in self.batches(identifier, record):
+			found = dict((part['_id']['i'], part['d']) for part in self.chunks.find(query, {'e': 0}))
+			
+			for j in indexes:
+				try:
+					yield bytes(found.pop(j))
+				except KeyError:
+					raise CacheMiss()
+	
+	def batches(self, identifier, record):
+		"""Iterate the indexes of the chunks of a chunked value, ``BATCH`` at a time, with the query selecting them."""
+		
+		count, generation = record['c'], record['g']
+		
+		for i in range(0, count, self.BATCH):
+			indexes = range(i, min(i + self.BATCH, count))
+			yield indexes, {'_id': {'$in': [chunk(identifier, generation, j) for j in indexes]}}
+	
+	def assemble(self, identifier, record):
+		"""Reassemble a chunked value."""
+		
+		return joined(record, self.parts(identifier, record))
+	
+	def set_many(self, entries):
+		self.store_many((key.to_mongo(), value, expires) for key, value, expires in entries)
+	
+	def store_many(self, entries):
+		"""Store many ``(criteria, value, expires)`` entries using a single unordered bulk write.
+		
+		Each is an upserting replacement rather than an insert, as expired records may linger until culled.  Values
+		requiring chunking are stored individually.
+		"""
+		
+		oversized, requests, pending = self.prepare(entries)
+		
+		for entry in oversized:
+			self.split(*entry)
+		
+		if not requests:
+			return
+		
+		try:
+			self.writer.bulk_write(requests, ordered=False)
+		
+		except DocumentTooLarge:
+			for criteria, value, expires in pending:
+				self.store(criteria, value, expires)
+	
+	def prepare(self, entries):
+		"""Divide many ``(criteria, value, expires)`` entries into those requiring chunking and those stored whole.
+		
+		Returns an ``(oversized, requests, pending)`` tuple: the ``split`` arguments of each value requiring chunking,
+		the upserting replacements storing the others, and the entries those replacements store.
+		"""
+		
+		oversized = []
+		requests = []
+		pending = []
+		
+		for criteria, value, expires in entries:
+			identifier, fields = self.stored(criteria)
+			
+			if isinstance(value, (bytes_, bytearray)) and len(value) > self.CHUNK:
+				oversized.append((identifier, fields, value, expires))
+				continue
+			
+			requests.append(ReplaceOne({'_id': identifier}, compose(identifier, fields, v=value, e=expires), upsert=True))
+			pending.append((criteria, value, expires))
+		
+		return oversized, requests, pending
+	
+	def delete(self, key):
+		identifier = self.locate(key)
+		self.writer.delete_one({'_id': identifier})
+		self.chunk_writer.delete_many({'_id.k': identifier})
+	
+	def invalidate(self, key):
+		"""Remove all values whose keys share the prefix and reference (where not ``None``) of the given key.
+		
+		Values are removed in batches of ``INVALIDATE``, each located using an index and removed by ``_id``, so that
+		clearing a large number of values neither scans the collection nor holds locks for an extended period.  Returns
+		the number of values removed.
+		"""
+		
+		query = invalidation(key, self.path)
+		removed = 0
+		
+		while True:
+			batch = [i['_id'] for i in self.collection.find(query, {'_id': 1}, limit=self.INVALIDATE)]
+			
+			if not batch:
+				break
+			
+			removed += self.collection.delete_many({'_id': {'$in': batch}}).deleted_count
+			self.chunk_writer.delete_many({'_id.k': {'$in': batch}})
+			
+			if len(batch) < self.INVALIDATE:
+				break
+		
+		return removed
+	
+	def get_many(self, keys, detail=False):
+		identifiers, known = self.indexed(keys)
+		cursor = self.collection.find({'_id': {'$in': identifiers}, 'e': {'$gt': utcnow()}})
+		result = {}
+		
+		for record in cursor:
+			identity = known(record['_id'])
+			
+			if identity is None:  # pragma: no cover
+				continue
+			
+			if 'c' in record:
+				try:
+					value = self.assemble(record['_id'], record)
+				except CacheMiss:
+					continue
+			
+			else:
+				value = record.get('v')
+			
+			result[identity] = (value, record['e']) if detail else value
+		
+		return result
+	
+	def indexed(self, keys):
+		"""The identifiers of the records holding the values of many keys, and a callable returning the ``identity``
+		of the key of a retrieved record from its identifier, or ``None`` if not among them."""
+		
+		keys = list(keys)
+		identifiers = [self.locate(key) for key in keys]
+		encode = bytes if self.compact else BSON.encode  # Identifiers as returned may not be hashable, or equal.
+		index = dict((encode(i), key.identity) for i, key in zip(identifiers, keys))
+		
+		return identifiers, lambda identifier: index.get(encode(identifier))
+	
+	def touch(self, key, expires):
+		identifier = self.locate(key)
+		self.writer.update_one({'_id': identifier}, {'$set': {'e': expires}})
+		self.chunk_writer.update_many({'_id.k': identifier}, {'$set': {'e': expires}})
+	
+	def touch_many(self, entries):
+		"""Extend the expiry times of many values, and of their chunks, using a single unordered bulk write each.
+		
+		Expiry times are updated using ``$max``, leaving those already later unchanged.
+		"""
+		
+		entries = [(self.locate(key), expires) for key, expires in entries]
+		
+		if not entries:
+			return
+		
+		self.writer.bulk_write([UpdateOne({'_id': identifier}, {'$max': {'e': expires}})
+				for identifier, expires in entries], ordered=False)
+		self.chunk_writer.bulk_write([UpdateMany({'_id.k': identifier}, {'$max': {'e': expires}})
+				for identifier, expires in entries], ordered=False)
+	
+	def usage(self, prefix=None, size=True):
+		"""Measure the values stored under a prefix, or in total; sizes include chunks, and require MongoDB 4.4."""
+		
+		match = {self.path + 'p': {'$ne': Generations.PREFIX} if prefix is None else prefix}
+		
+		if not size:
+			return self.collection.count_documents(match), None
+		
+		measure = {'$group': {'_id': None, 'n': {'$sum': 1}, 's': {'$sum': {'$bsonSize': '$$ROOT'}}}}
+		records = list(self.collection.aggregate([{'$match': match}, measure]))
+		chunks = list(self.chunks.aggregate(([{'$match': {'p' if self.compact else '_id.k.p': prefix}}]
+				if prefix is not None else []) + [measure]))  # Tag generations are never chunked.
+		
+		entries, total = (records[0]['n'], records[0]['s']) if records else (0, 0)
+		
+		return entries, total + (chunks[0]['s'] if chunks else 0)
+	
+	def sample(self, prefix, count):
+		"""Sample records on the server using ``$sample``; the handles are their identifiers."""
+		
+		match = {self.path + 'p': {'$ne': Generations.PREFIX} if prefix is None else prefix}
+		pipeline = [{'$match': match}, {'$sample': {'size': count}}, {'$project': {'a': 1}}]
+		
+		return [(record['_id'], record.get('a')) for record in self.collection.aggregate(pipeline)]
+	
+	def evict(self, handles):
+		if not handles:
+			return 0
+		
+		removed = self.collection.delete_many({'_id': {'$in': handles}}).deleted_count
+		self.chunk_writer.delete_many({'_id.k': {'$in': handles}})
+		
+		return removed
+	
+	def access(self, entries):
+		"""Record last access times, as the ``a`` field of each record, using an unordered bulk ``$max`` update."""
+		
+		requests = [UpdateOne({'_id': self.locate(key)}, {'$max': {'a': accessed}}) for key, accessed in entries]
+		
+		if requests:
+			self.writer.bulk_write(requests, ordered=False)
+	
+	def scan(self, prefix=None, since=None, limit=None, keys=None):
+		"""Stream unexpired records using a cursor retrieving ``SCAN`` at a time; chunked values are skipped."""
+		
+		query = {'e': {'$gt': utcnow()}, 'c': {'$exists': False}}
+		projection = {'v': 1, 'e': 1, 'p': 1, 'r': 1, 'h': 1} if self.compact else {'v': 1, 'e': 1}
+		
+		if prefix is not None:
+			query[self.path + 'p'] = prefix
+		
+		if since is not None:
+			query['a'] = {'$gte': since}
+		
+		if keys is None:
+			batches = [None]
+		else:
+			keys = [compact(i) for i in keys] if self.compact else list(keys)
+			batches = [keys[i:i + self.SCAN] for i in range(0, len(keys), self.SCAN)]
+		
+		produced = 0
+		
+		for batch in batches:
+			if batch is not None:
+				query['_id'] = {'$in': batch}
+			
+			cursor = self.collection.find(query, projection, batch_size=self.SCAN,
+					limit=(limit - produced) if limit else 0)
+			
+			for document in cursor:
+				produced += 1
+				yield identify(document if self.compact else document['_id']), document.get('v'), document['e']
+			
+			if limit and produced >= limit:
+				break
+	
+	def lease(self, key, duration):
+		"""Acquire a lease in a single round trip, by upserting over any existing lease that has already expired.
+		
+		If an unexpired lease exists the upsert attempts an insert, which fails as the key is already present.
+		"""
+		
+		token = ObjectId()
+		now = utcnow()
+		
+		try:
+			self.leases.update_one(
+					{'_id': self.locate(key), 'e': {'$lt': now}},
+					{'$set': {'e': now + as_delta(duration), 'o': token}},
+					upsert = True
+				)
+		
+		except DuplicateKeyError:
+			return None
+		
+		return token
+	
+	def release(self, key, token):
+		self.leases.with_options(write_concern=WriteConcern(w=0)).delete_one({'_id': self.locate(key), 'o': token})
+
+
+# ## Utility Functions
+
+def invalidation(key, path='_id.'):
+	"""Produce the query selecting all values whose keys share the populated fields of the given key.
+	
+	The fields of keys are found beneath ``_id``, or at the top level of compact records given an empty ``path``.
+	"""
+	
+	criteria = dict((path + field, value) for field, value in key.to_mongo().items() if field != 'h')
+	
+	if not criteria:
+		raise ValueError("Refusing to invalidate every value; a prefix or reference is required.")
+	
+	return criteria
+
+
+def chunk(identifier, generation, index):
+	"""The identifier of a chunk of a chunked value."""
+	
+	return SON([('k', identifier), ('g', generation), ('i', index)])
+
+
+def joined(record, parts):
+	"""The value of a chunked record, given the ``bytes`` of its chunks; decoded if pickled by the backend."""
+	
+	data = b''.join(parts)
+	value = Binary(data, record['t']) if record.get('t') else data
+	
+	return decode(value) if record.get('s') else value
+
+
+def compact(criteria):
+	"""The compact identifier of a key given in its BSON-encoded form: the leading 16 bytes of a SHA-256 digest.
+	
+	The digest is of the canonical encoding of its ``identity``, and so is identical for a key as constructed and as
+	retrieved.  That encoding is tagged by type, distinguishing an absent prefix from an empty one, and a primary key
+	of ``1`` from one of ``"1"``.
+	"""
+	
+	return Binary(sha256(canonical(identify(criteria))).digest()[:16])
+
+
+def expand(stored):
+	"""The BSON-encoded form of the key of a compact record, from the fields stored alongside its value."""
+	
+	return SON((field, stored[field]) for field in ('p', 'r', 'h') if field in stored)
+
+
+def compose(identifier, fields, **values):
+	"""A record stored under the given identifier, including any fields of its key stored alongside the values."""
+	
+	values['_id'] = identifier
+	
+	if fields:
+		values.update(fields)
+	
+	return values
@@ -0,0 +1,242 @@
+# encoding: utf-8
+
+"""An asynchronous storage backend speaking to MongoDB through Motor."""
+
+# ## Imports
+
+from __future__ import unicode_literals
+
+from bson import ObjectId
+from pymongo import WriteConcern, ReturnDocument, UpdateOne, UpdateMany
+from pymongo.errors import DuplicateKeyError, DocumentTooLarge
+
+from .aio import AsyncBackend
+from .mongo import MongoBackend, compose, invalidation, joined
+from ..exc import CacheMiss, CacheExpired
+from ..codec import Serializer
+from ..compat import str as bytes_
+from ..util import utcnow, as_delta
+
+
+# ## Implementation
+
+class MotorBackend(AsyncBackend):
+	"""Store cached values in a MongoDB collection accessed through an ``AsyncIOMotorCollection``.
+	
+	This is the asynchronous counterpart to ``MongoBackend``, using the same record layout (and so interchangeable with
+	it and with the ``Cache`` document class), or the same compact layout if ``compact`` is truthy, and the same approach
+	to each operation, including the chunking of large values.  Everything not requiring a round trip is borrowed from
+	``MongoBackend``, leaving only the awaiting of the collection here.  Motor itself is not a requirement of this package;
+	construct the collection yourself::
+	
+		from motor.motor_asyncio import AsyncIOMotorClient
+		
+		backend = MotorBackend(AsyncIOMotorClient().test.cache)
+	"""
+	
+	PROJECTION = MongoBackend.PROJECTION
+	CHUNK = MongoBackend.CHUNK
+	BATCH = MongoBackend.BATCH
+	INVALIDATE = MongoBackend.INVALIDATE
+	
+	locate = MongoBackend.locate
+	stored = MongoBackend.stored
+	divide = MongoBackend.divide
+	batches = MongoBackend.batches
+	prepare = MongoBackend.prepare
+	indexed = MongoBackend.indexed
+	
+	def __init__(self, collection, acknowledge=False, compact=False, distinguish=False):
+		self.collection = collection
+		self.writer = collection if acknowledge else collection.with_options(write_concern=WriteConcern(w=0))
+		self.leases = collection.database[collection.name + '.lease']
+		self.chunks = collection.database[collection.name + '.chunk']
+		self.chunk_writer = self.chunks if acknowledge else self.chunks.with_options(write_concern=WriteConcern(w=0))
+		self.compact = bool(compact)
+		self.path = '' if compact else '_id.'
+		self.distinguish = bool(distinguish)
+		
+		super(MotorBackend, self).__init__()
+	
+	def __repr__(self):
+		return 'MotorBackend({0}{1})'.format(self.collection.full_name, ', compact' if self.compact else '')
+	
+	async def ensure_indexes(self):
+		"""Create the TTL indexes responsible for culling expired values, and those used to locate chunks and to
+		invalidate values by prefix or reference."""
+		
+		await self.collection.create_index('e', expireAfterSeconds=0)
+		await self.collection.create_index(self.path + 'p', sparse=self.compact)
+		await self.collection.create_index(self.path + 'r', sparse=self.compact)
+		await self.leases.create_index('e', expireAfterSeconds=0)
+		await self.chunks.create_index('e', expireAfterSeconds=0)
+		await self.chunks.create_index('_id.k')
+	
+	async def get(self, key, refresh=None, detail=False):
+		identifier = self.locate(key)
+		
+		if refresh:
+			record = await self.collection.find_one_and_update(
+					{'_id': identifier, 'e': {'$gt': utcnow()}},
+					{'$set': {'e': refresh()}},
+					self.PROJECTION,
+					return_document = ReturnDocument.AFTER
+				)
+			
+			if record is None:
+				raise await self.missed(identifier)
+			
+			if 'c' in record:
+				await self.chunk_writer.update_many({'_id.k': identifier}, {'$set': {'e': record['e']}})
+		
+		else:
+			record = await self.collection.find_one({'_id': identifier, 'e': {'$gt': utcnow()}}, self.PROJECTION)
+			
+			if record is None:
+				raise await self.missed(identifier)
+		
+		value = (await self.assemble(identifier, record)) if 'c' in record else record.get('v')
+		
+		return (value, record['e']) if detail else value
+	
+	async def missed(self, identifier):
+		if self.distinguish and (await self.collection.find_one({'_id': identifier}, {'_id': 1})) is not None:
+			return CacheExpired()
+		
+		return CacheMiss()
+	
+	async def set(self, key, value, expires):
+		await self.store(key.to_mongo(), value, expires)
+		return value
+	
+	async def store(self, criteria, value, expires):
+		identifier, fields = self.stored(criteria)
+		
+		if isinstance(value, (bytes_, bytearray)) and len(value) > self.CHUNK:
+			return await self.split(identifier, fields, value, expires)
+		
+		try:
+			await self.writer.replace_one({'_id': identifier}, compose(identifier, fields, v=value, e=expires),
+					upsert=True)
+		
+		except DocumentTooLarge:
+			await self.split(identifier, fields, Serializer('pickle').encode(value), expires, True)
+	
+	async def split(self, identifier, fields, value, expires, serialized=False):
+		generation, batches, document = self.divide(identifier, fields, value, expires, serialized)
+		
+		for batch in batches:
+			await self.chunks.insert_many(batch, ordered=False)
+		
+		await self.writer.replace_one({'_id': identifier}, document, upsert=True)
+		await self.chunk_writer.delete_many({'_id.k': identifier, '_id.g': {'$ne': generation}})
+	
+	async def assemble(self, identifier, record):
+		parts = []
+		
+		for indexes, query in self.batches(identifier, record):
+			found = dict([(part['_id']['i'], part['d']) async for part in self.chunks.find(query, {'e': 0})])
+			
+			try:
+				parts.extend(bytes(found.pop(j)) for j in indexes)
+			except KeyError:
+				raise CacheMiss()
+		
+		return joined(record, parts)
+	
+	async def delete(self, key):
+		identifier = self.locate(key)
+		await self.writer.delete_one({'_id': identifier})
+		await self.chunk_writer.delete_many({'_id.k': identifier})
+	
+	async def set_many(self, entries):
+		oversized, requests, pending = self.prepare((key.to_mongo(), value, expires) for key, value, expires in entries)
+		
+		for entry in oversized:
+			await self.split(*entry)
+		
+		if not requests:
+			return
+		
+		try:
+			await self.writer.bulk_write(requests, ordered=False)
+		
+		except DocumentTooLarge:
+			for criteria, value, expires in pending:
+				await self.store(criteria, value, expires)
+	
+	async def invalidate(self, key):
+		query = invalidation(key, self.path)
+		removed = 0
+		
+		while True:
+			batch = [i['_id'] async for i in self.collection.find(query, {'_id': 1}, limit=self.INVALIDATE)]
+			
+			if not batch:
+				break
+			
+			removed += (await self.collection.delete_many({'_id': {'$in': batch}})).deleted_count
+			await self.chunk_writer.delete_many({'_id.k': {'$in': batch}})
+			
+			if len(batch) < self.INVALIDATE:
+				break
+		
+		return removed
+	
+	async def get_many(self, keys, detail=False):
+		identifiers, known = self.indexed(keys)
+		result = {}
+		
+		async for record in self.collection.find({'_id': {'$in': identifiers}, 'e': {'$gt': utcnow()}}):
+			identity = known(record['_id'])
+			
+			if identity is None:  # pragma: no cover
+				continue
+			
+			if 'c' in record:
+				try:
+					value = await self.assemble(record['_id'], record)
+				except CacheMiss:
+					continue
+			
+			else:
+				value = record.get('v')
+			
+			result[identity] = (value, record['e']) if detail else value
+		
+		return result
+	
+	async def touch(self, key, expires):
+		identifier = self.locate(key)
+		await self.writer.update_one({'_id': identifier}, {'$set': {'e': expires}})
+		await self.chunk_writer.update_many({'_id.k': identifier}, {'$set': {'e': expires}})
+	
+	async def touch_many(self, entries):
+		entries = [(self.locate(key), expires) for key, expires in entries]
+		
+		if not entries:
+			return
+		
+		await self.writer.bulk_write([UpdateOne({'_id': identifier}, {'$max': {'e': expires}})
+				for identifier, expires in entries], ordered=False)
+		await self.chunk_writer.bulk_write([UpdateMany({'_id.k': identifier}, {'$max': {'e': expires}})
+				for identifier, expires in entries], ordered=False)
+	
+	async def lease(self, key, duration):
+		token = ObjectId()
+		now = utcnow()
+		
+		try:
+			await self.leases.update_one(
+					{'_id': self.locate(key), 'e': {'$lt': now}},
+					{'$set': {'e': now + as_delta(duration), 'o': token}},
+					upsert = True
+				)
+		
+		except DuplicateKeyError:
+			return None
+		
+		return token
+	
+	async def release(self, key, token):
+		await self.leases.with_options(write_concern=WriteConcern(w=0)).delete_one({'_id': self.locate(key), 'o': token})
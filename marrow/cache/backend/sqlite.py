@@ -0,0 +1,186 @@
+# encoding: utf-8
+
+"""A storage backend persisting cached values to a local SQLite database."""
+
+# ## Imports
+
+from __future__ import unicode_literals
+
+import sqlite3
+
+from uuid import uuid4
+from calendar import timegm
+from threading import Lock
+
+try:
+	import cPickle as pickle
+except ImportError:  # pragma: no cover
+	import pickle
+
+from .base import Backend, textual
+from ..exc import CacheMiss, CacheExpired
+from ..util import utcnow, as_delta, datetime
+
+
+# ## Utility Functions
+
+def timestamp(value):
+	"""Convert a naive UTC (or timezone-aware) datetime into a POSIX timestamp."""
+	
+	return timegm(value.utctimetuple()) + value.microsecond / 1000000.0
+
+
+# ## Implementation
+
+class SQLiteBackend(Backend):
+	"""Store pickled values in a SQLite database, suitable for sharing a cache between processes on a single host.
+	
+	A single connection is shared between threads and serialized by a lock; file-backed databases use write-ahead
+	logging so that readers in other processes are not blocked by writers.  Expired rows are removed as they are
+	encountered or when ``purge`` is called.
+	"""
+	
+	INVALIDATE = 1000  # The number of rows removed at a time by ``invalidate``.
+	
+	def __init__(self, path=':memory:', table='cache', timeout=5.0):
+		self.path = path
+		self.table = table
+		self.connection = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+		self._lock = Lock()
+		
+		if path != ':memory:':
+			self.connection.execute('PRAGMA journal_mode=WAL')
+		
+		self.connection.execute('CREATE TABLE IF NOT EXISTS "{0}" (k TEXT PRIMARY KEY, v BLOB, e REAL)'.format(table))
+		self.connection.execute('CREATE INDEX IF NOT EXISTS "{0}_expires" ON "{0}" (e)'.format(table))
+		self.connection.execute('CREATE TABLE IF NOT EXISTS "{0}_lease" (k TEXT PRIMARY KEY, o TEXT, e REAL)'.format(table))
+		
+		super(SQLiteBackend, self).__init__()
+	
+	def __repr__(self):
+		return 'SQLiteBackend({0}, {1})'.format(self.path, self.table)
+	
+	def _execute(self, query, *args):
+		with self._lock:
+			return self.connection.execute(query.format(self.table), args).fetchall()
+	
+	def get(self, key, refresh=None, detail=False):
+		k = textual(key)
+		now = timestamp(utcnow())
+		result = self._execute('SELECT v, e FROM "{0}" WHERE k = ?', k)
+		
+		if not result:
+			raise CacheMiss()
+		
+		value, expires = result[0]
+		
+		if expires < now:
+			self._execute('DELETE FROM "{0}" WHERE k = ? AND e < ?', k, now)
+			raise CacheExpired()
+		
+		if refresh:
+			expires = refresh()
+			self._execute('UPDATE "{0}" SET e = ? WHERE k = ?', timestamp(expires), k)
+		
+		else:
+			expires = datetime.utcfromtimestamp(expires)
+		
+		value = pickle.loads(bytes(value))
+		
+		return (value, expires) if detail else value
+	
+	def set(self, key, value, expires):
+		data = sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+		self._execute('INSERT OR REPLACE INTO "{0}" (k, v, e) VALUES (?, ?, ?)', textual(key), data, timestamp(expires))
+		return value
+	
+	def set_many(self, entries):
+		rows = [(textual(key), sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)), timestamp(expires))
+				for key, value, expires in entries]
+		
+		with self._lock:
+			with self.connection:  # A single transaction.
+				self.connection.executemany('INSERT OR REPLACE INTO "{0}" (k, v, e) VALUES (?, ?, ?)'.format(self.table),
+						rows)
+	
+	def delete(self, key):
+		self._execute('DELETE FROM "{0}" WHERE k = ?', textual(key))
+	
+	def invalidate(self, key):
+		"""Remove all values whose keys share the prefix and reference (where not ``None``) of the given key.
+		
+		Keys sharing a prefix are located using a range of the primary key; rows are removed in batches, so as not to
+		hold the write lock for an extended period.  Returns the number of values removed.
+		"""
+		
+		prefix, reference, hash = textual(key).split('\0')
+		
+		if key.prefix is not None:  # Keys sort by prefix, then reference: select the range sharing the leading part.
+			start = prefix + '\0' + ((reference + '\0') if key.reference is not None else '')
+			where, args = 'k >= ? AND k < ?', (start, start[:-1] + '\x01')
+		
+		elif key.reference is not None:
+			where, args = 'instr(k, ?) > 0', ('\0' + reference + '\0', )
+		
+		else:
+			raise ValueError("Refusing to invalidate every value; a prefix or reference is required.")
+		
+		query = 'DELETE FROM "{0}" WHERE rowid IN (SELECT rowid FROM "{0}" WHERE ' + where + ' LIMIT ' + \
+				str(self.INVALIDATE) + ')'
+		removed = 0
+		
+		while True:
+			with self._lock:
+				count = self.connection.execute(query.format(self.table), args).rowcount
+			
+			removed += count
+			
+			if count < self.INVALIDATE:
+				return removed
+	
+	def get_many(self, keys, detail=False):
+		index = dict((textual(key), key.identity) for key in keys)
+		names = list(index)
+		now = timestamp(utcnow())
+		result = {}
+		
+		for i in range(0, len(names), 500):  # Remain well within SQLite's bound parameter limit.
+			chunk = names[i:i + 500]
+			query = 'SELECT k, v, e FROM "{0}" WHERE e >= ? AND k IN (' + ', '.join('?' * len(chunk)) + ')'
+			
+			for k, value, expires in self._execute(query, now, *chunk):
+				value = pickle.loads(bytes(value))
+				result[index[k]] = (value, datetime.utcfromtimestamp(expires)) if detail else value
+		
+		return result
+	
+	def touch(self, key, expires):
+		self._execute('UPDATE "{0}" SET e = ? WHERE k = ?', timestamp(expires), textual(key))
+	
+	def touch_many(self, entries):
+		with self._lock:
+			self.connection.executemany('UPDATE "{0}" SET e = max(e, ?) WHERE k = ?'.format(self.table),
+					[(timestamp(expires), textual(key)) for key, expires in entries])
+	
+	def lease(self, key, duration):
+		k = textual(key)
+		now = utcnow()
+		token = uuid4().hex
+		
+		with self._lock:
+			self.connection.execute('DELETE FROM "{0}_lease" WHERE k = ? AND e < ?'.format(self.table), (k, timestamp(now)))
+			cursor = self.connection.execute('INSERT OR IGNORE INTO "{0}_lease" (k, o, e) VALUES (?, ?, ?)'.format(
+					self.table), (k, token, timestamp(now + as_delta(duration))))
+			
+			return token if cursor.rowcount == 1 else None
+	
+	def release(self, key, token):
+		self._execute('DELETE FROM "{0}_lease" WHERE k = ? AND o = ?', textual(key), token)
+	
+	def purge(self):
+		"""Remove all expired values."""
+		
+		self._execute('DELETE FROM "{0}" WHERE e < ?', timestamp(utcnow()))
+	
+	def close(self):
+		self.connection.close()
@@ -0,0 +1,443 @@
+# encoding: utf-8
+
+"""A reproducible benchmark suite, producing machine-readable results suitable for comparison between releases.
+
+Run offline against an in-memory stand-in for MongoDB, or against a real server by passing a connection URI::
+
+	python -m marrow.cache.benchmark --output results.json
+	python -m marrow.cache.benchmark --mongo mongodb://localhost/test --output results.json
+
+Compare against the results of a previous run, exiting with a non-zero status if any benchmark has slowed by more
+than the given fraction::
+
+	python -m marrow.cache.benchmark --compare baseline.json --threshold 0.1
+
+Some benchmarks are given a budget: the overhead, in seconds per call, permitted above that of calling the undecorated
+function (``call.bare``).  Check the overhead measured against these, exiting with a non-zero status if any is over,
+optionally scaling the budgets by a factor for slower hardware::
+
+	python -m marrow.cache.benchmark --budget
+	python -m marrow.cache.benchmark --budget 2
+
+Each benchmark reports the time taken per operation, in seconds: the ``best`` of several repetitions (the figure
+compared), along with the ``median`` and ``mean``.  Results of runs against different backends, or on different
+hardware, are not comparable.
+"""
+
+# ## Imports
+
+from __future__ import unicode_literals, print_function
+
+import sys
+import json
+import platform
+
+from argparse import ArgumentParser
+from datetime import datetime
+from functools import partial
+from itertools import count
+from timeit import Timer, default_timer
+
+from bson import ObjectId
+from mongoengine import Document, StringField
+
+from .release import version
+from .model import Cache, Key
+from .local import LocalCache
+from .backend import MemoryBackend
+from .util import OrderedDict, Thread
+
+
+# ## Benchmark Registry
+
+BENCHMARKS = OrderedDict()  # name: (factory, threads)
+BUDGETS = OrderedDict()  # name: the overhead permitted, in seconds per call, above that of call.bare
+BASELINE = 'call.bare'
+
+
+def benchmark(name, threads=None, budget=None):
+	"""Register a benchmark.  The decorated factory is called once and returns the zero-argument callable to time.
+	
+	Benchmarks given a number of ``threads`` time that many threads making calls concurrently.  Those given a
+	``budget`` are checked against it by ``overhead``.
+	"""
+	
+	def decorator(fn):
+		BENCHMARKS[name] = (fn, threads)
+		
+		if budget is not None:
+			BUDGETS[name] = budget
+		
+		return fn
+	
+	return decorator
+
+
+# ## Fixtures
+
+WHEN = datetime(2016, 1, 1, 12, 30)  # Fixed values, that keys remain identical from run to run.
+OID = ObjectId('5680b0c6e4b0a1b2c3d4e5f6')
+
+SHAPES = OrderedDict((
+		('scalar', ((42, ), {})),
+		('strings', (('user', 'en-CA', 'page-12'), {})),
+		('mixed', ((OID, WHEN, {'sort': ['-created', 'title'], 'limit': 25, 'filters': {'tag': ['a', 'b']}}),
+				{'page': 2, 'deleted': False})),
+	))
+
+
+class _BenchmarkPost(Document):
+	"""Named so as not to displace an application's own ``Post`` within MongoEngine's registry of document classes."""
+	
+	meta = dict(collection='benchmark_post', allow_inheritance=False)
+	
+	title = StringField()
+	
+	@Cache.method('title', minutes=5)
+	def summary(self, length):
+		return self.title[:length]
+	
+	def plain(self, length):
+		return self.title[:length]
+
+
+def post():
+	"""An instance treated as saved, without requiring a database."""
+	
+	result = _BenchmarkPost(id=OID, title="A reasonably representative title.")
+	result._created = False
+	return result
+
+
+def memoized(**kw):
+	@Cache.memoize(prefix='benchmark', minutes=5, **kw)
+	def double(value):
+		return value * 2
+	
+	return double
+
+
+# ## Benchmarks
+
+def key_benchmark(shape):
+	args, kw = SHAPES[shape]
+	return lambda: Key.new('benchmark', None, args, kw)
+
+
+for _shape in SHAPES:
+	BENCHMARKS['key.' + _shape] = (partial(key_benchmark, _shape), None)
+
+del _shape
+
+
+@benchmark('key.reference')
+def key_reference():
+	instance = post()
+	return lambda: Key.new('benchmark', instance, (42, ), {})
+
+
+@benchmark('call.bare')
+def call_bare():
+	"""The baseline: a call to the undecorated function."""
+	
+	fn = memoized().__wrapped__
+	return lambda: fn(21)
+
+
+@benchmark('hit', budget=30e-6)
+def hit():
+	fn = memoized()
+	fn(21)
+	
+	return lambda: fn(21)
+
+
+@benchmark('hit.local', budget=20e-6)
+def hit_local():
+	fn = memoized(local=LocalCache())
+	fn(21)
+	
+	return lambda: fn(21)
+
+
+@benchmark('hit.refresh')
+def hit_refresh():
+	fn = memoized(refresh=True)
+	fn(21)
+	
+	return lambda: fn(21)
+
+
+@benchmark('hit.threshold')
+def hit_threshold():
+	fn = memoized(refresh=0.5)
+	fn(21)
+	
+	return lambda: fn(21)
+
+
+@benchmark('miss')
+def miss():
+	fn = memoized()
+	values = count()
+	
+	return lambda: fn(next(values))
+
+
+@benchmark('method.hit', budget=40e-6)
+def method_hit():
+	instance = post()
+	instance.summary(10)
+	
+	return lambda: instance.summary(10)
+
+
+@benchmark('method.disabled')
+def method_disabled():
+	"""Decorator overhead where caching has been disabled, including that of the scope; compare to ``method.bare``."""
+	
+	instance = post()
+	
+	def inner():
+		with Cache.disable(instance):
+			return instance.summary(10)
+	
+	return inner
+
+
+@benchmark('method.bare')
+def method_bare():
+	instance = post()
+	return lambda: instance.plain(10)
+
+
+@benchmark('contention.shared', threads=8)
+def contention_shared():
+	"""Many threads retrieving the same value."""
+	
+	fn = memoized()
+	fn(21)
+	
+	return lambda: fn(21)
+
+
+@benchmark('contention.distinct', threads=8)
+def contention_distinct():
+	"""Many threads generating and storing distinct values."""
+	
+	fn = memoized()
+	values = count()
+	
+	return lambda: fn(next(values))
+
+
+# ## Measurement
+
+def threaded(fn, threads):
+	"""Produce a callable performing ``number`` calls to ``fn`` in each of several threads, for use with ``Timer``."""
+	
+	def inner(number):
+		workers = [Thread(target=lambda: [fn() for i in range(number)]) for i in range(threads)]
+		
+		for worker in workers:
+			worker.start()
+		
+		for worker in workers:
+			worker.join()
+	
+	return inner
+
+
+def measure(fn, threads=None, number=None, repeat=5, duration=0.2):
+	"""Time a callable, returning a dictionary describing the time taken per call, in seconds.
+	
+	Unless a ``number`` of calls per repetition is given, it is chosen such that each repetition takes at least
+	``duration`` seconds.
+	"""
+	
+	if threads:
+		group = threaded(fn, threads)
+		
+		def timer(number):
+			start = default_timer()
+			group(number)
+			return default_timer() - start
+	
+	else:
+		timer = Timer(fn).timeit
+	
+	if number is None:
+		number = 1
+		
+		while timer(number) < duration:
+			number *= 2
+	
+	calls = number * (threads or 1)
+	timings = sorted(timer(number) / calls for i in range(repeat))
+	
+	return OrderedDict((
+			('number', number),
+			('repeat', repeat),
+			('threads', threads or 1),
+			('best', timings[0]),
+			('median', timings[len(timings) // 2]),
+			('mean', sum(timings) / len(timings)),
+		))
+
+
+def run(names=None, number=None, repeat=5, duration=0.2, mongo=None, log=None):
+	"""Run the named benchmarks (or all of them), returning the results as a dictionary suitable for JSON encoding."""
+	
+	previous = Cache.BACKEND
+	
+	if mongo:
+		from mongoengine import connect
+		
+		connect(host=mongo)
+		Cache.drop_collection()
+		Cache.ensure_indexes()
+		Cache.BACKEND = None
+	
+	else:
+		Cache.BACKEND = MemoryBackend()
+	
+	results = OrderedDict()
+	
+	try:
+		for name, (factory, threads) in BENCHMARKS.items():
+			if names and not any(i in name for i in names):
+				continue
+			
+			results[name] = measure(factory(), threads, number, repeat, duration)
+			
+			if log:
+				log(name, results[name])
+	
+	finally:
+		Cache.BACKEND = previous
+		
+		if mongo:
+			Cache.drop_collection()
+	
+	return OrderedDict((
+			('version', version),
+			('python', platform.python_version()),
+			('implementation', platform.python_implementation()),
+			('platform', platform.platform()),
+			('backend', 'mongo' if mongo else 'memory'),
+			('timestamp', datetime.utcnow().isoformat()),
+			('results', results),
+		))
+
+
+def compare(baseline, current, threshold=0.1):
+	"""Compare two sets of results, returning a list of ``(name, baseline, current, ratio, regressed)`` tuples.
+	
+	A benchmark has regressed if its best time per call has grown by more than the ``threshold`` fraction.
+	"""
+	
+	result = []
+	
+	for name, entry in current['results'].items():
+		previous = baseline['results'].get(name)
+		
+		if previous is None:
+			continue
+		
+		ratio = entry['best'] / previous['best']
+		result.append((name, previous['best'], entry['best'], ratio, ratio > 1 + threshold))
+	
+	return result
+
+
+def overhead(results, scale=1.0):
+	"""Check results against the budgets of benchmarks, returning a list of ``(name, overhead, budget, over)`` tuples.
+	
+	The overhead of a benchmark is its best time per call less that of ``call.bare``, measured in the same run; budgets
+	are multiplied by ``scale``.  Benchmarks not run are omitted.
+	"""
+	
+	results = results['results']
+	
+	if BASELINE not in results:
+		raise ValueError("Checking budgets requires the results of the " + BASELINE + " benchmark.")
+	
+	baseline = results[BASELINE]['best']
+	checked = []
+	
+	for name, budget in BUDGETS.items():
+		if name not in results:
+			continue
+		
+		cost = results[name]['best'] - baseline
+		checked.append((name, cost, budget * scale, cost > budget * scale))
+	
+	return checked
+
+
+# ## Command-Line Interface
+
+def _report(name, entry):
+	print('{0:<24} {1:>12.3f}us {2:>12.3f}us {3:>10}'.format(name, entry['best'] * 1e6, entry['median'] * 1e6,
+			entry['number']), file=sys.stderr)
+
+
+def main(argv=None):
+	parser = ArgumentParser(prog='python -m marrow.cache.benchmark', description="Benchmark marrow.cache.")
+	parser.add_argument('names', nargs='*', help="run only benchmarks whose names contain any of these")
+	parser.add_argument('--mongo', metavar='URI', help="benchmark against this MongoDB server; its cache collection "
+			"is dropped before and after")
+	parser.add_argument('--output', metavar='FILE', help="write results as JSON to this file, '-' for standard output")
+	parser.add_argument('--compare', metavar='FILE', help="compare against the JSON results of a previous run")
+	parser.add_argument('--threshold', type=float, default=0.1, help="the fractional slowdown considered a "
+			"regression (default: 0.1)")
+	parser.add_argument('--number', type=int, help="calls per repetition (default: calibrated)")
+	parser.add_argument('--repeat', type=int, default=5, help="repetitions per benchmark (default: 5)")
+	parser.add_argument('--budget', type=float, nargs='?', const=1.0, metavar='SCALE', help="check the overhead per "
+			"call of budgeted benchmarks, optionally scaling their budgets (default: 1)")
+	
+	options = parser.parse_args(argv)
+	names = options.names
+	
+	if names and options.budget is not None:  # The overhead is measured relative to the baseline.
+		names = names + [BASELINE]
+	
+	print('{0:<24} {1:>14} {2:>14} {3:>10}'.format('benchmark', 'best', 'median', 'calls'), file=sys.stderr)
+	results = run(names, options.number, options.repeat, mongo=options.mongo, log=_report)
+	
+	if options.output == '-':
+		json.dump(results, sys.stdout, indent=4)
+		sys.stdout.write('\n')
+	
+	elif options.output:
+		with open(options.output, 'w') as fh:
+			json.dump(results, fh, indent=4)
+	
+	regressed = False
+	
+	if options.budget is not None:
+		print('\n{0:<24} {1:>14} {2:>14}'.format('benchmark', 'overhead', 'budget'), file=sys.stderr)
+		
+		for name, cost, budget, over in overhead(results, options.budget):
+			regressed = regressed or over
+			print('{0:<24} {1:>12.3f}us {2:>12.3f}us{3}'.format(name, cost * 1e6, budget * 1e6,
+					'  OVER BUDGET' if over else ''), file=sys.stderr)
+	
+	if not options.compare:
+		return 1 if regressed else 0
+	
+	with open(options.compare) as fh:
+		baseline = json.load(fh)
+	
+	print('\n{0:<24} {1:>14} {2:>14} {3:>8}'.format('benchmark', 'baseline', 'current', 'ratio'), file=sys.stderr)
+	
+	for name, before, after, ratio, slower in compare(baseline, results, options.threshold):
+		regressed = regressed or slower
+		print('{0:<24} {1:>12.3f}us {2:>12.3f}us {3:>7.2f}x{4}'.format(name, before * 1e6, after * 1e6, ratio,
+				'  REGRESSED' if slower else ''), file=sys.stderr)
+	
+	return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
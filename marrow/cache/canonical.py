@@ -0,0 +1,241 @@
+# encoding: utf-8
+
+"""A fast, canonical binary encoding of arbitrary values, used to derive cache keys from function arguments.
+
+Values are walked directly rather than pretty-printed.  Each encoded value is prefixed by a type tag and variable
+length values are length-prefixed, so that distinct values can not produce the same encoding.  Dictionaries and sets
+are encoded in sorted order, making the result independent of insertion order.
+
+Additional types may be supported by registering an encoder: a callable accepting the value and an ``append``
+callable to pass encoded ``bytes`` to::
+
+	def encode_point(value, append):
+		append(b'P')
+		encode(value.x, append)
+		encode(value.y, append)
+	
+	ENCODERS[Point] = encode_point
+
+Subclasses of registered types use the encoder of their nearest registered ancestor, save that enumeration members
+(including those of ``IntEnum`` and other enumerations deriving from built-in types) are always tagged with their
+enumeration, so that ``Color.RED`` and ``1`` differ.  Other objects supporting the buffer protocol are encoded by their
+raw contents; anything else falls back on its ``repr``.
+"""
+
+# ## Imports
+
+from __future__ import unicode_literals
+
+from uuid import UUID
+from decimal import Decimal
+from datetime import datetime, date, time, timedelta
+
+from bson import ObjectId, DBRef
+from mongoengine.base import BaseDocument
+
+from .compat import unicode, str as bytes_, iteritems
+
+try:
+	from hashlib import blake2b
+except ImportError:  # pragma: no cover
+	from hashlib import sha256
+	blake2b = None
+
+try:
+	long
+except NameError:  # pragma: no cover
+	long = int
+
+try:
+	from enum import Enum
+except ImportError:  # pragma: no cover
+	Enum = None
+
+
+# ## Encoders
+
+def _constant(tag):
+	def encode_constant(value, append):
+		append(tag)
+	
+	return encode_constant
+
+
+def _textual(tag, convert=lambda value: unicode(value).encode('ascii')):
+	"""Encode a value as a tag, an ASCII textual representation, and a terminator."""
+	
+	def encode_textual(value, append):
+		append(tag)
+		append(convert(value))
+		append(b';')
+	
+	return encode_textual
+
+
+def _sized(tag, convert):
+	"""Encode a value as a tag, then the length and content of a binary representation."""
+	
+	def encode_sized(value, append):
+		data = convert(value)
+		append(tag)
+		append(unicode(len(data)).encode('ascii'))
+		append(b':')
+		append(data)
+	
+	return encode_sized
+
+
+def _sequence(opening, closing):
+	def encode_sequence(value, append):
+		append(opening)
+		
+		for item in value:
+			encode(item, append)
+		
+		append(closing)
+	
+	return encode_sequence
+
+
+def _encode_mapping(value, append):
+	append(b'{')
+	
+	for item in sorted((canonical(k), canonical(v)) for k, v in iteritems(value)):
+		append(item[0])
+		append(item[1])
+	
+	append(b'}')
+
+
+def _encode_set(value, append):
+	append(b'<')
+	
+	for item in sorted(canonical(i) for i in value):
+		append(item)
+	
+	append(b'>')
+
+
+def _encode_document(value, append):
+	"""Saved documents are identified by their class and primary key; others, by their complete contents."""
+	
+	pk = getattr(value, 'pk', None)
+	
+	if pk is None:
+		append(b'E')
+		encode(value.__class__.__name__, append)
+		encode(dict(value.to_mongo()), append)
+		return
+	
+	append(b'M')
+	encode(value.__class__.__name__, append)
+	encode(pk, append)
+
+
+def _encode_dbref(value, append):
+	append(b'R')
+	encode(value.collection, append)
+	encode(value.id, append)
+
+
+def _encode_enum(value, append):
+	append(b'e')
+	encode(_qualified(value), append)
+	encode(value.value, append)
+
+
+def _encode_fallback(value, append):
+	"""Encode objects supporting the buffer protocol by their contents, and anything else by its representation."""
+	
+	try:
+		data = memoryview(value).tobytes()
+	except TypeError:
+		append(b'?')
+		encode(_qualified(value), append)
+		encode(repr(value), append)
+		return
+	
+	append(b'B')
+	encode(_qualified(value), append)
+	append(unicode(len(data)).encode('ascii'))
+	append(b':')
+	append(data)
+
+
+def _qualified(value):
+	kind = value.__class__
+	return kind.__module__ + ':' + getattr(kind, '__qualname__', kind.__name__)
+
+
+ENCODERS = {
+		type(None): _constant(b'N'),
+		bool: lambda value, append: append(b'T' if value else b'F'),
+		int: _textual(b'i'),
+		long: _textual(b'i'),
+		float: _textual(b'f', lambda value: repr(value).encode('ascii')),
+		Decimal: _textual(b'n'),
+		unicode: _sized(b'u', lambda value: value.encode('utf8')),
+		bytes_: _sized(b'b', lambda value: value),
+		bytearray: _sized(b'b', bytes_),
+		tuple: _sequence(b'(', b')'),
+		list: _sequence(b'[', b']'),
+		dict: _encode_mapping,
+		set: _encode_set,
+		frozenset: _encode_set,
+		datetime: _textual(b'd', lambda value: value.isoformat().encode('ascii')),
+		date: _textual(b'D', lambda value: value.isoformat().encode('ascii')),
+		time: _textual(b't', lambda value: value.isoformat().encode('ascii')),
+		timedelta: _textual(b'z', lambda value: repr(value.total_seconds()).encode('ascii')),
+		UUID: _sized(b'U', lambda value: value.bytes),
+		ObjectId: _sized(b'o', lambda value: value.binary),
+		DBRef: _encode_dbref,
+		BaseDocument: _encode_document,
+	}
+
+if Enum is not None:
+	ENCODERS[Enum] = _encode_enum
+
+
+def _resolve(kind):
+	"""Identify the encoder for a type not directly registered, caching the result."""
+	
+	for base in kind.__mro__[1:]:
+		if base in ENCODERS:
+			break
+	else:
+		base = None
+	
+	if Enum is not None and issubclass(kind, Enum):  # Precede any built-in type the enumeration also derives from.
+		base = Enum
+	
+	encoder = ENCODERS[kind] = ENCODERS[base] if base else _encode_fallback
+	return encoder
+
+
+def encode(value, append):
+	"""Encode a value, passing the resulting fragments of ``bytes`` to the ``append`` callable."""
+	
+	kind = value.__class__
+	encoder = ENCODERS.get(kind)
+	
+	if encoder is None:
+		encoder = _resolve(kind)
+	
+	encoder(value, append)
+
+
+def canonical(value):
+	"""Return the canonical binary encoding of the given value."""
+	
+	parts = []
+	encode(value, parts.append)
+	return b''.join(parts)
+
+
+def digest(value, size=16):
+	"""Return a short hexadecimal digest of the canonical encoding of the given value."""
+	
+	if blake2b is None:  # pragma: no cover
+		return sha256(canonical(value)).hexdigest()[:size * 2]
+	
+	return blake2b(canonical(value), digest_size=size).hexdigest()
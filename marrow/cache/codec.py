@@ -0,0 +1,189 @@
+# encoding: utf-8
+
+"""Serialization and compression of cached values.
+
+Values stored by a mark configured with a codec are serialized to bytes, optionally compressed, and stored as BSON
+binary data of a user-defined subtype.  The first byte of the data identifies the codec (high nibble) and compression
+(low nibble) used, so values may always be decoded regardless of the current configuration, and values stored
+without a codec are returned as-is.
+
+The following codecs are available, by name:
+
+* ``bson``, the native representation used by MongoDB; tuples are returned as lists.
+* ``pickle``, supporting (nearly) arbitrary Python objects.
+* ``json``, compact and portable; tuples are returned as lists, and only basic types are supported.
+* ``msgpack``, compact and fast, if the ``msgpack`` package is installed.
+
+Compression using ``zlib`` is always available, and ``lz4`` if the ``lz4`` package is installed.
+"""
+
+# ## Imports
+
+from __future__ import unicode_literals
+
+import json
+import zlib
+
+from bson import BSON
+from bson.binary import Binary
+
+try:
+	import cPickle as pickle
+except ImportError:  # pragma: no cover
+	import pickle
+
+try:
+	import msgpack
+except ImportError:  # pragma: no cover
+	msgpack = None
+
+try:
+	import lz4.frame as lz4
+except ImportError:  # pragma: no cover
+	lz4 = None
+
+
+# ## Constants
+
+SUBTYPE = 0x80  # The BSON binary subtype used to identify encoded values; the first of the user-defined range.
+
+
+# ## Implementation
+
+class Codec(object):
+	"""A named means of serializing values to bytes, and back.
+	
+	Codecs whose round trip is ``exact`` return values equal to, and of the same type as, those given to them; others
+	(such as JSON, which has no tuples) may not.
+	"""
+	
+	def __init__(self, name, id, dumps, loads, exact=False):
+		self.name = name
+		self.id = id
+		self.dumps = dumps
+		self.loads = loads
+		self.exact = exact
+	
+	def __repr__(self):
+		return 'Codec({0})'.format(self.name)
+
+
+class Compression(object):
+	"""A named means of compressing bytes."""
+	
+	def __init__(self, name, id, compress, decompress):
+		self.name = name
+		self.id = id
+		self.compress = compress
+		self.decompress = decompress
+	
+	def __repr__(self):
+		return 'Compression({0})'.format(self.name)
+
+
+CODECS = {}  # Registered codecs, by both name and identifier.
+COMPRESSION = {}  # Registered compression, by both name and identifier.
+
+
+def register(registry, entry):
+	"""Register a ``Codec`` or ``Compression`` instance.  Identifiers are limited to the range 1 to 15."""
+	
+	if not 0 < entry.id < 16:
+		raise ValueError("Identifiers must be between 1 and 15, inclusive.")
+	
+	registry[entry.name] = registry[entry.id] = entry
+
+
+register(CODECS, Codec('bson', 1, lambda value: BSON.encode({'v': value}), lambda data: BSON(data).decode()['v']))
+register(CODECS, Codec('pickle', 2, lambda value: pickle.dumps(value, pickle.HIGHEST_PROTOCOL), pickle.loads, True))
+register(CODECS, Codec('json', 3, lambda value: json.dumps(value, separators=(',', ':')).encode('utf8'),
+		lambda data: json.loads(data.decode('utf8'))))
+
+if msgpack is not None:  # pragma: no cover
+	register(CODECS, Codec('msgpack', 4, lambda value: msgpack.packb(value, use_bin_type=True),
+			lambda data: msgpack.unpackb(data, raw=False)))
+
+register(COMPRESSION, Compression('zlib', 1, zlib.compress, zlib.decompress))
+
+if lz4 is not None:  # pragma: no cover
+	register(COMPRESSION, Compression('lz4', 2, lz4.compress, lz4.decompress))
+
+
+class Serializer(object):
+	"""Encode values using a codec, compressing those whose encoded size is at least ``threshold`` bytes.
+	
+	Codecs and compression may be given by name.  A ``threshold`` of ``None`` disables compression.
+	"""
+	
+	def __init__(self, codec='pickle', threshold=None, compression='zlib'):
+		self.codec = lookup(CODECS, codec)
+		self.threshold = threshold
+		self.compression = None if threshold is None else lookup(COMPRESSION, compression)
+	
+	def __repr__(self):
+		return 'Serializer({0.codec.name}, {0.threshold}, {1})'.format(self,
+				self.compression.name if self.compression else None)
+	
+	def encode(self, value):
+		"""Encode a value for storage."""
+		
+		codec = self.codec
+		data = codec.dumps(value)
+		compression = 0
+		
+		if self.compression is not None and len(data) >= self.threshold:
+			compressed = self.compression.compress(data)
+			
+			if len(compressed) < len(data):
+				data = compressed
+				compression = self.compression.id
+		
+		return Binary(bytes(bytearray((codec.id << 4 | compression, ))) + data, SUBTYPE)
+	
+	def roundtrip(self, value, encoded):
+		"""Return the value as it will be decoded from storage, for consistency between hits and misses."""
+		
+		return value if self.codec.exact else decode(encoded)
+
+
+# ## Utility Functions
+
+def lookup(registry, value):
+	if not isinstance(value, (Codec, Compression)):
+		try:
+			value = registry[value]
+		except KeyError:
+			raise LookupError("Unknown codec or compression, or required package not installed: " + repr(value))
+	
+	return value
+
+
+def serializer(codec=None, compress=None):
+	"""Produce a ``Serializer`` from the ``codec`` and ``compress`` arguments accepted by ``Cache.memoize``.
+	
+	Returns ``None`` (deferring to ``Cache.CODEC``) if neither is given, and ``False`` if ``codec`` is ``False``.
+	"""
+	
+	if codec is False or isinstance(codec, Serializer):
+		return codec
+	
+	if codec is None and compress is None:
+		return None
+	
+	return Serializer(codec or 'pickle', compress)
+
+
+def decode(value):
+	"""Decode a stored value, returning values not encoded by a ``Serializer`` unchanged."""
+	
+	if not isinstance(value, Binary) or value.subtype != SUBTYPE:
+		return value
+	
+	header = bytearray(value[:1])[0]
+	data = bytes(value[1:])
+	compression = header & 0x0F
+	
+	if compression:
+		data = COMPRESSION[compression].decompress(data)
+	
+	return CODECS[header >> 4].loads(data)
@@ -14,6 +14,7 @@ import sys
 
 py2 = sys.version_info < (3, )
 py3 = sys.version_info > (3, )
+py35 = sys.version_info >= (3, 5)  # Native coroutines.
 pypy = hasattr(sys, 'pypy_version_info')
 
 
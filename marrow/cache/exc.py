@@ -7,3 +7,9 @@ class CacheMiss(Exception):
 	"""A matching value could not be found using these criteria."""
 	
 	pass
+
+
+class CacheExpired(CacheMiss):
+	"""A matching value was found, but has expired."""
+	
+	pass
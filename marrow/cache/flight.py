@@ -0,0 +1,76 @@
+# encoding: utf-8
+
+"""Coalescing of concurrent computations of the same value."""
+
+# ## Imports
+
+from __future__ import unicode_literals
+
+from threading import Lock, Event
+
+
+# ## Implementation
+
+class Call(object):
+	"""A computation in progress, which any number of threads may wait upon."""
+	
+	__slots__ = ('event', 'result', 'error')
+	
+	def __init__(self):
+		self.event = Event()
+		self.result = None
+		self.error = None
+	
+	def wait(self):
+		self.event.wait()
+		
+		if self.error is not None:
+			raise self.error
+		
+		return self.result
+
+
+class Flight(object):
+	"""Ensure only one thread at a time performs the computation for any given key.
+	
+	Threads requesting a key already being computed block until that computation completes, then share its result
+	(or exception, including those not derived from ``Exception``, such as ``SystemExit``) rather than repeating the
+	work themselves.
+	"""
+	
+	def __init__(self):
+		self._calls = {}
+		self._lock = Lock()
+		
+		super(Flight, self).__init__()
+	
+	def __len__(self):
+		return len(self._calls)
+	
+	def run(self, key, fn, *args, **kw):
+		"""Call ``fn`` with the given arguments, unless a call for this hashable key is already in progress."""
+		
+		with self._lock:
+			call = self._calls.get(key)
+			leader = call is None
+			
+			if leader:
+				call = self._calls[key] = Call()
+		
+		if not leader:
+			return call.wait()
+		
+		try:
+			call.result = fn(*args, **kw)
+		
+		except BaseException as e:  # Waiting threads must not mistake an interrupted computation for a result of None.
+			call.error = e
+			raise
+		
+		finally:
+			with self._lock:
+				del self._calls[key]
+			
+			call.event.set()
+		
+		return call.result
@@ -0,0 +1,154 @@
+# encoding: utf-8
+
+"""An in-process cache tier placed in front of the MongoDB-backed cache collection."""
+
+# ## Imports
+
+from __future__ import unicode_literals
+
+from sys import getsizeof
+from threading import Lock
+from collections import OrderedDict
+
+from .exc import CacheMiss
+from .compat import iteritems
+from .util import utcnow, as_delta
+
+
+# ## Utility Functions
+
+def sizeof(value):
+	"""Estimate the memory consumed by a value, including the contents of any (nested) builtin containers."""
+	
+	size = getsizeof(value)
+	
+	if isinstance(value, dict):
+		size += sum(sizeof(k) + sizeof(v) for k, v in iteritems(value))
+	
+	elif isinstance(value, (list, tuple, set, frozenset)):
+		size += sum(sizeof(i) for i in value)
+	
+	return size
+
+
+# ## Implementation
+
+class LocalCache(object):
+	"""A thread-safe in-process least-recently-used cache bounded by entry count and approximate size in bytes.
+	
+	Entries are keyed on the hashable ``CacheKey.identity`` and are never served beyond the expiry time recorded in
+	the backing collection.  An optional ``ttl`` (seconds or a ``timedelta``) further limits how long a value may be
+	served from local memory before the backing store is consulted again.
+	"""
+	
+	def __init__(self, entries=4096, size=64 * 1024 * 1024, ttl=None, sizeof=sizeof):
+		self.entries = entries  # Maximum number of entries retained, or None for no limit.
+		self.limit = size  # Maximum estimated size in bytes, or None for no limit.
+		self.ttl = as_delta(ttl)
+		self.sizeof = sizeof
+		
+		self.size = 0
+		self._data = OrderedDict()  # identity: (value, expires, size)
+		self._lock = Lock()
+		
+		super(LocalCache, self).__init__()
+	
+	def __repr__(self):
+		return 'LocalCache({0}/{1} entries, {2}/{3} bytes)'.format(len(self._data), self.entries, self.size, self.limit)
+	
+	def __len__(self):
+		return len(self._data)
+	
+	def __contains__(self, key):
+		try:
+			self.get(key)
+		except CacheMiss:
+			return False
+		
+		return True
+	
+	def get(self, key):
+		"""Retrieve a value, raising ``CacheMiss`` if it is not present or has expired."""
+		
+		with self._lock:
+			try:
+				record = self._data.pop(key)
+			except KeyError:
+				raise CacheMiss()
+			
+			if record[1] is not None and record[1] <= utcnow():
+				self.size -= record[2]
+				raise CacheMiss()
+			
+			self._data[key] = record  # Re-insertion marks this as the most recently used entry.
+		
+		return record[0]
+	
+	def set(self, key, value, expires=None, ttl=None):
+		"""Store a value, evicting least-recently-used entries as required to remain within bounds.
+		
+		The local expiry is the earlier of the given ``expires`` time and the current time plus the ``ttl`` (or the
+		default configured for this tier).  Values individually larger than the size bound are not stored.
+		"""
+		
+		ttl = as_delta(ttl) if ttl is not None else self.ttl
+		
+		if ttl is not None:
+			limit = utcnow() + ttl
+			expires = limit if expires is None else min(expires.replace(tzinfo=None), limit)
+		
+		elif expires is not None:
+			expires = expires.replace(tzinfo=None)
+		
+		size = self.sizeof(value) if self.limit else 0
+		
+		with self._lock:
+			previous = self._data.pop(key, None)
+			
+			if previous:
+				self.size -= previous[2]
+			
+			if self.limit and size > self.limit:
+				return value
+			
+			self._data[key] = (value, expires, size)
+			self.size += size
+			
+			self._cull()
+		
+		return value
+	
+	def delete(self, key):
+		"""Remove a value, if present."""
+		
+		with self._lock:
+			record = self._data.pop(key, None)
+			
+			if record:
+				self.size -= record[2]
+	
+	def invalidate(self, predicate):
+		"""Remove all values whose keys satisfy the given predicate, returning the number removed."""
+		
+		with self._lock:
+			found = [key for key in self._data if predicate(key)]
+			
+			for key in found:
+				self.size -= self._data.pop(key)[2]
+		
+		return len(found)
+	
+	def clear(self):
+		"""Remove all values."""
+		
+		with self._lock:
+			self._data.clear()
+			self.size = 0
+	
+	def _cull(self):
+		"""Evict least-recently-used entries until within bounds.  The lock must be held by the caller."""
+		
+		data = self._data
+		
+		while data and ((self.entries and len(data) > self.entries) or (self.limit and self.size > self.limit)):
+			self.size -= data.popitem(last=False)[1][2]
@@ -0,0 +1,143 @@
+# encoding: utf-8
+
+"""Online conversion of a collection of cached values between the standard and compact record layouts.
+
+The ``_id`` of a record in the standard layout is an embedded document holding the prefix, reference and hash of its
+key; that of the compact layout is a 16 byte digest of them, shrinking the ``_id`` index to a fraction of its size.
+See ``MongoBackend``.  To convert a collection in use, first deploy with ``Cache.COMPACT = True`` (or ``compact=True``
+given to your backends), then convert the records remaining in the standard layout, a batch at a time::
+
+	python -m marrow.cache.migrate --mongo mongodb://localhost/app --batch 1000 --pause 0.1
+
+Values stored in the standard layout miss until converted, and are regenerated; converted values never replace those
+already stored in the new layout.  Chunks of chunked values are converted with them.  Expired values are removed rather
+than converted, and leases, which are short-lived, are not converted at all.  Values invalidated by prefix or reference
+after deployment, but not yet converted, are carried forward; invalidate them again once complete.  Pass ``--expand``
+(or ``compact=False``) to convert back.
+"""
+
+# ## Imports
+
+from __future__ import unicode_literals, print_function
+
+import sys
+
+from argparse import ArgumentParser
+
+from pymongo import ReplaceOne, UpdateOne
+
+from .backend.mongo import MongoBackend, chunk, compose, expand
+from .model import Cache
+from .util import utcnow, time, sleep
+
+
+log = __import__('logging').getLogger(__name__)
+
+
+# ## Implementation
+
+def migrate(collection, compact=True, batch=1000, pause=None):
+	"""Convert the records of a collection to the compact layout, or to the standard layout if not ``compact``.
+	
+	Records are converted ``batch`` at a time, sleeping ``pause`` seconds between batches to limit the load placed on
+	the server.  The indexes the new layout requires are created first.  Returns the number of records converted.
+	"""
+	
+	backend = MongoBackend(collection, acknowledge=True, compact=compact)
+	backend.ensure_indexes()
+	
+	query = {'_id': {'$type': 'object' if compact else 'binData'}}  # Those records in the other layout.
+	converted = 0
+	
+	while True:
+		start = time()
+		records = list(collection.find(query, limit=batch))
+		
+		if not records:
+			break
+		
+		now = utcnow()
+		requests = []
+		
+		for original in records:
+			if original['e'].replace(tzinfo=None) < now:  # Removed below, without conversion.
+				continue
+			
+			identifier, fields = backend.stored(original['_id'] if compact else expand(original))
+			values = dict((field, value) for field, value in original.items() if field not in ('_id', 'p', 'r', 'h'))
+			
+			if 'c' in values:
+				convert(backend, original['_id'], identifier, fields, values['g'])
+			
+			update = compose(identifier, fields, **values)
+			del update['_id']
+			
+			requests.append(UpdateOne({'_id': identifier}, {'$setOnInsert': update}, upsert=True))
+		
+		if requests:
+			collection.bulk_write(requests, ordered=False)
+		
+		handles = [original['_id'] for original in records]
+		collection.delete_many({'_id': {'$in': handles}})
+		backend.chunks.delete_many({'_id.k': {'$in': handles}})
+		
+		converted += len(requests)
+		log.info("Converted %d records, removing %d expired, in %.3f seconds.", len(requests),
+				len(records) - len(requests), time() - start)
+		
+		if len(records) < batch:
+			break
+		
+		if pause:
+			sleep(pause)
+	
+	return converted
+
+
+def convert(backend, original, identifier, fields, generation):
+	"""Copy the chunks of a chunked value, stored under the ``original`` identifier, to the new identifier."""
+	
+	prefix = {'p': fields['p']} if fields and 'p' in fields else None
+	requests = []
+	
+	for part in backend.chunks.find({'_id.k': original, '_id.g': generation}):
+		replacement = compose(chunk(identifier, generation, part['_id']['i']), prefix, d=part['d'], e=part['e'])
+		requests.append(ReplaceOne({'_id': replacement['_id']}, replacement, upsert=True))
+		
+		if len(requests) >= backend.BATCH:
+			backend.chunks.bulk_write(requests, ordered=False)
+			requests = []
+	
+	if requests:
+		backend.chunks.bulk_write(requests, ordered=False)
+
+
+# ## Command-Line Interface
+
+def main(argv=None):
+	parser = ArgumentParser(prog='python -m marrow.cache.migrate', description="Convert a collection of cached values "
+			"to the compact record layout, or back, online and in batches.")
+	parser.add_argument('--mongo', metavar='URI', default='mongodb://localhost/test', help="the MongoDB server and "
+			"database to connect to (default: mongodb://localhost/test)")
+	parser.add_argument('--collection', help="the collection to convert (default: that of the Cache document)")
+	parser.add_argument('--batch', type=int, default=1000, help="the number of records converted at a time "
+			"(default: 1000)")
+	parser.add_argument('--pause', type=float, metavar='SECONDS', help="the time to wait between batches")
+	parser.add_argument('--expand', action='store_true', help="convert to the standard layout instead")
+	
+	options = parser.parse_args(argv)
+	
+	from mongoengine import connect
+	connect(host=options.mongo)
+	
+	collection = Cache._get_db()[options.collection] if options.collection else Cache._get_collection()
+	start = time()
+	count = migrate(collection, not options.expand, options.batch, options.pause)
+	
+	print("Converted {0} records in {1:.3f} seconds.".format(count, time() - start), file=sys.stderr)
+	
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -4,14 +4,31 @@
 
 from __future__ import unicode_literals
 
-from wrapt import decorator
+from wrapt import FunctionWrapper, BoundFunctionWrapper, PartialCallableObjectProxy
+from math import log as ln
+from numbers import Integral
 from inspect import isclass
+from bson import SON
 from mongoengine import Document, EmbeddedDocument
 from mongoengine import StringField, DateTimeField, GenericReferenceField, DynamicField, EmbeddedDocumentField
 
-from .exc import CacheMiss
+from .exc import CacheMiss, CacheExpired
+from .canonical import digest
+from .codec import serializer, decode
+from .local import LocalCache
+from .tag import Generations
+from .flight import Flight
+from .scope import MEMO, forget, memoized, scoped, vetoed
+from .backend import MongoBackend, Refresher
+from .backend.base import matches
 from .compat import py3, unicode, iteritems
-from .util import sha256, timedelta, resolve, wraps, ref, utcnow, chain, isclass, deque, contextmanager, stack, pformat, fetch
+from .util import sha256, timedelta, resolve, wraps, ref, utcnow, chain, isclass, deque, pformat
+from .util import getter, isempty, hybridmethod, iscoroutinefunction, copy, OrderedDict, as_delta, time, sleep, random, Lock, Thread, ThreadPoolExecutor
+
+
+log = __import__('logging').getLogger(__name__)
+_executor_lock = Lock()
+MISSING = object()  # The absence of a memoized result, which may itself be None.
 
 
 # # Implementation
@@ -28,14 +45,212 @@ class CacheKey(EmbeddedDocument):
 	def __repr__(self):
 		return "CacheKey({0.prefix}, {0.reference}, {0.hash})".format(self)
 	
+	@property
+	def identity(self):
+		"""A hashable representation of this key, used to index in-process storage."""
+		
+		reference = self.reference
+		return (self.prefix, None if reference is None else referenced(reference), self.hash)
+	
 	@classmethod
-	def new(cls, prefix, reference, args, kw):
-		hash = sha256()
-		hash.update(unicode(pformat(args)).encode('utf8'))
-		hash.update(unicode(pformat(kw)).encode('utf8'))
+	def new(cls, prefix, reference, args, kw, legacy=False, generations=None):
+		"""Construct a key from a prefix, optional reference, and the positional and keyword arguments of a call.
+		
+		Arguments are hashed using their canonical encoding, along with any tag ``generations`` given.  Pass
+		``legacy=True`` to instead hash their pretty-printed representation, as was done prior to version 1.1, in order
+		to locate existing values.
+		"""
+		
+		return cls(prefix=prefix, reference=reference, hash=hashed(args, kw, legacy, generations))
+
+
+class Key(object):
+	"""A lightweight equivalent of a ``CacheKey``, as constructed by marks for each call.
+	
+	Constructing an embedded document costs more than the remainder of a cache hit.  Instances provide the attributes,
+	``identity``, and ``to_mongo`` method used by backends, without doing so; ``document`` produces the equivalent
+	``CacheKey`` where one is actually needed.  Keys compare equal to ``CacheKey`` instances of the same identity.
+	"""
+	
+	__slots__ = ('prefix', 'reference', 'hash', 'identity')
+	
+	def __init__(self, prefix=None, reference=None, hash=None):
+		self.prefix = prefix
+		self.reference = reference
+		self.hash = hash
+		self.identity = (prefix, None if reference is None else referenced(reference), hash)
+	
+	def __repr__(self):
+		return "CacheKey({0.prefix}, {0.reference}, {0.hash})".format(self)
+	
+	def __eq__(self, other):
+		return isinstance(other, (Key, CacheKey)) and self.identity == other.identity
+	
+	def __ne__(self, other):
+		return not self == other
+	
+	def __hash__(self):
+		return hash(self.identity)
+	
+	@classmethod
+	def new(cls, prefix, reference, args, kw, legacy=False, generations=None):
+		"""Construct a key from the arguments of a call, as per ``CacheKey.new``."""
+		
+		return cls(prefix, reference, hashed(args, kw, legacy, generations))
+	
+	def to_mongo(self):
+		"""The stored form of this key, identical to that of the equivalent ``CacheKey``."""
+		
+		result = SON()
+		
+		if self.prefix is not None:
+			result['p'] = self.prefix
+		
+		if self.reference is not None:
+			result['r'] = CacheKey.reference.to_mongo(self.reference)
+		
+		if self.hash is not None:
+			result['h'] = self.hash
 		
-		result = cls(prefix=prefix, reference=reference, hash=hash.hexdigest())
 		return result
+	
+	def document(self):
+		"""The equivalent ``CacheKey`` embedded document."""
+		
+		return CacheKey(prefix=self.prefix, reference=self.reference, hash=self.hash)
+
+
+def referenced(reference):
+	"""The ``identity`` of a referenced document: its class name, as recorded in stored references, and primary key.
+	
+	The class name is that MongoEngine records (``Parent.Child`` for subclasses of documents allowing inheritance),
+	so the identity of a key matches that produced from its stored form by ``identify``.
+	"""
+	
+	return (getattr(reference, '_class_name', reference.__class__.__name__), getattr(reference, 'pk', reference))
+
+
+def hashed(args, kw, legacy=False, generations=None):
+	"""Hash the positional and keyword arguments of a call, and any tag generations, for use in a key."""
+	
+	if not legacy:
+		return digest((args, kw, generations) if generations else (args, kw))
+	
+	hash = sha256()
+	hash.update(unicode(pformat(args)).encode('utf8'))
+	hash.update(unicode(pformat(kw)).encode('utf8'))
+	
+	return hash.hexdigest()
+
+
+class Raised(object):
+	"""An exception raised by a decorated callable, cached in place of its result and raised again when retrieved.
+	
+	Stored as a dictionary naming the class of the exception and recording its arguments, those not of basic types by
+	their representation.  Only exceptions of the classes a mark is configured to cache (or their subclasses) are
+	restored; see ``CacheMark.restore``.
+	"""
+	
+	__slots__ = ('exception', 'thrown')
+	
+	FIELD = '__raised__'
+	BASIC = (unicode, bytes, Integral, float, type(None))
+	
+	def __init__(self, exception):
+		self.exception = exception
+		self.thrown = False
+	
+	def __repr__(self):
+		return 'Raised({0!r})'.format(self.exception)
+	
+	@staticmethod
+	def name(kind):
+		return '{0}:{1}'.format(kind.__module__, getattr(kind, '__qualname__', kind.__name__))
+	
+	def record(self):
+		"""The form in which the exception is stored."""
+		
+		return {self.FIELD: self.name(self.exception.__class__),
+				'args': [i if isinstance(i, self.BASIC) else repr(i) for i in self.exception.args]}
+	
+	@classmethod
+	def restore(cls, record, classes):
+		"""Reconstruct an exception from its stored form, if of one of the given classes; otherwise raise ``CacheMiss``."""
+		
+		name = record[cls.FIELD]
+		candidates = list(classes)
+		
+		while candidates:
+			kind = candidates.pop()
+			
+			if cls.name(kind) == name:
+				try:
+					return cls(kind(*record.get('args', ())))
+				except Exception:
+					break
+			
+			candidates.extend(kind.__subclasses__())
+		
+		raise CacheMiss()
+	
+	def throw(self):
+		"""Raise the exception; the original the first time, with its traceback, and a copy thereafter."""
+		
+		exception = copy(self.exception) if self.thrown else self.exception
+		self.thrown = True
+		raise exception
+
+
+class _Cached(object):
+	"""Additional behaviour provided by callables decorated using a ``CacheMark``."""
+	
+	__slots__ = ()
+	
+	@property
+	def mark(self):
+		"""The ``CacheMark`` instance responsible for caching the results of this callable."""
+		
+		return self._self_wrapper.__self__
+	
+	def many(self, calls, executor=None):
+		"""Retrieve the results of many calls at once, computing only those not already cached.
+		
+		Each call is given as a tuple of positional arguments, or any other value as the sole argument.  Methods
+		accessed through their class expect each call to begin with the instance, e.g. ``Post.summary.many(posts)``.
+		See ``CacheMark.many`` for details.
+		"""
+		
+		wrapped, instance = self.__wrapped__, self._self_instance
+		calls = [call if isinstance(call, tuple) else (call, ) for call in calls]
+		
+		if instance is None and self._self_parent is not None and self._self_binding == 'function':
+			return self.mark.many([(PartialCallableObjectProxy(wrapped, args[0]), args[0], args[1:]) for args in calls],
+					executor)
+		
+		return self.mark.many([(wrapped, instance, args) for args in calls], executor)
+	
+	def invalidate(self, *args, **kw):
+		"""Remove the value cached for a single call, given the same arguments as the call.
+		
+		As with ``many``, methods accessed through their class expect the instance as the first argument.  To remove
+		all values cached for this callable, use ``Cache.invalidate``.
+		"""
+		
+		wrapped, instance = self.__wrapped__, self._self_instance
+		
+		if instance is None and self._self_parent is not None and self._self_binding == 'function':
+			return self.mark.discard(PartialCallableObjectProxy(wrapped, args[0]), args[0], args[1:], kw)
+		
+		return self.mark.discard(wrapped, instance, args, kw)
+
+
+class BoundCachedFunction(_Cached, BoundFunctionWrapper):
+	__slots__ = ()
+
+
+class CachedFunction(_Cached, FunctionWrapper):
+	__slots__ = ()
+	__bound_function_wrapper__ = BoundCachedFunction
 
 
 class CacheMark(object):
@@ -45,40 +260,736 @@ class CacheMark(object):
 	result you wish cached.  Instances are constructed using the ``@Cache.memoize`` and ``@Cache.method`` decorators.
 	"""
 	
-	def __init__(self, manager, expiry, prefix=None, reference=False, refresh=False, populate=True, processor=None):
+	BACKOFF = (0.01, 0.25)  # Initial and maximum delay, in seconds, between polls while another process holds a lease.
+	NEGATIVE = timedelta(minutes=1)  # The default expiry period of cached exceptions.
+	
+	def __init__(self, manager, expiry, prefix=None, reference=False, refresh=False, populate=True, processor=None,
+			local=None, local_ttl=None, backend=None, coalesce=False, lease=None, stale=None, early=None, codec=None,
+			compress=None, tags=None, track=False, attributes=(), exceptions=(), exception_ttl=None, empty=None,
+			empty_ttl=None):
 		self.manager = manager
+		self.backend = backend  # None defers to the global Cache.BACKEND, itself defaulting to the Cache collection.
+		self.codec = serializer(codec, compress)  # None defers to the global Cache.CODEC; False stores values natively.
 		self.expiry = expiry
 		self.prefix = prefix
 		self.reference = reference
 		self.refresh = refresh
 		self.populate = populate
 		self.processor = processor
+		self.local = LocalCache() if local is True else local  # None defers to the global Cache.LOCAL tier.
+		self.local_ttl = as_delta(local_ttl)
+		self.lease = as_delta(lease)
+		self.flight = Flight() if (coalesce or lease) else None  # Leases imply coalescing within the process, too.
+		self.stale = as_delta(stale)
+		self.early = early
+		self.tags = tags if (tags is None or callable(tags)) else tuple(tags)
+		self.track = track  # Invalidate values as their referenced documents change: True, 'changed', or False.
+		self.attributes = attributes  # The attributes of the instance a method's values depend upon.
+		self.exceptions = (exceptions, ) if isclass(exceptions) else tuple(exceptions)  # Exception classes to cache.
+		self.exception_ttl = as_delta(exception_ttl) or self.NEGATIVE
+		self.empty = empty or isempty  # The test of results considered empty, cached for empty_ttl if given.
+		self.empty_ttl = as_delta(empty_ttl)
+		self.negative = bool(self.exceptions) or self.empty_ttl is not None
+		self.delta = None  # A moving average of the time, in seconds, taken to generate a value.
+		self.revalidating = set()
+		self._lock = Lock()
+		
+		if track:
+			from .signals import connect
+			connect()
 		
 		super(CacheMark, self).__init__()
 	
-	@decorator
-	def __call__(self, wrapped, instance, args, kw):
-		prefix = self.prefix if self.prefix else resolve(wrapped)
+	def __call__(self, wrapped):
+		"""Decorate a callable, resolving its automatic prefix once, at decoration time, where possible.
+		
+		Coroutine functions are decorated by an asynchronous variant of this mark; see ``marrow.cache.aio``.
+		"""
+		
+		mark = self
+		
+		if iscoroutinefunction(wrapped):
+			from .aio import AsyncCacheMark
+			
+			if not isinstance(mark, AsyncCacheMark):
+				mark = AsyncCacheMark.derive(mark)
+		
+		if mark.prefix or not hasattr(wrapped, '__qualname__'):
+			return CachedFunction(wrapped, mark.wrapper)
+		
+		mark = copy(mark)  # Marks may be reused to decorate more than one callable.
+		mark.prefix = resolve(wrapped)
+		
+		return CachedFunction(wrapped, mark.wrapper)
+	
+	def key(self, wrapped, instance, args, kw, generations=None):
+		"""Construct the key for a call, returning a ``(key, arguments)`` tuple, or ``None`` if it must not be cached.
+		
+		The key of a tagged call incorporates the current generations of its tags; retrieved from the backend unless
+		already given.
+		"""
+		
+		prefix = self.prefix or resolve(wrapped)  # Older Pythons only reveal the owning class of a bound method.
 		
 		reference = self.reference
 		if reference and isinstance(instance, Document):
-			veto = getattr(instance, '__nocache__', False)
-			
-			if not instance.pk or instance._created or (veto and veto[-1]):
-				return wrapped(*args, **kw)  # Can't safely cache.
+			if not instance.pk or instance._created or vetoed(instance):
+				return None  # Can't safely cache.
 			
 			reference = instance if reference is True else reference
 		
+		elif reference is True:
+			reference = None
+		
 		_args = self.processor(instance, args, kw) if self.processor else (args, kw)
-		key = CacheKey.new(prefix, None if reference in (True, False) else reference, *_args)
+		
+		if self.tags and generations is None:
+			generations = self.manager.TAGS.get(self.backend or self.manager.BACKEND or self.manager,
+					self.tagged(instance, args, kw))
+		
+		# Compared by identity; comparing a document to a boolean invokes the comparison of documents.
+		key = Key.new(prefix, None if reference is False else reference, *_args,
+				legacy=self.manager.LEGACY_KEYS, generations=generations)
+		
+		return key, _args
+	
+	def tagged(self, instance, args, kw):
+		"""The tags of a call; those given, or the result of calling those given with the arguments of the call."""
+		
+		if not callable(self.tags):
+			return self.tags
+		
+		return self.tags(*args, **kw) if instance is None else self.tags(instance, *args, **kw)
+	
+	def tier(self):
+		"""The in-process tier used by this mark, if any."""
+		
+		return self.manager.LOCAL if self.local is None else (None if self.local is False else self.local)
+	
+	def wrapper(self, wrapped, instance, args, kw):
+		key = self.key(wrapped, instance, args, kw)
+		
+		if key is None:
+			return wrapped(*args, **kw)
+		
+		memo, value = self.recollect(key[0])
+		
+		if value is MISSING:
+			value = self.lookup(key[0], key[1], wrapped, args, kw)
+			
+			if memo is not None:
+				memo[key[0].identity] = value
+		
+		return self.result(value)
+	
+	def recollect(self, key):
+		"""Return the results memoized within the current scope, if any, and that memoized for the given key, if any.
+		
+		A result not yet memoized (or without a scope to be memoized within) is ``MISSING``.
+		"""
+		
+		memo = MEMO.get()
+		
+		if memo is None:
+			return None, MISSING
+		
+		value = memo.get(key.identity, MISSING)
+		
+		if value is not MISSING and self.manager.STATS is not None:
+			self.manager.STATS.count(key.prefix, 'memo')
+		
+		return memo, value
+	
+	def lookup(self, key, _args, wrapped, args, kw):
+		"""Retrieve the value for a call from the local tier or backend, generating it if missing; see ``wrapper``.
+		
+		Cached exceptions are returned, as ``Raised`` instances, rather than raised.
+		"""
+		
+		local = self.tier()
 		
 		try:
-			return self.manager.get(key, refresh=self.expiry if self.refresh else None)
+			return self.recall(key, local)
 		except CacheMiss:
+			pass
+		
+		backend = self.backend or self.manager.BACKEND or self.manager
+		refresh = self.refreshing()
+		start = time()
+		
+		try:
+			try:
+				value, expires = backend.get(key, refresh=refresh, detail=True)
+			except CacheMiss:
+				if not self.manager.MIGRATE_KEYS:
+					raise
+				
+				value, expires = self.migrate(backend, key, _args)
+		
+		except CacheMiss as e:
+			self.observed(key.prefix, start)
+			self.missed(key.prefix, e)
+			
 			if not self.populate:
 				raise
 		
-		return self.manager.set(key, wrapped(*args, **kw), self.expiry()).value
+		else:
+			self.observed(key.prefix, start)
+			return self.hit(backend, key, local, value, expires, wrapped, args, kw, refreshed=refresh is not None)
+		
+		if self.flight is not None:
+			value, expires = self.flight.run(key.identity, self.generate, backend, key, wrapped, args, kw)
+		else:
+			value, expires = self.generate(backend, key, wrapped, args, kw)
+		
+		self.remember(local, key, value, self.fresh(expires))
+		
+		return value
+	
+	def recall(self, key, local):
+		"""Count a call as hot, if recording, then retrieve its value from the given in-process tier, if any.
+		
+		Raises ``CacheMiss`` if there is no such tier, or the value is absent from it.
+		"""
+		
+		hot = self.manager.HOT
+		
+		if hot is not None:
+			hot.record(key)
+		
+		if local is None:
+			raise CacheMiss()
+		
+		value = local.get(key.identity)
+		
+		if self.manager.STATS is not None:
+			self.manager.STATS.count(key.prefix, 'local')
+		
+		return value
+	
+	def remember(self, local, key, value, fresh):
+		"""Record a value in the given in-process tier, if any, for as long as it remains fresh."""
+		
+		if local is not None:
+			local.set(key.identity, value, fresh, self.local_ttl)
+	
+	def refreshing(self):
+		"""The callable producing a new expiry time for the backend to record as it retrieves a value, if it is to."""
+		
+		return self.deadline if self.refresh is True and not (self.stale or self.negative) else None
+	
+	def observed(self, prefix, start):
+		"""Measure the time taken to retrieve values from the backend since the given start time."""
+		
+		if self.manager.STATS is not None:
+			self.manager.STATS.observe(prefix, 'lookup', time() - start)
+	
+	def missed(self, prefix, miss=None, count=1):
+		"""Count misses; a single one may be given, as the ``CacheMiss`` raised, to count expired values separately."""
+		
+		stats = self.manager.STATS
+		
+		if stats is not None:
+			stats.count(prefix, 'miss', count)
+			
+			if isinstance(miss, CacheExpired):
+				stats.count(prefix, 'expired')
+	
+	def failed(self, prefix, count=1):
+		"""Count values which could not be stored."""
+		
+		if self.manager.STATS is not None:
+			self.manager.STATS.count(prefix, 'error', count)
+	
+	def many(self, calls, executor=None):
+		"""Retrieve the results of many ``(wrapped, instance, args)`` calls, returning a list of results in order.
+		
+		Values are retrieved using a single ``get_many`` request to the backend; only the misses are computed, serially
+		or using the given ``concurrent.futures`` executor (``True`` selecting the shared ``Cache.EXECUTOR``), then
+		stored using a single ``set_many`` request.  Marks using leases instead generate each missing value
+		individually, coordinating with other processes as usual.
+		"""
+		
+		local = self.tier()
+		backend = self.backend or self.manager.BACKEND or self.manager
+		memo = MEMO.get()
+		keys = [self.key(call[0], call[1], call[2], {}) for call in calls]
+		order, results, pending, prefix = self.partition(calls, keys, local, memo)
+		
+		start = time()
+		found = backend.get_many([item[0] for item in pending.values()], detail=True) if pending else {}
+		
+		if pending:
+			self.observed(prefix, start)
+		
+		for identity, (key, _args, call) in list(pending.items()):
+			try:
+				value, expires = found[identity]
+			except KeyError:
+				if not self.manager.MIGRATE_KEYS:
+					continue
+				
+				try:
+					value, expires = self.migrate(backend, key, _args)
+				except CacheMiss:
+					continue
+			
+			results[identity] = self.hit(backend, key, local, value, expires, call[0], call[2], {})
+			del pending[identity]
+		
+		if pending:
+			self.missed(prefix, count=len(pending))
+			
+			if not self.populate:
+				raise CacheMiss()
+		
+		if executor is True:
+			executor = self.manager.executor()
+		
+		apply = executor.map if executor else map
+		
+		if self.lease:
+			generated = list(apply(lambda item: self.generate(backend, item[0], item[2][0], item[2][2], {}),
+					pending.values()))
+		
+		else:
+			packaged = [self.package(value, prefix) for value in apply(lambda item: self.compute(item[2][0],
+					item[2][2], {}, prefix), pending.values())]
+			generated = [(value, expires) for value, stored, expires in packaged]
+			
+			if packaged:
+				try:
+					backend.set_many([(item[0], stored, expires) for item, (value, stored, expires) in
+							zip(pending.values(), packaged)])
+				except Exception:
+					self.failed(prefix, len(packaged))
+					raise
+		
+		self.settle(results, pending, generated, local, memo)
+		
+		return [call[0](*call[2]) if identity is None else self.result(results[identity]) for identity, call in order]
+	
+	def partition(self, calls, keys, local, memo):
+		"""Divide many calls, given with their keys, into those already resolved and those to retrieve from the backend.
+		
+		Returns a tuple of: the identities of the keys of the calls (``None`` for those which can not be cached), paired
+		with each call; the results found, by identity, memoized or in the in-process tier; an ordered dictionary of
+		the ``(key, arguments, call)`` pending retrieval, by identity; and the prefix of the calls.
+		"""
+		
+		stats = self.manager.STATS
+		prefix = self.prefix
+		order = []  # (identity, call)
+		results = {}
+		pending = OrderedDict()  # identity: (key, arguments, call)
+		
+		for call, key in zip(calls, keys):
+			if key is None:  # Calls which can not be cached are simply made.
+				order.append((None, call))
+				continue
+			
+			key, _args = key
+			identity = key.identity
+			prefix = key.prefix
+			order.append((identity, call))
+			
+			if identity in results or identity in pending:
+				continue
+			
+			if memo is not None and identity in memo:
+				results[identity] = memo[identity]
+				continue
+			
+			if local is not None:
+				try:
+					results[identity] = local.get(identity)
+				except CacheMiss:
+					pass
+				else:
+					if stats is not None:
+						stats.count(prefix, 'local')
+					
+					continue
+			
+			pending[identity] = (key, _args, call)
+		
+		return order, results, pending, prefix
+	
+	def settle(self, results, pending, generated, local, memo):
+		"""Record the ``(value, expires)`` tuples generated for many pending calls, as results and in-process."""
+		
+		for (identity, (key, _args, call)), (value, expires) in zip(pending.items(), generated):
+			results[identity] = value
+			self.remember(local, key, value, self.fresh(expires))
+		
+		if memo is not None:
+			memo.update(results)
+	
+	def discard(self, wrapped, instance, args, kw):
+		"""Remove the value cached for a single call, from both the backend and any local tier."""
+		
+		key = self.key(wrapped, instance, args, kw)
+		
+		if key is None:
+			return
+		
+		self.evict(key[0])
+		(self.backend or self.manager.BACKEND or self.manager).delete(key[0])
+	
+	def evict(self, key):
+		"""Remove the value for the given key from the results memoized within the current scope, and in-process."""
+		
+		local = self.tier()
+		memo = MEMO.get()
+		
+		if memo:
+			memo.pop(key.identity, None)
+		
+		if local is not None:
+			local.delete(key.identity)
+	
+	def invalidate(self, wrapped):
+		"""Remove all values cached by this mark for the given callable, returning the number removed."""
+		
+		return (self.backend or self.manager.BACKEND or self.manager).invalidate(self.sweep(wrapped))
+	
+	def sweep(self, wrapped):
+		"""Remove all values for the given callable memoized within the current scope, and in-process.
+		
+		Returns the key selecting those values within the backend.
+		"""
+		
+		key = CacheKey(prefix=self.prefix or resolve(wrapped))
+		local = self.tier()
+		
+		forget(matches(key))
+		
+		if local is not None:
+			local.invalidate(matches(key))
+		
+		return key
+	
+	def hit(self, backend, key, local, value, expires, wrapped, args, kw, refreshed=False):
+		"""Handle a value retrieved from the backend, returning it.
+		
+		Stale (or, if refreshing early, expiring) values are regenerated in the background, refreshed values have their
+		expiry extended unless already ``refreshed`` by the backend, and the value is recorded in any local tier.
+		"""
+		
+		try:
+			value = self.restore(value)
+		except CacheMiss:  # An exception this mark no longer caches.
+			value, expires = self.generate(backend, key, wrapped, args, kw)
+		
+		fresh, stale, extended = self.assess(key, value, expires, refreshed)
+		
+		if stale:
+			self.revalidate(backend, key, local, wrapped, args, kw)
+		
+		elif extended is not None:
+			refresher = self.manager.REFRESH if self.refresh is not True else None
+			
+			if refresher is None:
+				backend.touch(key, extended)
+			else:
+				refresher.touch(backend, key, extended)
+		
+		self.remember(local, key, value, fresh)
+		
+		return value
+	
+	def assess(self, key, value, expires, refreshed=False):
+		"""Count a hit, and determine whether the value is to be regenerated in the background or its expiry extended.
+		
+		Returns a ``(fresh, stale, extended)`` tuple: the time until which the value is fresh, if it is stale (or, if
+		refreshing early, expiring) and so to be regenerated, and the expiry time it is to be extended to, if any.
+		"""
+		
+		fresh = self.fresh(expires)
+		now = utcnow() if (self.stale or self.early) else None
+		stats = self.manager.STATS
+		
+		if stats is not None:
+			stats.count(key.prefix, 'hit')
+		
+		if now and (now >= fresh or (self.early and self.expiring(now, fresh))):
+			if stats is not None and now >= fresh:
+				stats.count(key.prefix, 'stale')
+			
+			return fresh, True, None
+		
+		if self.refresh and not refreshed and not (self.negative and self.shortened(value) is not None):
+			expires = self.extension(expires)
+			
+			if expires is None:
+				return fresh, False, None
+			
+			if stats is not None:
+				stats.count(key.prefix, 'refresh')
+			
+			return self.fresh(expires), False, expires
+		
+		if refreshed and stats is not None:
+			stats.count(key.prefix, 'refresh')
+		
+		return fresh, False, None
+	
+	def extension(self, expires):
+		"""The new expiry time of a value retrieved from the backend, or ``None`` if it is not to be extended.
+		
+		A ``refresh`` of ``True`` extends the expiry of every value accessed.  A fraction instead only does so once less
+		than that fraction of the expiry period remains; such extensions are merged within the process and applied
+		periodically, in bulk, by ``Cache.REFRESH``.
+		"""
+		
+		deadline = self.deadline()
+		
+		if self.refresh is True:
+			return deadline
+		
+		if expires is None:
+			return None
+		
+		now = utcnow()
+		
+		if (expires.replace(tzinfo=None) - now).total_seconds() >= (deadline - now).total_seconds() * self.refresh:
+			return None
+		
+		return deadline
+	
+	def deadline(self):
+		"""The expiry time to record for a newly generated value, including any period it may be served stale."""
+		
+		expires = self.expiry()
+		return (expires + self.stale) if self.stale else expires
+	
+	def lifetime(self, value):
+		"""The expiry time to record for the given newly generated value; shortened for exceptions and empty results."""
+		
+		period = self.shortened(value) if self.negative else None
+		
+		if period is None:
+			return self.deadline()
+		
+		expires = utcnow() + period
+		return (expires + self.stale) if self.stale else expires
+	
+	def shortened(self, value):
+		"""The expiry period of a value if it is a cached exception, or an empty result given ``empty_ttl``."""
+		
+		if isinstance(value, Raised):
+			return self.exception_ttl
+		
+		if self.empty_ttl is not None and self.empty(value):
+			return self.empty_ttl
+		
+		return None
+	
+	def fresh(self, expires):
+		"""The time until which a value with the given recorded expiry time is considered fresh."""
+		
+		return (expires.replace(tzinfo=None) - self.stale) if self.stale else expires
+	
+	def expiring(self, now, fresh):
+		"""Probabilistically decide to regenerate a value ahead of its expiry, ever more likely as it approaches.
+		
+		This is the "XFetch" algorithm; values taking longer to generate, and higher ``early`` factors, are refreshed
+		earlier.  Only values which have been generated within this process, providing a timing, are considered.
+		"""
+		
+		if not self.delta:
+			return False
+		
+		return now + timedelta(seconds=-self.delta * self.early * ln(1.0 - random())) >= fresh
+	
+	def revalidate(self, backend, key, local, wrapped, args, kw):
+		"""Regenerate a value in the background, unless this process is already doing so."""
+		
+		if not self.claim(key):
+			return
+		
+		def revalidate_inner():
+			try:
+				value, expires = self.generate(backend, key, wrapped, args, kw)
+				self.remember(local, key, value, self.fresh(expires))
+			
+			except Exception:
+				log.exception("Failed to revalidate cached value: %r", key)
+			
+			finally:
+				self.relinquish(key)
+		
+		self.manager.background(revalidate_inner)
+	
+	def claim(self, key):
+		"""Record that the value for the given key is being regenerated, returning ``False`` if it already was."""
+		
+		with self._lock:
+			if key.identity in self.revalidating:
+				return False
+			
+			self.revalidating.add(key.identity)
+		
+		return True
+	
+	def relinquish(self, key):
+		"""Record that the value for the given key is no longer being regenerated; see ``claim``."""
+		
+		with self._lock:
+			self.revalidating.discard(key.identity)
+	
+	def generate(self, backend, key, wrapped, args, kw):
+		"""Call the wrapped function and store the result, returning a ``(value, expires)`` tuple.
+		
+		If configured with a lease duration, first attempt to acquire a lease from the backend.  If another process
+		holds the lease, wait for it to store the value, falling back on generating it here if the lease lapses.
+		"""
+		
+		token = backend.lease(key, self.lease) if self.lease else None
+		
+		if self.lease and token is None:
+			try:
+				return self.wait(backend, key)
+			except CacheMiss:
+				pass
+		
+		try:
+			value, stored, expires = self.package(self.compute(wrapped, args, kw, key.prefix), key.prefix)
+			
+			try:
+				backend.set(key, stored, expires)
+			except Exception:
+				self.failed(key.prefix)
+				raise
+		
+		finally:
+			if token is not None:
+				backend.release(key, token)
+		
+		return value, expires
+	
+	def package(self, value, prefix):
+		"""Prepare a newly computed value for storage, returning a ``(value, stored, expires)`` tuple.
+		
+		The value is encoded, see ``encode``, and its expiry time determined, see ``lifetime``.
+		"""
+		
+		value, stored = self.encode(value)
+		
+		if self.manager.STATS is not None:
+			self.manager.STATS.size(prefix, stored)
+		
+		return value, stored, self.lifetime(value)
+	
+	def compute(self, wrapped, args, kw, prefix=None):
+		"""Call the wrapped function, updating the moving average of the time taken to do so.
+		
+		Exceptions of the classes given as ``exceptions`` are returned, as ``Raised`` instances, rather than raised.
+		"""
+		
+		start = time()
+		
+		try:
+			value = wrapped(*args, **kw)
+		except self.exceptions as e:
+			value = Raised(e)
+		
+		self.measure(time() - start, prefix)
+		
+		return value
+	
+	def measure(self, duration, prefix=None):
+		"""Record the time taken to generate a value, in seconds, within the moving average and statistics."""
+		
+		self.delta = duration if self.delta is None else (self.delta * 0.8 + duration * 0.2)
+		
+		if self.manager.STATS is not None:
+			self.manager.STATS.observe(prefix or self.prefix, 'compute', duration)
+	
+	def encode(self, value):
+		"""Encode a value using the configured codec, if any.
+		
+		Returns a ``(value, stored)`` tuple of the value as it will be returned by a hit, and the form to store.
+		"""
+		
+		codec = self.manager.CODEC if self.codec is None else self.codec
+		
+		if isinstance(value, Raised):
+			return value, (codec.encode(value.record()) if codec else value.record())
+		
+		if not codec:
+			return value, value
+		
+		stored = codec.encode(value)
+		return codec.roundtrip(value, stored), stored
+	
+	def restore(self, value):
+		"""Decode a retrieved value, restoring cached exceptions; those this mark does not cache raise ``CacheMiss``."""
+		
+		value = decode(value)
+		
+		if type(value) is dict and Raised.FIELD in value:
+			return Raised.restore(value, self.exceptions)
+		
+		return value
+	
+	def result(self, value):
+		"""Return a value, or raise it if a cached exception."""
+		
+		if isinstance(value, Raised):
+			value.throw()
+		
+		return value
+	
+	def wait(self, backend, key):
+		"""Poll for a value, with exponential backoff, for no longer than the lease duration."""
+		
+		for delay in self.backoff():
+			sleep(delay)
+			
+			try:
+				value, expires = backend.get(key, detail=True)
+				return self.restore(value), expires
+			except CacheMiss:
+				pass
+		
+		raise CacheMiss()
+	
+	def backoff(self):
+		"""Generate the successive delays between polls for a value, ending once the lease duration has elapsed."""
+		
+		deadline = time() + self.lease.total_seconds()
+		delay = self.BACKOFF[0]
+		
+		while True:
+			yield min(delay, max(deadline - time(), 0))
+			
+			if time() >= deadline:
+				return
+			
+			delay = min(delay * 2, self.BACKOFF[1])
+	
+	def migrate(self, backend, key, arguments):
+		"""Locate a value stored under the legacy form of a key, carrying it forward to the current form.
+		
+		Returns a ``(value, expires)`` tuple, raising ``CacheMiss`` if no such value exists.
+		"""
+		
+		legacy = self.legacy(key, arguments)
+		value, expires = backend.get(legacy, detail=True)
+		
+		backend.set(key, value, expires)
+		backend.delete(legacy)
+		
+		return value, expires
+	
+	def legacy(self, key, arguments):
+		"""The legacy form of a key, raising ``CacheMiss`` if values stored under it can not be used."""
+		
+		if self.tags:  # Legacy keys predate tags, so values stored under them can not be known to be current.
+			raise CacheMiss()
+		
+		return Key.new(key.prefix, key.reference, *arguments, legacy=True)
 
 
 # ## Primary Class
@@ -97,47 +1008,307 @@ class Cache(Document):
 	# ### Constants
 	
 	DEFAULT_DELTA = timedelta(weeks=1, days=0, hours=0, minutes=0, seconds=0)
+	LOCAL = None  # A LocalCache (or SharedCache) used by all marks not explicitly configuring or disabling a local tier.
+	BACKEND = None  # A storage backend used by all marks not explicitly configuring one, instead of this collection.
+	ASYNC_BACKEND = None  # An asynchronous backend used by marks on coroutine functions not explicitly configuring one.
+	CODEC = None  # A Serializer used by marks not explicitly configuring a codec, rather than storing values natively.
+	LEGACY_KEYS = False  # Generate keys from pretty-printed arguments, for compatibility with values cached prior to 1.1.
+	MIGRATE_KEYS = False  # On a miss, look for a value stored under the legacy key, carrying it forward if found.
+	COMPACT = False  # Store records under compact binary identifiers; see MongoBackend and marrow.cache.migrate.
+	
+	EXECUTOR = None  # The concurrent.futures executor used to regenerate values in the background; created on demand.
+	STATS = None  # A Stats instance collecting measurements of cache activity, by prefix; disabled if None.
+	TAGS = Generations()  # The generations of the tags used by marks, cached in-process; see marrow.cache.tag.
+	REFRESH = Refresher()  # Merges the extensions of expiry made by marks refreshing by threshold; None to apply each.
+	HOT = None  # A HotKeys instance counting the keys of calls, to preload at the next start; see marrow.cache.warm.
+	
+	_raw = None  # The MongoBackend used to access the collection directly; see Cache.raw().
 	
 	# ### Fields
 	
 	key = EmbeddedDocumentField(CacheKey, db_field='_id', primary_key=True)
 	value = DynamicField(db_field='v')
 	expires = DateTimeField(db_field='e', default=lambda: utcnow() + timedelta(weeks=1))
+	accessed = DateTimeField(db_field='a')  # Recorded only when bounded; see marrow.cache.backend.evict.
 	
 	# ### Magic Methods
 	
 	def __repr__(self):
 		return 'Cache({1.prefix}, {1.reference}, {1.hash}, {0.expires})'.format(self, self.key if self.key else CacheKey())
 	
+	# ### Administration
+	
+	@classmethod
+	def ensure_indexes(cls):
+		"""Ensure the indexes on this collection, and on the companion collections used for leases and chunks, exist."""
+		
+		super(Cache, cls).ensure_indexes()
+		cls.raw().ensure_indexes()
+	
+	@classmethod
+	def drop_collection(cls):
+		"""Drop this collection, along with the companion collections used for leases and chunks."""
+		
+		backend = cls.raw()
+		backend.leases.drop()
+		backend.chunks.drop()
+		
+		super(Cache, cls).drop_collection()
+	
 	# ### Basic Accessors
 	
 	@classmethod
-	def get(cls, criteria, refresh=None):
-		""""""
+	def raw(cls):
+		"""A MongoBackend instance operating directly on the collection backing this document class."""
 		
-		# TODO: Upserts, baby!  Benchmark first, of course.
-		# TODO: deque enable/disable context manager glue
+		collection = cls._get_collection()
+		backend = cls._raw
 		
-		result = cls.objects(pk=criteria).scalar('expires', 'value').first()
+		distinguish = cls.STATS is not None  # Counting expired values separately requires another round trip per miss.
 		
-		if not result:
-			raise CacheMiss()
+		if (backend is None or backend.collection is not collection or backend.compact != bool(cls.COMPACT) or
+				backend.distinguish != distinguish):
+			backend = cls._raw = MongoBackend(collection, compact=cls.COMPACT, distinguish=distinguish)
 		
-		if result[0].replace(tzinfo=None) < utcnow():
-			cls.objects(pk=criteria).delete(write_concern={'w': 0})
-			raise CacheMiss()
+		return backend
+	
+	@classmethod
+	def background(cls, fn, *args):
+		"""Call the given function in the background, using the shared executor if available, otherwise a thread."""
+		
+		if ThreadPoolExecutor is None:  # pragma: no cover
+			thread = Thread(target=fn, args=args)
+			thread.daemon = True
+			thread.start()
+			return
+		
+		cls.executor().submit(fn, *args)
+	
+	@classmethod
+	def executor(cls):
+		"""The shared concurrent.futures executor, created on first use."""
+		
+		if cls.EXECUTOR is None:
+			with _executor_lock:
+				if cls.EXECUTOR is None:
+					cls.EXECUTOR = ThreadPoolExecutor(max_workers=4)
+		
+		return cls.EXECUTOR
+	
+	@classmethod
+	def stats(cls):
+		"""A snapshot of the measurements collected by ``Cache.STATS``, by prefix, or an empty dictionary if disabled.
+		
+		See ``marrow.cache.stats`` for the events counted and measurements observed.
+		"""
+		
+		return {} if cls.STATS is None else cls.STATS.snapshot()
+	
+	@classmethod
+	def get(cls, criteria, refresh=None, detail=False):
+		"""Retrieve the value cached under the given key, raising CacheMiss if absent or expired.
+		
+		The value is retrieved, and optionally refreshed, in a single round trip without document construction.  If
+		``detail`` is truthy a ``(value, expires)`` tuple is returned instead of the bare value.
+		"""
+		
+		stats = cls.STATS
+		
+		if stats is None:
+			return cls.native(cls.raw().get(criteria, refresh, detail), detail)
+		
+		start = time()
+		
+		try:
+			return cls.native(cls.raw().get(criteria, refresh, detail), detail)
+		finally:
+			stats.observe(criteria.prefix, 'get', time() - start)
+	
+	@classmethod
+	def native(cls, value, detail=False):
+		"""Convert a stored value, or ``(value, expires)`` tuple if ``detail`` is truthy, back into its Python form.
+		
+		Hits skip document construction, so embedded documents (and containers of them) are restored through the value
+		field here, returning them as the initial miss did.  Scalar values are returned untouched.
+		"""
 		
-		if refresh:
-			cls.objects(pk=criteria).update(set__expires=refresh(), write_concern={'w': 0})
+		if detail:
+			value, expires = value
+			return cls.native(value), expires
 		
-		return result[1]
+		if isinstance(value, (dict, list)):
+			return cls.value.to_python(value)
+		
+		return value
+	
+	@classmethod
+	def stream(cls, criteria):
+		"""Retrieve a binary value as an iterator of ``bytes``, streaming large values chunk by chunk."""
+		
+		return cls.raw().stream(criteria)
 	
 	@classmethod
 	def set(cls, criteria, value, expires):
-		""""""
+		"""Store a value under the given key, replacing any existing value.
+		
+		Values are stored as given; marks configured with a codec encode values before storing them, ensuring values
+		are returned by hits as they were by the initial miss.
+		"""
+		
+		stats = cls.STATS
+		start = time() if stats is not None else None
+		record = cls(pk=criteria if isinstance(criteria, CacheKey) else criteria.document(), value=value,
+				expires=expires)
+		document = record.to_mongo()
+		
+		# Replace rather than insert, as an expired record may linger under this key until culled by the TTL index.
+		cls.raw().store(document['_id'], document.get('v'), document['e'])
+		
+		if stats is not None:
+			stats.observe(criteria.prefix, 'set', time() - start)
+		
+		record._created = False
+		return record
+	
+	@classmethod
+	def set_many(cls, entries):
+		"""Store many ``(key, value, expires)`` entries using a single bulk write, replacing any existing values."""
+		
+		documents = [cls(pk=key if isinstance(key, CacheKey) else key.document(), value=value, expires=expires).to_mongo()
+				for key, value, expires in entries]
+		cls.raw().store_many((i['_id'], i.get('v'), i['e']) for i in documents)
+	
+	def _delete(cls, criteria):
+		"""Remove the value cached under the given key, if present."""
+		
+		cls.raw().delete(criteria)
+	
+	# Accessed through the class this is the storage backend protocol method; through an instance, Document.delete.
+	delete = hybridmethod(_delete, Document.delete)
+	
+	@classmethod
+	def invalidate(cls, target=None, prefix=None, reference=None):
+		"""Remove cached values in bulk, returning the number removed.
+		
+		Given a callable decorated using ``memoize`` or ``method``, remove all values cached for it, from whichever
+		backend it uses.  Otherwise remove all values cached under the given ``prefix``, relating to the given
+		``reference`` document, or both, from the ``Cache.BACKEND`` (or this collection).  Matching values are also
+		removed from the ``Cache.LOCAL`` tier of this process.  To remove the value cached for a single call, call the
+		``invalidate`` method of the decorated callable with the same arguments.
+		
+		Values are removed in batches using the indexes created by ``ensure_indexes``.  For coroutine functions, the
+		result must be awaited.
+		"""
+		
+		if isinstance(target, (CacheKey, Key)):  # The storage backend protocol method.
+			return cls.raw().invalidate(target)
+		
+		if target is not None:
+			return target.mark.invalidate(target.__wrapped__)
 		
-		# TODO: Pipe out to SON and back to ensure consistent return types.
-		return cls(pk=criteria, value=value, expires=expires).save(force_insert=True, write_concern={'w': 0})
+		key = CacheKey(prefix=prefix, reference=reference)
+		forget(matches(key))
+		
+		if cls.LOCAL is not None:
+			cls.LOCAL.invalidate(matches(key))
+		
+		return (cls.BACKEND or cls.raw()).invalidate(key)
+	
+	@classmethod
+	def bump(cls, *tags, **kw):
+		"""Invalidate all values depending upon any of the given tags, using a single write.
+		
+		Tags are bumped within the ``Cache.BACKEND`` (or this collection) unless another ``backend`` is given; marks
+		configuring their own backend store tag generations there.
+		"""
+		
+		backend = kw.pop('backend', None) or cls.BACKEND or cls
+		cls.TAGS.bump(backend, tags)
+	
+	@classmethod
+	def get_many(cls, criteria, detail=False):
+		"""Retrieve the values cached under any of the given keys.
+		
+		Returns a dictionary mapping the ``identity`` of each key found to its value, or ``(value, expires)`` tuple if
+		``detail`` is truthy.  Missing and expired keys are omitted.
+		"""
+		
+		return {identity: cls.native(value, detail) for identity, value in cls.raw().get_many(criteria, detail).items()}
+	
+	@classmethod
+	def touch(cls, criteria, expires):
+		"""Update the expiry time of the value cached under the given key, if present."""
+		
+		cls.raw().touch(criteria, expires)
+	
+	@classmethod
+	def touch_many(cls, entries):
+		"""Extend the expiry times of many ``(key, expires)`` entries using a single bulk write, never shortening them."""
+		
+		cls.raw().touch_many(entries)
+	
+	@classmethod
+	def usage(cls, prefix=None, size=True):
+		"""Measure the number of values stored under a prefix (or in total), and their size in bytes if ``size``."""
+		
+		return cls.raw().usage(prefix, size)
+	
+	@classmethod
+	def sample(cls, prefix, count):
+		"""Randomly sample up to ``count`` stored values, returning ``(identifier, accessed)`` tuples."""
+		
+		return cls.raw().sample(prefix, count)
+	
+	@classmethod
+	def evict(cls, handles):
+		"""Remove the values with the given identifiers, as produced by ``sample``, returning the number removed."""
+		
+		return cls.raw().evict(handles)
+	
+	@classmethod
+	def access(cls, entries):
+		"""Record the last access times of many ``(key, accessed)`` entries, for use by eviction."""
+		
+		cls.raw().access(entries)
+	
+	@classmethod
+	def scan(cls, prefix=None, since=None, limit=None, keys=None):
+		"""Stream unexpired values as ``(identity, value, expires)`` tuples, as stored; see ``warm``."""
+		
+		return cls.raw().scan(prefix, since, limit, keys)
+	
+	@classmethod
+	def warm(cls, prefix=None, limit=None, since=None, keys=None, local=None, backend=None, stale=None, local_ttl=None):
+		"""Fill an in-process tier with unexpired values streamed from the backend, returning the number loaded.
+		
+		Values may be restricted to those under a ``prefix``, those last accessed no earlier than ``since`` (a datetime,
+		or a number of seconds ago; requires access times be recorded, see ``Bounded``), or exactly the given ``keys``:
+		the path to a file saved by ``HotKeys``, or an iterable of keys in their stored form.  At most ``limit`` are
+		loaded.  The tier filled is the ``Cache.LOCAL`` tier, unless another is given, from ``Cache.BACKEND`` (or this
+		collection) unless another ``backend`` is given.  Values are held in-process only while fresh, as they would be by
+		marks configured with the same ``stale`` and ``local_ttl``.  See ``marrow.cache.warm``.
+		"""
+		
+		from .warm import warm  # Avoid a circular import; that module depends upon this one.
+		
+		local = cls.LOCAL if local is None else local
+		
+		if local is None:
+			raise ValueError("There is no in-process tier to warm; assign Cache.LOCAL or pass one as local.")
+		
+		return warm(backend or cls.BACKEND or cls, local, prefix, limit, since, keys, stale, local_ttl)
+	
+	@classmethod
+	def lease(cls, criteria, duration):
+		"""Attempt to acquire an exclusive lease on generating the value for the given key, returning a token."""
+		
+		return cls.raw().lease(criteria, duration)
+	
+	@classmethod
+	def release(cls, criteria, token):
+		"""Release a lease previously acquired using ``lease``."""
+		
+		cls.raw().release(criteria, token)
 	
 	# ### Decorators
 	
@@ -152,7 +1323,7 @@ class Cache(Document):
 		return generate_expiry_inner
 	
 	@classmethod
-	def memoize(cls, prefix=None, reference=None, expires=utcnow, weeks=0, days=0, hours=0, minutes=0, seconds=0, refresh=False, populate=True):
+	def memoize(cls, prefix=None, reference=None, expires=utcnow, weeks=0, days=0, hours=0, minutes=0, seconds=0, refresh=False, populate=True, local=None, local_ttl=None, backend=None, coalesce=False, lease=None, stale=None, early=None, codec=None, compress=None, tags=None, exceptions=(), exception_ttl=None, empty=None, empty_ttl=None):
 		""""""
 		
 		return CacheMark(
@@ -161,15 +1332,31 @@ class Cache(Document):
 				prefix,
 				False if reference is None else reference,
 				refresh,
-				populate
+				populate,
+				local = local,
+				local_ttl = local_ttl,
+				backend = backend,
+				coalesce = coalesce,
+				lease = lease,
+				stale = stale,
+				early = early,
+				codec = codec,
+				compress = compress,
+				tags = tags,
+				exceptions = exceptions,
+				exception_ttl = exception_ttl,
+				empty = empty,
+				empty_ttl = empty_ttl
 			)
 	
 	@classmethod
 	def method(cls, *attributes, **kw):
 		""""""
 		
+		values = getter(attributes)  # Compiled once, rather than traversing each attribute path upon every call.
+		
 		def method_args_callback(instance, args, kw):
-			return (tuple(fetch(instance, i) for i in attributes) + args[1:]), kw
+			return (values(instance) + args[1:]), kw
 		
 		return CacheMark(
 				cls,
@@ -179,19 +1366,48 @@ class Cache(Document):
 				kw.get('reference', True),
 				kw.get('refresh', False),
 				kw.get('populate', True),
-				method_args_callback
+				method_args_callback,
+				local = kw.get('local', None),
+				local_ttl = kw.get('local_ttl', None),
+				backend = kw.get('backend', None),
+				coalesce = kw.get('coalesce', False),
+				lease = kw.get('lease', None),
+				stale = kw.get('stale', None),
+				early = kw.get('early', None),
+				codec = kw.get('codec', None),
+				compress = kw.get('compress', None),
+				tags = kw.get('tags', None),
+				track = kw.get('invalidate', False),
+				attributes = attributes,
+				exceptions = kw.get('exceptions', ()),
+				exception_ttl = kw.get('exception_ttl', None),
+				empty = kw.get('empty', None),
+				empty_ttl = kw.get('empty_ttl', None)
 			)
 	
 	# ### Context Managers
 	
 	@staticmethod
-	@contextmanager
+	def scope():
+		"""Memoize the results of calls to decorated callables within this context, as for the duration of a request.
+		
+		Repeated calls within the scope return the same result without consulting any tier or backend.  Scoped to the
+		current thread or asyncio task; see ``marrow.cache.scope`` and its ``ScopeMiddleware`` for WSGI applications.
+		"""
+		
+		return memoized()
+	
+	@staticmethod
 	def disable(target=None):
-		with stack(Document if target is None else target, '__nocache__', True):
-			yield
+		"""Bypass the cache for methods of the given document instance or class (all, by default) within this context.
+		
+		Scoped to the current thread or asyncio task; see ``marrow.cache.scope``.
+		"""
+		
+		return scoped(Document if target is None else target, True)
 	
 	@staticmethod
-	@contextmanager
 	def enable(target=None):
-		with stack(Document if target is None else target, '__nocache__', False):
-			yield
+		"""Use the cache for methods of the given document instance or class (all, by default) within this context."""
+		
+		return scoped(Document if target is None else target, False)
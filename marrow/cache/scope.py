@@ -0,0 +1,182 @@
+# encoding: utf-8
+
+"""Context-local scoping of cache behaviour: bypassing the cache, and memoizing results within a request.
+
+``Cache.disable`` and ``Cache.enable`` record the targets they apply to within the current context, rather than upon
+the targets themselves, so that each thread and each asyncio task scopes caching independently of the others::
+
+	with Cache.disable():  # Bypass the cache for all documents, within this thread or task only.
+		with Cache.enable(Account):  # ...other than accounts.
+			...
+
+Scopes nest.  Where several apply to a document, the most specific wins: one targeting the instance itself, then one
+targeting its class, then its nearest ancestor, and so on; of those with the same target, the innermost wins.
+
+Within ``Cache.scope``, the results of calls to decorated callables are additionally memoized in a dictionary by the
+identity of their keys, so that repeated calls need not consult any tier or backend; the dictionary is discarded at
+the end of the scope.  Values generated within the scope are stored as usual.  ``ScopeMiddleware`` wraps a WSGI
+application, scoping each request::
+
+	app = ScopeMiddleware(app)
+
+Results are shared by every call within the scope, rather than copied; do not mutate them.  Values invalidated within
+the scope by ``Cache.invalidate`` or a decorated callable's ``invalidate`` are forgotten, those invalidated by other
+processes are not.
+
+Contexts are tracked using ``contextvars`` where available (Python 3.7 and later), otherwise per thread.  New threads,
+including those of executors, begin with no scopes; asyncio tasks begin with those of the code creating them, sharing
+the memoized results of any ``Cache.scope`` they were created within.
+"""
+
+# ## Imports
+
+from __future__ import unicode_literals
+
+from threading import local
+
+from .util import contextmanager, isclass
+
+try:
+	from contextvars import ContextVar
+except ImportError:  # pragma: no cover
+	ContextVar = None
+
+
+# ## Implementation
+
+class ThreadVar(local):
+	"""The subset of the interface of a ``ContextVar`` used here, storing values per thread."""
+	
+	def __init__(self, name, default=None):
+		self.name = name
+		self.default = default
+	
+	def get(self):
+		return getattr(self, 'value', self.default)
+	
+	def set(self, value):
+		token = self.get()
+		self.value = value
+		return token
+	
+	def reset(self, token):
+		self.value = token
+
+
+SCOPES = (ContextVar or ThreadVar)(str('marrow.cache.scopes'), default=())  # ((target, disabled), ...), innermost last
+MEMO = (ContextVar or ThreadVar)(str('marrow.cache.memo'), default=None)  # {identity: value} within Cache.scope
+
+
+@contextmanager
+def scoped(target, disabled):
+	"""Disable (or, if not ``disabled``, enable) caching for the given target within the current context."""
+	
+	token = SCOPES.set(SCOPES.get() + ((target, disabled), ))
+	
+	try:
+		yield
+	finally:
+		SCOPES.reset(token)
+
+
+@contextmanager
+def memoized():
+	"""Memoize the results of calls within the current context, yielding the dictionary used.
+	
+	Nested scopes share the dictionary of the outermost.
+	"""
+	
+	memo = MEMO.get()
+	
+	if memo is not None:
+		yield memo
+		return
+	
+	memo = {}
+	token = MEMO.set(memo)
+	
+	try:
+		yield memo
+	finally:
+		MEMO.reset(token)
+
+
+def forget(predicate):
+	"""Remove the results memoized within the current context whose key identities satisfy the given predicate."""
+	
+	memo = MEMO.get()
+	
+	if memo:
+		for identity in [i for i in memo if predicate(i)]:
+			del memo[identity]
+
+
+def vetoed(instance):
+	"""Determine if caching has been disabled for the given instance within the current context."""
+	
+	scopes = SCOPES.get()
+	
+	if not scopes:  # The common case.
+		return False
+	
+	mro = type(instance).__mro__
+	best = None  # (rank, disabled); lower ranks are more specific.
+	
+	for target, disabled in scopes:
+		if target is instance:
+			rank = -1
+		elif isclass(target) and target in mro:
+			rank = mro.index(target)
+		else:
+			continue
+		
+		if best is None or rank <= best[0]:
+			best = (rank, disabled)
+	
+	return best is not None and best[1]
+
+
+class ScopeMiddleware(object):
+	"""WSGI middleware memoizing the results of calls to decorated callables for the duration of each request.
+	
+	The scope lasts until the response has been iterated and closed, covering responses generated lazily.
+	"""
+	
+	def __init__(self, application):
+		self.application = application
+	
+	def __call__(self, environ, start_response):
+		if MEMO.get() is not None:  # Already within a scope.
+			return self.application(environ, start_response)
+		
+		token = MEMO.set({})
+		
+		try:
+			response = self.application(environ, start_response)
+		except BaseException:
+			MEMO.reset(token)
+			raise
+		
+		return ScopedResponse(response, token)
+
+
+class ScopedResponse(object):
+	"""A WSGI response iterable ending the scope of the request it was produced within when closed."""
+	
+	def __init__(self, response, token):
+		self.response = response
+		self.token = token
+	
+	def __iter__(self):
+		return iter(self.response)
+	
+	def close(self):
+		try:
+			if hasattr(self.response, 'close'):
+				self.response.close()
+		
+		finally:
+			try:
+				MEMO.reset(self.token)
+			except ValueError:  # Closed within another context; the scope ended with that of the request.
+				pass
@@ -0,0 +1,348 @@
+# encoding: utf-8
+
+"""A host-local cache tier shared by every process mapping the same file, such as the workers of a pre-fork server.
+
+Values are stored in a memory-mapped file divided into fixed-size slots, grouped into sets of ``ways`` slots.  A key
+is hashed to a set and may occupy any slot within it, found by probing the slots of that set in turn.  Each slot
+begins with a header::
+
+	sequence (uint32) | fingerprint (16 bytes) | expires (double, seconds since the epoch; 0 for never) | length (uint32)
+	| prefix (uint64) | reference (uint64)
+
+followed by the pickled ``(key, value)`` pair.  Where the key is an ``identity``, the prefix and reference fields hold
+hashes of its prefix and reference (otherwise zero), allowing invalidation to pass over the values of other prefixes
+and references without unpickling their keys.  Readers never block: slots are protected by sequence locks, writers
+making the sequence odd while writing and even again once done, readers retrying (a few times, then treating the
+value as missing) if the sequence was odd or changed while they read.  Writers exclude one another using byte-range
+locks on the file, striped across sets.  As such locks are held by a process rather than a thread, each stripe also
+has an in-process lock, excluding other threads; writers to different stripes proceed concurrently.
+
+When a set is full the value expiring soonest is replaced.  Values larger than a slot are not stored.
+"""
+
+# ## Imports
+
+from __future__ import unicode_literals
+
+import os
+
+from mmap import mmap
+from random import randrange
+from struct import Struct
+
+from .exc import CacheMiss
+from .codec import SUBTYPE, Binary, Serializer, decode
+from .util import Lock, as_delta, datetime, sha256, time, utcnow
+
+try:
+	from fcntl import lockf, LOCK_EX, LOCK_UN
+except ImportError:  # pragma: no cover
+	lockf = None
+
+
+# ## Constants
+
+MAGIC = b'MCSC'
+VERSION = 2
+HEADER = Struct(str('<4sHHII'))  # magic, version, ways, slots, slot size
+SLOT = Struct(str('<I16sdIQQ'))  # sequence, fingerprint, expires, length, prefix, reference
+SEQUENCE = Struct(str('<I'))
+BUCKET = Struct(str('<Q'))  # The leading bytes of a fingerprint, selecting the set of slots a key may occupy.
+EMPTY = b'\0' * 16
+EPOCH = datetime(1970, 1, 1)
+
+
+# ## Implementation
+
+class SharedCache(object):
+	"""A cache tier stored in a memory-mapped file, shared by all processes on a host opening the same ``path``.
+	
+	The file is created if missing, holding ``slots`` slots of ``slot`` bytes each after a 16 byte header; a file
+	already in use retains the geometry it was created with.  Each slot must exceed its own header, and ``slots`` be
+	at least ``ways``, the number of slots in each set.  Place it on a memory-backed filesystem, such as
+	``/dev/shm``, to avoid writes reaching disk.  The interface is that of ``LocalCache``, for use as ``Cache.LOCAL``
+	or a mark's ``local`` tier, so that any worker may retrieve a value another has computed::
+	
+		Cache.LOCAL = SharedCache('/dev/shm/app-cache', slots=65536, slot=4096)
+	
+	Keys must have a stable ``repr`` from process to process, as ``CacheKey.identity`` does.  Values are pickled,
+	compressed if at least ``threshold`` bytes, and must be unpickled on each retrieval; this costs more than a
+	``LocalCache`` hit, far less than a round trip to MongoDB.  Requires a POSIX platform.
+	"""
+	
+	def __init__(self, path, slots=65536, slot=4096, ways=8, stripes=64, ttl=None, threshold=None, retries=16):
+		if lockf is None:  # pragma: no cover
+			raise NotImplementedError("Shared caching requires a POSIX platform, for fcntl.")
+		
+		if not 0 < ways <= slots:
+			raise ValueError("The number of slots must be at least the number of ways, itself positive.")
+		
+		if slot <= SLOT.size:
+			raise ValueError("Slots must be larger than their {0} byte header.".format(SLOT.size))
+		
+		self.path = path
+		self.stripes = stripes
+		self.ttl = as_delta(ttl)
+		self.retries = retries
+		self.serializer = Serializer('pickle', threshold)
+		
+		self._locks = [Lock() for stripe in range(stripes)]  # Byte-range locks do not exclude threads of a process.
+		self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+		
+		lockf(self._fd, LOCK_EX, HEADER.size, 0)
+		
+		try:
+			header = os.read(self._fd, HEADER.size)
+			
+			if len(header) < HEADER.size:  # A new file; none in use is shorter than its header.
+				slots -= slots % ways
+				header = HEADER.pack(MAGIC, VERSION, ways, slots, slot)
+				os.ftruncate(self._fd, HEADER.size + slots * slot)
+				os.lseek(self._fd, 0, os.SEEK_SET)
+				os.write(self._fd, header)
+			
+			magic, version, self.ways, self.slots, self.slot = HEADER.unpack(header)
+		
+		finally:
+			lockf(self._fd, LOCK_UN, HEADER.size, 0)
+		
+		if magic != MAGIC or version != VERSION:
+			os.close(self._fd)
+			raise ValueError("Not a shared cache file, or one of an incompatible version: " + path)
+		
+		self.capacity = self.slot - SLOT.size  # The largest value, once pickled, that may be stored.
+		self.sets = self.slots // self.ways
+		self._map = mmap(self._fd, HEADER.size + self.slots * self.slot)
+		
+		super(SharedCache, self).__init__()
+	
+	def __repr__(self):
+		return 'SharedCache({0}, {1} slots of {2} bytes)'.format(self.path, self.slots, self.slot)
+	
+	def __len__(self):
+		now = time()
+		count = 0
+		
+		for index in range(self.slots):
+			sequence, fingerprint, expires, length = SLOT.unpack_from(self._map, self._offset(index))[:4]
+			count += length and (not expires or expires > now)
+		
+		return count
+	
+	def __contains__(self, key):
+		try:
+			self.get(key)
+		except CacheMiss:
+			return False
+		
+		return True
+	
+	def _offset(self, index):
+		return HEADER.size + index * self.slot
+	
+	def _locate(self, key):
+		"""Return the fingerprint of a key and the index of the first slot of its set."""
+		
+		fingerprint = sha256(repr(key).encode('utf8')).digest()[:16]
+		return fingerprint, (BUCKET.unpack_from(fingerprint)[0] % self.sets) * self.ways
+	
+	def _tag(self, part):
+		"""Hash the prefix or reference of an identity for its slot header; zero is reserved for keys of other forms."""
+		
+		return BUCKET.unpack_from(sha256(repr(part).encode('utf8')).digest())[0] or 1
+	
+	def _tags(self, key):
+		if type(key) is not tuple or len(key) != 3:
+			return 0, 0
+		
+		return self._tag(key[0]), self._tag(key[1])
+	
+	def _load(self, data):
+		"""Unpickle the ``(key, value)`` pair stored in a slot."""
+		
+		return decode(Binary(data, SUBTYPE))
+	
+	def _read(self, index):
+		"""Consistently read a slot, returning ``(fingerprint, expires, data)``, or ``None`` if written throughout."""
+		
+		mapped = self._map
+		offset = self._offset(index)
+		
+		for attempt in range(self.retries):
+			sequence, fingerprint, expires, length = SLOT.unpack_from(mapped, offset)[:4]
+			
+			if sequence & 1:
+				continue
+			
+			data = mapped[offset + SLOT.size:offset + SLOT.size + min(length, self.capacity)]
+			
+			if SEQUENCE.unpack_from(mapped, offset)[0] == sequence:
+				return fingerprint, expires, data
+		
+		return None
+	
+	def _write(self, index, fingerprint=EMPTY, expires=0.0, data=b'', tags=(0, 0)):
+		"""Write a slot, or empty it.  The stripe holding the slot must be locked by the caller."""
+		
+		mapped = self._map
+		offset = self._offset(index)
+		sequence = SEQUENCE.unpack_from(mapped, offset)[0]
+		
+		SEQUENCE.pack_into(mapped, offset, (sequence + 1) & 0xFFFFFFFF)
+		mapped[offset + SLOT.size:offset + SLOT.size + len(data)] = data
+		SLOT.pack_into(mapped, offset, (sequence + 1) & 0xFFFFFFFF, fingerprint, expires, len(data), *tags)
+		SEQUENCE.pack_into(mapped, offset, (sequence + 2) & 0xFFFFFFFF)
+	
+	def _stripe(self, first):
+		return _Stripe(self, (first // self.ways) % self.stripes)
+	
+	def get(self, key):
+		"""Retrieve a value, raising ``CacheMiss`` if it is not present or has expired."""
+		
+		fingerprint, first = self._locate(key)
+		now = time()
+		
+		for index in range(first, first + self.ways):
+			record = self._read(index)
+			
+			if record is None or record[0] != fingerprint:
+				continue
+			
+			if record[1] and record[1] <= now:
+				break
+			
+			stored, value = self._load(record[2])
+			
+			if stored == key:
+				return value
+		
+		raise CacheMiss()
+	
+	def set(self, key, value, expires=None, ttl=None):
+		"""Store a value, replacing that expiring soonest within its set if full.
+		
+		The local expiry is the earlier of the given ``expires`` time and the current time plus the ``ttl`` (or the
+		default configured for this tier).  Values larger than a slot, once pickled, are not stored.
+		"""
+		
+		ttl = as_delta(ttl) if ttl is not None else self.ttl
+		
+		if ttl is not None:
+			limit = utcnow() + ttl
+			expires = limit if expires is None else min(expires.replace(tzinfo=None), limit)
+		
+		data = bytes(self.serializer.encode((key, value)))
+		
+		if len(data) > self.capacity:
+			return value
+		
+		expires = (expires.replace(tzinfo=None) - EPOCH).total_seconds() if expires is not None else 0.0
+		fingerprint, first = self._locate(key)
+		now = time()
+		
+		with self._stripe(first):
+			chosen = soonest = None
+			
+			for index in range(first, first + self.ways):
+				current, deadline, length = SLOT.unpack_from(self._map, self._offset(index))[1:4]
+				
+				if current == fingerprint or not length or (deadline and deadline <= now):
+					chosen = index
+					
+					if current == fingerprint:
+						break
+				
+				elif chosen is None and deadline and (soonest is None or deadline < soonest[1]):
+					soonest = (index, deadline)
+			
+			if chosen is None:
+				chosen = soonest[0] if soonest else first + randrange(self.ways)
+			
+			self._write(chosen, fingerprint, expires, data, self._tags(key))
+		
+		return value
+	
+	def delete(self, key):
+		"""Remove a value, if present."""
+		
+		fingerprint, first = self._locate(key)
+		
+		with self._stripe(first):
+			for index in range(first, first + self.ways):
+				if SLOT.unpack_from(self._map, self._offset(index))[1] == fingerprint:
+					self._write(index)
+	
+	def invalidate(self, predicate):
+		"""Remove all values whose keys satisfy the given predicate, returning the number removed.
+		
+		The header of every slot is read.  Predicates produced by ``matches`` identify the prefix and reference sought,
+		and only the keys of values stored under them are unpickled to be tested; given any other predicate, the key
+		of every occupied slot is unpickled, which is relatively expensive.
+		"""
+		
+		prefix, reference = (getattr(predicate, name, None) for name in ('prefix', 'reference'))
+		prefix = self._tag(prefix) if prefix is not None else None
+		reference = self._tag(reference) if reference is not None else None
+		count = 0
+		
+		for first in range(0, self.slots, self.ways):
+			for index in range(first, first + self.ways):
+				sequence, fingerprint, expires, length, tagged, referenced = SLOT.unpack_from(self._map,
+						self._offset(index))
+				
+				if not sequence & 1:  # Slots being written are read in full.
+					if not length or (tagged and ((prefix and tagged != prefix) or (reference and referenced != reference))):
+						continue  # Empty, or certainly of another prefix or reference.
+				
+				record = self._read(index)
+				
+				if record is None or not record[2] or not predicate(self._load(record[2])[0]):
+					continue
+				
+				with self._stripe(first):
+					if SLOT.unpack_from(self._map, self._offset(index))[1] == record[0]:
+						self._write(index)
+						count += 1
+		
+		return count
+	
+	def clear(self):
+		"""Remove all values."""
+		
+		for first in range(0, self.slots, self.ways):
+			with self._stripe(first):
+				for index in range(first, first + self.ways):
+					if SLOT.unpack_from(self._map, self._offset(index))[3]:
+						self._write(index)
+	
+	def close(self):
+		"""Unmap the file.  Other processes continue to use it; remove it only once none do."""
+		
+		self._map.close()
+		os.close(self._fd)
+
+
+class _Stripe(object):
+	"""Exclude other writers, in this process and others, from a stripe of sets."""
+	
+	__slots__ = ('cache', 'offset', 'lock')
+	
+	def __init__(self, cache, stripe):
+		self.cache = cache
+		self.offset = HEADER.size + cache.slots * cache.slot + stripe  # Locks are taken beyond the mapped slots.
+		self.lock = cache._locks[stripe]
+	
+	def __enter__(self):
+		self.lock.acquire()
+		
+		try:
+			lockf(self.cache._fd, LOCK_EX, 1, self.offset)
+		except Exception:
+			self.lock.release()
+			raise
+	
+	def __exit__(self, kind, value, traceback):
+		try:
+			lockf(self.cache._fd, LOCK_UN, 1, self.offset)
+		finally:
+			self.lock.release()
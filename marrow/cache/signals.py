@@ -0,0 +1,105 @@
+# encoding: utf-8
+
+"""Automatic invalidation of the values cached by document methods as their documents change.
+
+Methods decorated using ``Cache.method(..., invalidate=True)`` have the values cached for a document removed when it
+is saved or deleted, using MongoEngine's ``post_save`` and ``post_delete`` signals; this requires the ``blinker``
+package.  Passing ``invalidate='changed'`` instead only does so on save if a field named by the mark's attributes has
+changed.  Values are located by their reference to the document (see ``Cache.invalidate``), so marks must not disable
+``reference``.
+"""
+
+# ## Imports
+
+from __future__ import unicode_literals
+
+from mongoengine import signals
+
+from .backend.base import matches
+from .scope import forget
+from .util import Lock
+
+
+log = __import__('logging').getLogger(__name__)
+
+_tracked = {}  # Document class: the marks of its methods tracking changes.
+_lock = Lock()
+_connected = []
+
+
+# ## Implementation
+
+def connect():
+	"""Connect the signal handlers, once.  Called automatically by marks tracking changes."""
+	
+	if not signals.signals_available:
+		raise ImportError("Automatic invalidation requires the blinker package: pip install 'marrow.cache[signals]'")
+	
+	with _lock:
+		if _connected:
+			return
+		
+		signals.post_save.connect(saved)
+		signals.post_delete.connect(deleted)
+		_connected.append(True)
+
+
+def tracked(cls):
+	"""Return the marks of the methods of the given document class tracking changes to its instances."""
+	
+	marks = _tracked.get(cls)
+	
+	if marks is None:
+		from .model import CachedFunction
+		
+		marks = _tracked[cls] = [value.mark for klass in reversed(cls.__mro__) for value in vars(klass).values()
+				if isinstance(value, CachedFunction) and value.mark.track]
+	
+	return marks
+
+
+def changed(document, attributes):
+	"""Determine if any of the fields named by the given (possibly dotted) attributes have changed."""
+	
+	fields = set(name.split('.')[0] for name in document._get_changed_fields())
+	names = getattr(document, '_db_field_map', {})
+	
+	return any(names.get(attribute.split('.')[0], attribute.split('.')[0]) in fields for attribute in attributes)
+
+
+def saved(sender, document, created=False, **kw):
+	if created:  # Nothing can yet be cached for it.
+		return
+	
+	invalidate(document, [mark for mark in tracked(sender) if mark.track != 'changed' or
+			changed(document, mark.attributes)])
+
+
+def deleted(sender, document, **kw):
+	invalidate(document, tracked(sender))
+
+
+def invalidate(document, marks):
+	"""Remove the values cached by the given marks for a document.
+	
+	The values of each mark are removed by prefix and reference, leaving those of marks not tracking changes (which
+	may also reference the document) in place.
+	"""
+	
+	from .model import CacheKey
+	
+	for mark in marks:
+		key = CacheKey(prefix=mark.prefix, reference=document)
+		
+		forget(matches(key))
+		
+		local = mark.tier()
+		
+		if local is not None:
+			local.invalidate(matches(key))
+		
+		try:
+			(mark.backend or mark.manager.BACKEND or mark.manager).invalidate(key)
+		
+		except Exception:  # The document has been stored; failure to invalidate must not appear otherwise.
+			log.exception("Failed to invalidate values cached for %r.", document)
@@ -0,0 +1,254 @@
+# encoding: utf-8
+
+"""Instrumentation of cache activity, broken down by key prefix.
+
+Collection is disabled by default, and costs a single attribute lookup per call while disabled.  To enable it, assign
+a ``Stats`` instance to ``Cache.STATS``, optionally passing sinks to forward each measurement to as it is made::
+
+	Cache.STATS = Stats([StatsdSink('localhost')])
+
+The following events are counted:
+
+* ``hit``, a value retrieved from the backend.
+* ``local``, a value retrieved from the in-process tier.
+* ``memo``, a result repeated within a ``Cache.scope``.
+* ``miss``, no value was found.
+* ``expired``, a value was found, but had expired; also counted as a miss.  As MongoDB does not return expired
+  records, the ``Cache`` collection checks for one after each miss while statistics are collected.
+* ``refresh``, the expiry of a value was extended on access.
+* ``stale``, a value was served while being regenerated in the background.
+* ``error``, a generated value could not be stored.
+
+And the following measurements are observed, as histograms:
+
+* ``lookup``, the time in seconds taken to retrieve a value (or discover it missing) from the backend.
+* ``compute``, the time in seconds taken to call the decorated function.
+* ``size``, the approximate size in bytes of the values generated.
+* ``get`` and ``set``, the time in seconds taken by the ``Cache.get`` and ``Cache.set`` storage operations.
+
+A sink is any object providing ``count(prefix, event, amount)`` and ``observe(prefix, metric, value)`` methods.
+"""
+
+# ## Imports
+
+from __future__ import unicode_literals
+
+import re
+import socket
+
+from bisect import bisect_left
+
+from .compat import iteritems
+from .local import sizeof
+from .util import Lock
+
+
+log = __import__('logging').getLogger(__name__)
+
+
+# ## Constants
+
+LATENCY = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # Seconds.
+SIZE = tuple(64 * 4 ** i for i in range(10))  # Bytes, from 64B to 16MiB.
+BOUNDS = {'size': SIZE}  # Bucket boundaries by metric name, defaulting to LATENCY.
+UNITS = {'size': 'bytes'}  # Units by metric name, defaulting to seconds, used in Prometheus metric names.
+
+
+# ## Implementation
+
+class Histogram(object):
+	"""A distribution of observed values, counted within buckets of fixed upper bounds.
+	
+	Each value is counted in the first bucket whose bound is equal to or greater than it; the last bucket is unbounded.
+	"""
+	
+	def __init__(self, bounds=LATENCY):
+		self.bounds = tuple(bounds)
+		self.buckets = [0] * (len(self.bounds) + 1)
+		self.count = 0
+		self.total = 0
+		self.min = None
+		self.max = None
+	
+	def __repr__(self):
+		return 'Histogram({0.count} values, mean {1})'.format(self, self.mean)
+	
+	@property
+	def mean(self):
+		return (self.total / float(self.count)) if self.count else None
+	
+	def add(self, value):
+		self.buckets[bisect_left(self.bounds, value)] += 1
+		self.count += 1
+		self.total += value
+		
+		if self.min is None or value < self.min:
+			self.min = value
+		
+		if self.max is None or value > self.max:
+			self.max = value
+	
+	def as_dict(self):
+		return dict(
+				count = self.count,
+				total = self.total,
+				min = self.min,
+				max = self.max,
+				mean = self.mean,
+				buckets = list(zip(self.bounds + (float('inf'), ), self.buckets))
+			)
+
+
+class Stats(object):
+	"""Thread-safe counters and histograms, by key prefix, forwarding each measurement to any sinks given."""
+	
+	def __init__(self, sinks=()):
+		self.sinks = list(sinks)
+		self._lock = Lock()
+		
+		self.reset()
+		
+		super(Stats, self).__init__()
+	
+	def __repr__(self):
+		return 'Stats({0} prefixes)'.format(len(self.counters))
+	
+	def reset(self):
+		"""Discard all measurements collected so far."""
+		
+		with self._lock:
+			self.counters = {}  # prefix: {event: count}
+			self.histograms = {}  # prefix: {metric: Histogram}
+	
+	def count(self, prefix, event, amount=1):
+		"""Count the occurrence of an event."""
+		
+		with self._lock:
+			counters = self.counters.setdefault(prefix, {})
+			counters[event] = counters.get(event, 0) + amount
+		
+		for sink in self.sinks:
+			try:
+				sink.count(prefix, event, amount)
+			except Exception:
+				log.exception("Failed to forward count to sink: %r", sink)
+	
+	def observe(self, prefix, metric, value):
+		"""Record a measurement within the histogram for the given metric."""
+		
+		with self._lock:
+			histograms = self.histograms.setdefault(prefix, {})
+			histogram = histograms.get(metric)
+			
+			if histogram is None:
+				histogram = histograms[metric] = Histogram(BOUNDS.get(metric, LATENCY))
+			
+			histogram.add(value)
+		
+		for sink in self.sinks:
+			try:
+				sink.observe(prefix, metric, value)
+			except Exception:
+				log.exception("Failed to forward measurement to sink: %r", sink)
+	
+	def size(self, prefix, value):
+		"""Observe the approximate size of a generated value, measuring encoded values exactly."""
+		
+		self.observe(prefix, 'size', len(value) if isinstance(value, (bytes, bytearray)) else sizeof(value))
+	
+	def snapshot(self):
+		"""Return a copy of the measurements collected so far, as a dictionary of dictionaries keyed by prefix.
+		
+		Each contains the count of each event occurring, and a dictionary describing each histogram.
+		"""
+		
+		with self._lock:
+			result = dict((prefix, dict(counters)) for prefix, counters in iteritems(self.counters))
+			
+			for prefix, histograms in iteritems(self.histograms):
+				entry = result.setdefault(prefix, {})
+				
+				for metric, histogram in iteritems(histograms):
+					entry[metric] = histogram.as_dict()
+		
+		return result
+	
+	def prometheus(self, namespace='marrow_cache'):
+		"""Render the measurements collected so far using the Prometheus text exposition format."""
+		
+		lines = []
+		snapshot = self.snapshot()
+		events = {}
+		metrics = {}
+		
+		for prefix, entry in sorted(iteritems(snapshot), key=lambda item: item[0] or ''):
+			for name, value in sorted(iteritems(entry)):
+				(metrics if isinstance(value, dict) else events).setdefault(name, []).append((prefix, value))
+		
+		if events:
+			lines.append('# TYPE {0}_events_total counter'.format(namespace))
+		
+		for event, values in sorted(iteritems(events)):
+			for prefix, value in values:
+				lines.append('{0}_events_total{{prefix="{1}",event="{2}"}} {3}'.format(namespace, _label(prefix), event,
+						value))
+		
+		for metric, values in sorted(iteritems(metrics)):
+			name = '{0}_{1}_{2}'.format(namespace, metric, UNITS.get(metric, 'seconds'))
+			lines.append('# TYPE {0} histogram'.format(name))
+			
+			for prefix, histogram in values:
+				label = _label(prefix)
+				total = 0
+				
+				for bound, count in histogram['buckets']:
+					total += count
+					lines.append('{0}_bucket{{prefix="{1}",le="{2}"}} {3}'.format(name, label,
+							'+Inf' if bound == float('inf') else repr(bound), total))
+				
+				lines.append('{0}_sum{{prefix="{1}"}} {2!r}'.format(name, label, histogram['total']))
+				lines.append('{0}_count{{prefix="{1}"}} {2}'.format(name, label, histogram['count']))
+		
+		return '\n'.join(lines) + '\n' if lines else ''
+
+
+class StatsdSink(object):
+	"""Forward measurements to a statsd server over UDP as they are made.
+	
+	Events are sent as counters and measurements as timers (in milliseconds) or histograms (sizes), named
+	``<namespace>.<prefix>.<event or metric>``.
+	"""
+	
+	def __init__(self, host='localhost', port=8125, namespace='marrow.cache'):
+		self.address = (host, port)
+		self.namespace = namespace
+		self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		
+		super(StatsdSink, self).__init__()
+	
+	def __repr__(self):
+		return 'StatsdSink({0[0]}:{0[1]})'.format(self.address)
+	
+	def name(self, prefix, suffix):
+		return '{0}.{1}.{2}'.format(self.namespace, re.sub(r'[^\w.-]+', '_', prefix or 'none'), suffix)
+	
+	def send(self, line):
+		self.socket.sendto(line.encode('utf8'), self.address)
+	
+	def count(self, prefix, event, amount):
+		self.send('{0}:{1}|c'.format(self.name(prefix, event), amount))
+	
+	def observe(self, prefix, metric, value):
+		if metric in UNITS:
+			self.send('{0}:{1}|h'.format(self.name(prefix, metric), value))
+			return
+		
+		self.send('{0}:{1:.3f}|ms'.format(self.name(prefix, metric), value * 1000))
+
+
+# ## Utility Functions
+
+def _label(value):
+	"""Escape a value for use as a Prometheus label value."""
+	
+	return ('' if value is None else value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
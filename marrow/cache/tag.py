@@ -0,0 +1,106 @@
+# encoding: utf-8
+
+"""Tag-based invalidation using generation counters.
+
+Marks may be given ``tags``: names of things the cached values depend upon.  Each tag has a generation, stored in the
+same backend as the values themselves, which is mixed into the hash of every key produced by a tagged mark.  Bumping a
+tag assigns it a new generation using a single write, changing the keys of all dependent values; they are never
+retrieved again, and age out of storage through their expiry times as usual.
+
+Generations are cached in-process for a short time (one second, by default) to avoid a round trip per call, so a tag
+bumped by another process takes effect here within that time.  Tags bumped by this process take effect immediately.
+"""
+
+# ## Imports
+
+from __future__ import unicode_literals
+
+from uuid import uuid4
+
+from .exc import CacheMiss
+from .local import LocalCache
+from .util import as_delta, timedelta, utcnow
+
+
+# ## Implementation
+
+class Generations(object):
+	"""Retrieve and bump the generations of tags, caching them in-process for ``ttl`` seconds.
+	
+	Generations are stored as cached values under the ``PREFIX`` prefix, expiring after ``expires`` (a year, by
+	default) unless bumped; this must exceed the lifetime of any value depending upon them.  Tags never bumped have no
+	stored generation, and do not alter keys.
+	"""
+	
+	PREFIX = 'marrow.cache.tag'
+	
+	def __init__(self, ttl=1, expires=timedelta(days=365)):
+		self.ttl = as_delta(ttl)
+		self.expires = as_delta(expires)
+		self.local = LocalCache(entries=65536, size=None, ttl=self.ttl, sizeof=None)  # (id(backend), tag): generation
+		
+		super(Generations, self).__init__()
+	
+	def __repr__(self):
+		return 'Generations({0} cached)'.format(len(self.local))
+	
+	def key(self, tag):
+		from .model import CacheKey  # Avoid a circular import; the model depends upon this module.
+		
+		return CacheKey(prefix=self.PREFIX, hash=tag)
+	
+	def cached(self, backend, tags):
+		"""Return a dictionary of the generations of the given tags cached in-process, and a list of those missing.
+		
+		Generations are cached separately for each backend, identified by the object itself.
+		"""
+		
+		found = {}
+		missing = []
+		
+		for tag in tags:
+			try:
+				found[tag] = self.local.get((id(backend), tag))
+			except CacheMiss:
+				missing.append(tag)
+		
+		return found, missing
+	
+	def retrieved(self, backend, missing, result):
+		"""Cache in-process the generations retrieved from the backend using ``get_many``, returning a dictionary."""
+		
+		found = {}
+		
+		for tag in missing:
+			found[tag] = generation = result.get(self.key(tag).identity)
+			self.local.set((id(backend), tag), generation)
+		
+		return found
+	
+	def get(self, backend, tags):
+		"""Return the generations of the given tags as a sorted tuple of ``(tag, generation)`` pairs."""
+		
+		found, missing = self.cached(backend, tags)
+		
+		if missing:
+			found.update(self.retrieved(backend, missing, backend.get_many([self.key(tag) for tag in missing])))
+		
+		return self.generations(found)
+	
+	def generations(self, found):
+		"""Produce the sorted tuple of ``(tag, generation)`` pairs mixed into keys, omitting tags never bumped."""
+		
+		return tuple(sorted((tag, generation) for tag, generation in found.items() if generation is not None))
+	
+	def bump(self, backend, tags):
+		"""Assign each tag a new generation, invalidating all values depending upon it."""
+		
+		expires = utcnow() + self.expires
+		entries = [(self.key(tag), uuid4().hex, expires) for tag in tags]
+		
+		backend.set_many(entries)
+		
+		for key, generation, expires in entries:
+			self.local.set((id(backend), key.hash), generation)
+		
+		return entries
@@ -6,12 +6,17 @@ from __future__ import print_function
 
 # ## Imports
 
+from time import time, sleep
+from random import random
+from threading import Lock, Thread
 from warnings import warn
 from weakref import ref
+from copy import copy
 from functools import wraps
+from operator import attrgetter
 from itertools import chain
 from inspect import getmembers, getmodule, isclass, isfunction, ismethod
-from collections import deque
+from collections import deque, OrderedDict
 from contextlib import contextmanager
 from hashlib import sha256
 from datetime import datetime, timedelta
@@ -19,12 +24,96 @@ from pprint import pformat
 from marrow.package.canonical import name as resolve
 from marrow.package.loader import traverse as fetch
 
+from .compat import native, unicode
+
+try:
+	from collections.abc import Sized
+except ImportError:  # pragma: no cover
+	from collections import Sized
+
+try:
+	from inspect import iscoroutinefunction
+except ImportError:  # pragma: no cover
+	iscoroutinefunction = lambda fn: False
+
+try:
+	from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # pragma: no cover
+	ThreadPoolExecutor = None
+
 
 # ## Weird Aliases
 
 utcnow = datetime.utcnow
 
 
+# ## Utility Functions
+
+def as_delta(value):
+	"""Accept a number of seconds or a timedelta, returning a timedelta or None."""
+	
+	if value is None or isinstance(value, timedelta):
+		return value
+	
+	return timedelta(seconds=value)
+
+
+def isempty(value):
+	"""The default test of results considered empty: ``None``, and containers of no length."""
+	
+	return value is None or (isinstance(value, Sized) and not len(value))
+
+
+def getter(attributes):
+	"""Produce a function returning a tuple of the given (possibly dotted) attributes of an object, as per ``fetch``.
+	
+	Where every attribute is a plain path of public attribute names, they are retrieved using a compiled
+	``operator.attrgetter``; failing that, or otherwise, each is retrieved using ``fetch``, which also permits array
+	dereferencing.
+	"""
+	
+	attributes = tuple(attributes)
+	
+	def fetch_all(instance):
+		return tuple(fetch(instance, i) for i in attributes)
+	
+	if not attributes:
+		return lambda instance: ()
+	
+	if not all(isinstance(i, (native, unicode)) and all(part and not part.startswith('_') and
+			not part.lstrip('-').isdigit() for part in i.split('.')) for i in attributes):
+		return fetch_all
+	
+	get = attrgetter(*attributes)
+	single = len(attributes) == 1
+	
+	def get_all(instance):
+		try:
+			value = get(instance)
+		except AttributeError:
+			return fetch_all(instance)
+		
+		return (value, ) if single else value
+	
+	return get_all
+
+
+# ## Descriptors
+
+class hybridmethod(object):
+	"""Dispatch to one function when accessed through a class, and to another when accessed through an instance."""
+	
+	def __init__(self, for_class, for_instance):
+		self.for_class = for_class
+		self.for_instance = for_instance
+	
+	def __get__(self, instance, owner):
+		if instance is None:
+			return self.for_class.__get__(owner, type(owner))
+		
+		return self.for_instance.__get__(instance, owner)
+
+
 # ## Context Managers
 
 @contextmanager
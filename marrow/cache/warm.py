@@ -0,0 +1,190 @@
+# encoding: utf-8
+
+"""Warming of in-process tiers, and the recording of the hot keys worth warming.
+
+After a restart each process begins with an empty in-process tier, and every hot key is retrieved from the backend
+again, at once.  ``Cache.warm`` fills a tier in advance, streaming unexpired values from the backend: all of them, those
+under a prefix, those accessed recently (where access times are recorded; see ``Bounded``), or exactly those keys
+recorded as hot by a previous process::
+
+	Cache.HOT = HotKeys('/var/run/app/hot-keys.json')  # Saved at process exit.
+	
+	Cache.LOCAL = LocalCache()
+	Cache.warm(keys='/var/run/app/hot-keys.json')
+
+Values are retrieved in batches and decoded one at a time as they are streamed.  Chunked values, and exceptions cached
+by marks (see ``CacheMark.restore``), are not warmed.
+
+The same streaming is available from the command line, where it pulls the values into the server's own working set
+and reports on their number and size::
+
+	python -m marrow.cache.warm --mongo mongodb://localhost/app --prefix app.search --since 3600
+"""
+
+# ## Imports
+
+from __future__ import unicode_literals, print_function
+
+import sys
+
+from argparse import ArgumentParser
+from atexit import register
+from datetime import datetime
+
+from bson.json_util import dumps, loads
+
+from .codec import decode
+from .local import sizeof
+from .model import Cache, Raised
+from .compat import unicode
+from .util import Lock, as_delta, utcnow, time
+
+
+log = __import__('logging').getLogger(__name__)
+
+
+# ## Implementation
+
+class HotKeys(object):
+	"""Count the keys of calls made to decorated callables, retaining the most frequently used.
+	
+	Assign an instance to ``Cache.HOT`` to record.  At most ``capacity`` keys are retained, those less frequently used
+	being discarded whenever twice that number are counted.  Given a ``path``, the retained keys are saved there at
+	process exit, to be passed as ``keys`` to ``Cache.warm`` by the next.
+	"""
+	
+	def __init__(self, path=None, capacity=1000):
+		self.path = path
+		self.capacity = capacity
+		self.counts = {}  # identity: [key, count]
+		self._lock = Lock()
+		
+		if path:
+			register(self.save)
+		
+		super(HotKeys, self).__init__()
+	
+	def __repr__(self):
+		return 'HotKeys({0} counted)'.format(len(self.counts))
+	
+	def record(self, key):
+		identity = key.identity
+		
+		with self._lock:
+			entry = self.counts.get(identity)
+			
+			if entry is not None:
+				entry[1] += 1
+				return
+			
+			if len(self.counts) >= self.capacity * 2:
+				self.counts = dict(sorted(self.counts.items(), key=lambda item: item[1][1], reverse=True)[:self.capacity])
+			
+			self.counts[identity] = [key, 1]
+	
+	def top(self, count=None):
+		"""Return the most frequently used keys as ``(key, count)`` tuples, most frequently used first."""
+		
+		with self._lock:
+			entries = sorted(self.counts.values(), key=lambda entry: entry[1], reverse=True)
+		
+		return [tuple(entry) for entry in entries[:count or self.capacity]]
+	
+	def save(self, path=None):
+		"""Write the most frequently used keys to a file, one per line as MongoDB extended JSON; returns the number."""
+		
+		path = path or self.path
+		entries = self.top()
+		
+		with open(path, 'w') as fh:
+			for key, count in entries:
+				fh.write(dumps({'key': key.to_mongo(), 'count': count}) + '\n')
+		
+		log.info("Saved the %d most frequently used keys to %s.", len(entries), path)
+		
+		return len(entries)
+
+
+def load(path):
+	"""Read the keys saved by ``HotKeys.save``, in their stored form, most frequently used first."""
+	
+	with open(path) as fh:
+		return [loads(line)['key'] for line in fh if line.strip()]
+
+
+def stream(backend, prefix=None, limit=None, since=None, keys=None):
+	"""Iterate the unexpired values of a backend as ``(identity, value, expires)`` tuples, decoding each in turn.
+	
+	The arguments are as per ``Cache.warm``.
+	"""
+	
+	if isinstance(keys, (unicode, str)):
+		keys = load(keys)
+	
+	if since is not None and not isinstance(since, datetime):
+		since = utcnow() - as_delta(since)
+	
+	for identity, value, expires in backend.scan(prefix, since, limit, keys):
+		value = decode(value)
+		
+		if type(value) is dict and Raised.FIELD in value:
+			continue
+		
+		yield identity, value, expires
+
+
+def warm(backend, local, prefix=None, limit=None, since=None, keys=None, stale=None, local_ttl=None):
+	"""Fill an in-process tier with values streamed from a backend, returning the number stored.
+	
+	As with ``CacheMark.remember``, values are stored until they cease to be fresh, ``stale`` (a timedelta or number of
+	seconds) before their recorded expiry, and for at most ``local_ttl``; values no longer fresh are not stored.
+	"""
+	
+	stale = as_delta(stale)
+	count = 0
+	
+	for identity, value, expires in stream(backend, prefix, limit, since, keys):
+		fresh = expires.replace(tzinfo=None) - stale if expires and stale else expires
+		
+		if stale and fresh and fresh <= utcnow():
+			continue
+		
+		local.set(identity, value, fresh, local_ttl)
+		count += 1
+	
+	return count
+
+
+# ## Command-Line Interface
+
+def main(argv=None):
+	parser = ArgumentParser(prog='python -m marrow.cache.warm', description="Stream cached values from MongoDB, "
+			"warming the server's working set, and report on their number and size.")
+	parser.add_argument('--mongo', metavar='URI', default='mongodb://localhost/test', help="the MongoDB server and "
+			"database to connect to (default: mongodb://localhost/test)")
+	parser.add_argument('--prefix', help="only stream values cached under this prefix")
+	parser.add_argument('--limit', type=int, help="stream at most this many values")
+	parser.add_argument('--since', type=float, metavar='SECONDS', help="only stream values accessed within this many "
+			"seconds; requires access times be recorded")
+	parser.add_argument('--keys', metavar='FILE', help="only stream the keys saved to this file by HotKeys")
+	
+	options = parser.parse_args(argv)
+	
+	from mongoengine import connect
+	connect(host=options.mongo)
+	
+	start = time()
+	count = size = 0
+	
+	for identity, value, expires in stream(Cache.raw(), options.prefix, options.limit, options.since, options.keys):
+		count += 1
+		size += len(value) if isinstance(value, (bytes, bytearray)) else sizeof(value)
+	
+	print("Streamed {0} values, of approximately {1} bytes, in {2:.3f} seconds.".format(count, size, time() - start),
+			file=sys.stderr)
+	
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -76,10 +76,14 @@ setup(
 	include_package_data = True,
 	namespace_packages = ['marrow'],
 	
-	install_requires = ['pymongo<3.0', 'mongoengine>=0.8.5', 'marrow.package<2.0', 'wrapt<2.0'],
+	install_requires = ['pymongo>=3.0', 'mongoengine>=0.10', 'marrow.package<2.0', 'wrapt<2.0'],
 	
 	extras_require = dict(
 			development = tests_require,
+			motor = ['motor'],
+			msgpack = ['msgpack'],
+			lz4 = ['lz4'],
+			signals = ['blinker'],
 		),
 	
 	tests_require = tests_require,
@@ -1,6 +1,10 @@
 # encoding: utf-8
 
 import os
+import sys
+
+
+collect_ignore = [] if sys.version_info >= (3, 5) else ['test_aio.py']
 
 
 class Mine(object):
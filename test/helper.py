@@ -2,6 +2,86 @@
 
 from __future__ import unicode_literals, print_function
 
+from marrow.cache.model import CacheKey
+from marrow.cache.backend import MemoryBackend
+from marrow.cache.util import utcnow, timedelta, sleep
+
+
+# ## Shared Test Helpers
+
+def key(prefix, *args, **kw):
+	"""A key under the given prefix for a call with the given arguments, referencing the ``reference`` document if any."""
+	
+	return CacheKey.new(prefix, kw.pop('reference', None), args, kw)
+
+
+def keyed(default):
+	"""Produce a ``key`` function for a test module, constructing keys under the given prefix unless passed another."""
+	
+	return lambda *args, **kw: key(kw.pop('prefix', default), *args, **kw)
+
+
+def future(**kw):
+	"""A time in the future: five minutes from now, unless given the ``timedelta`` arguments of another."""
+	
+	return utcnow() + timedelta(**(kw or dict(minutes=5)))
+
+
+def eventually(condition, timeout=2.0):
+	"""Poll the given condition until truthy, returning whether it became so within the timeout."""
+	
+	for i in range(int(timeout / 0.01)):
+		if condition():
+			return True
+		
+		sleep(0.01)
+	
+	return False
+
+
+class CountingBackend(MemoryBackend):
+	"""Record the requests made of the backend; those made in bulk are recorded with the number of entries."""
+	
+	def __init__(self):
+		super(CountingBackend, self).__init__()
+		self.requests = []
+	
+	@property
+	def touches(self):
+		return self.requests.count('touch')
+	
+	@property
+	def batches(self):
+		return [request[1] for request in self.requests if isinstance(request, tuple) and request[0] == 'touch_many']
+	
+	def get(self, key, refresh=None, detail=False):
+		self.requests.append('get')
+		return super(CountingBackend, self).get(key, refresh, detail)
+	
+	def set(self, key, value, expires):
+		self.requests.append('set')
+		return super(CountingBackend, self).set(key, value, expires)
+	
+	def get_many(self, keys, detail=False):
+		self.requests.append('get_many')
+		return super(CountingBackend, self).get_many(keys, detail)
+	
+	def set_many(self, entries):
+		entries = list(entries)
+		self.requests.append(('set_many', len(entries)))
+		return super(CountingBackend, self).set_many(entries)
+	
+	def touch(self, key, expires):
+		self.requests.append('touch')
+		super(CountingBackend, self).touch(key, expires)
+	
+	def touch_many(self, entries):
+		entries = list(entries)
+		self.requests.append(('touch_many', len(entries)))
+		super(CountingBackend, self).touch_many(entries)
+
+
+# ## Introspection
 
 def bare():
 	def closure():
@@ -0,0 +1,347 @@
+# encoding: utf-8
+
+import os
+import asyncio
+import threading
+import pytest
+
+from marrow.cache.exc import CacheMiss
+from marrow.cache.aio import AsyncFlight, AsyncCacheMark
+from marrow.cache.model import Cache, CacheKey
+from marrow.cache.backend import MemoryBackend, AsyncMemoryBackend, ThreadedBackend, MotorBackend
+from marrow.cache.util import timedelta
+from .helper import keyed, future
+
+
+key = keyed('test_aio')
+
+
+def run(coroutine):
+	return asyncio.new_event_loop().run_until_complete(coroutine)
+
+
+def counter(**kw):
+	"""Produce a memoized coroutine function returning the number of times it has been called."""
+	
+	backend = kw.pop('backend', None) or AsyncMemoryBackend()
+	calls = []
+	
+	@Cache.memoize(prefix='test_aio', backend=backend, **kw)
+	async def count(value=None):
+		calls.append(value)
+		await asyncio.sleep(0.01)
+		return len(calls)
+	
+	count.calls = calls
+	count.backend = backend
+	
+	return count
+
+
+@pytest.fixture(params=['async', 'threaded'])
+def backend(request):
+	if request.param == 'async':
+		return AsyncMemoryBackend()
+	
+	return ThreadedBackend(MemoryBackend())
+
+
+class TestAsyncBackends(object):
+	def test_protocol(self, backend):
+		async def exercise():
+			with pytest.raises(CacheMiss):
+				await backend.get(key(1))
+			
+			await backend.set(key(1), 27, future())
+			assert await backend.get(key(1)) == 27
+			
+			await backend.touch(key(1), future(days=1))
+			value, expires = await backend.get(key(1), detail=True)
+			assert expires > future(hours=23)
+			
+			await backend.set_many([(key(i), i, future()) for i in range(2, 5)])
+			assert await backend.get_many([key(i) for i in range(6)]) == dict((key(i).identity, i if i > 1 else 27)
+					for i in range(1, 5))
+			
+			token = await backend.lease(key(1), 5)
+			assert token
+			await backend.release(key(1), token)
+			
+			await backend.delete(key(1))
+			
+			with pytest.raises(CacheMiss):
+				await backend.get(key(1))
+			
+			assert await backend.invalidate(CacheKey(prefix='test_aio')) == 3
+		
+		run(exercise())
+		assert 'Backend' in repr(backend)
+
+
+class TestAsyncFlight(object):
+	def test_concurrent_calls_are_coalesced(self):
+		flight = AsyncFlight()
+		calls = []
+		
+		async def compute():
+			calls.append(1)
+			await asyncio.sleep(0.01)
+			return 27
+		
+		async def exercise():
+			return await asyncio.gather(*[flight.run('key', compute) for i in range(8)])
+		
+		assert run(exercise()) == [27] * 8
+		assert calls == [1]
+		assert len(flight) == 0
+	
+	def test_exceptions_are_shared(self):
+		flight = AsyncFlight()
+		
+		async def compute():
+			await asyncio.sleep(0.01)
+			raise ValueError()
+		
+		async def exercise():
+			return await asyncio.gather(*[flight.run('key', compute) for i in range(4)], return_exceptions=True)
+		
+		results = run(exercise())
+		assert all(isinstance(result, ValueError) for result in results)
+		assert len(flight) == 0
+	
+	def test_waiting_tasks_may_time_out(self):
+		flight = AsyncFlight()
+		
+		async def compute():
+			await asyncio.sleep(0.05)
+			return 27
+		
+		async def follow():
+			await asyncio.sleep(0)
+			
+			with pytest.raises(asyncio.TimeoutError):
+				await asyncio.wait_for(flight.run('key', compute), 0.01)
+		
+		async def exercise():
+			return await asyncio.gather(flight.run('key', compute), follow(), flight.run('key', compute))
+		
+		assert run(exercise()) == [27, None, 27]
+		assert len(flight) == 0
+	
+	def test_calls_are_coalesced_per_event_loop(self):
+		flight = AsyncFlight()
+		started = threading.Barrier(2)
+		calls = []
+		results = []
+		
+		async def compute():
+			calls.append(1)
+			await asyncio.sleep(0.05)
+			return 27
+		
+		async def exercise():
+			started.wait()
+			results.extend(await asyncio.gather(*[flight.run('key', compute) for i in range(4)]))
+		
+		threads = [threading.Thread(target=run, args=(exercise(), )) for i in range(2)]
+		
+		for thread in threads:
+			thread.start()
+		
+		for thread in threads:
+			thread.join()
+		
+		assert results == [27] * 8
+		assert calls == [1, 1]
+		assert len(flight) == 0
+
+
+class TestAsyncMemoize(object):
+	def test_results_are_cached(self):
+		count = counter()
+		
+		assert isinstance(count.mark, AsyncCacheMark)
+		assert run(count()) == 1
+		assert run(count()) == 1
+		assert run(count(2)) == 2
+		assert len(count.backend.data) == 2
+	
+	def test_synchronous_backends_are_adapted(self):
+		count = counter(backend=MemoryBackend())
+		
+		assert run(count()) == 1
+		assert run(count()) == 1
+		assert len(count.backend.data) == 1
+	
+	def test_global_async_backend(self):
+		backend = AsyncMemoryBackend()
+		
+		@Cache.memoize(prefix='test_aio.global')
+		async def answer():
+			return 42
+		
+		Cache.ASYNC_BACKEND = backend
+		
+		try:
+			assert run(answer()) == 42
+		finally:
+			Cache.ASYNC_BACKEND = None
+		
+		assert len(backend.data) == 1
+	
+	def test_populate_false(self):
+		count = counter(populate=False)
+		
+		with pytest.raises(CacheMiss):
+			run(count())
+	
+	def test_coalescing(self):
+		count = counter(coalesce=True)
+		
+		async def exercise():
+			return await asyncio.gather(*[count() for i in range(8)])
+		
+		assert run(exercise()) == [1] * 8
+		assert count.calls == [None]
+	
+	def test_leases(self):
+		count = counter(lease=5)
+		assert run(count()) == 1
+		assert run(count()) == 1
+	
+	def test_stale_while_revalidate(self):
+		count = counter(seconds=-1, stale=60)
+		
+		async def exercise():
+			assert await count() == 1
+			assert await count() == 1  # Stale; served while regenerating.
+			await asyncio.sleep(0.05)
+			assert await count() == 2
+		
+		run(exercise())
+	
+	def test_local_tier(self):
+		count = counter(local=True)
+		run(count())
+		count.backend.data.clear()
+		
+		assert run(count()) == 1
+	
+	def test_many(self):
+		backend = AsyncMemoryBackend()
+		calls = []
+		
+		@Cache.memoize(prefix='test_aio.many', backend=backend)
+		async def double(value):
+			calls.append(value)
+			await asyncio.sleep(0.01)
+			return value * 2
+		
+		run(double(1))
+		
+		assert run(double.many([1, 2, 3, 2])) == [2, 4, 6, 4]
+		assert sorted(calls) == [1, 2, 3]
+		assert len(backend.data) == 3
+	
+	def test_method(self):
+		backend = AsyncMemoryBackend()
+		
+		class Multiply(object):
+			def __init__(self, x):
+				self.x = x
+			
+			@Cache.method('x', prefix='test_aio.method', backend=backend)
+			async def do(self, y):
+				return self.x * y
+		
+		assert run(Multiply(2).do(4)) == 8
+		assert run(Multiply(3).do(4)) == 12
+		assert run(Multiply(3).do(4)) == 12
+		assert len(backend.data) == 2
+	
+	def test_invalidate(self):
+		count = counter()
+		
+		run(count(1))
+		run(count(2))
+		run(count.invalidate(1))
+		
+		assert len(count.backend.data) == 1
+		assert run(Cache.invalidate(count)) == 1
+		assert run(count(2)) == 3
+	
+	def test_tags(self):
+		backend = MemoryBackend()
+		count = counter(backend=backend, tags=lambda value: ['test_aio.tag:{0}'.format(value)])
+		
+		assert run(count(1)) == run(count(1)) == 1
+		
+		Cache.bump('test_aio.tag:1', backend=backend)
+		
+		assert run(count(1)) == 2
+	
+	def test_refresh_threshold(self):
+		backend = AsyncMemoryBackend()
+		count = counter(backend=backend, minutes=10, refresh=0.5)
+		run(count(1))
+		
+		for identity, (value, expires) in list(backend.data.items()):
+			backend.data[identity] = (value, expires - timedelta(minutes=6))
+		
+		assert run(count(1)) == 1
+		assert run(backend.get(key(1), detail=True))[1] > future(minutes=9)
+	
+	def test_exceptions(self):
+		calls = []
+		
+		@Cache.memoize(prefix='test_aio.failing', backend=AsyncMemoryBackend(), exceptions=[LookupError])
+		async def failing():
+			calls.append(None)
+			raise KeyError("missing")
+		
+		for i in range(2):
+			with pytest.raises(KeyError):
+				run(failing())
+		
+		assert len(calls) == 1
+	
+	def test_synchronous_functions_are_unaffected(self):
+		@Cache.memoize(prefix='test_aio.sync', backend=MemoryBackend())
+		def answer():
+			return 42
+		
+		assert not isinstance(answer.mark, AsyncCacheMark)
+		assert answer() == 42
+
+
+def test_motor_backend():
+	if os.environ.get('MARROW_CACHE_OFFLINE'):
+		pytest.skip("Live MongoDB tests disabled.")
+	
+	motor = pytest.importorskip('motor.motor_asyncio')
+	
+	async def exercise():
+		collection = motor.AsyncIOMotorClient().test.cache_aio
+		backend = MotorBackend(collection, acknowledge=True)
+		
+		await collection.drop()
+		await backend.ensure_indexes()
+		
+		await backend.set(key(1), 27, future())
+		assert await backend.get(key(1), refresh=lambda: future(days=1)) == 27
+		
+		await backend.set_many([(key(i), i, future()) for i in range(2, 4)])
+		assert len(await backend.get_many([key(i) for i in range(5)])) == 3
+		
+		token = await backend.lease(key(1), 5)
+		assert token and await backend.lease(key(1), 5) is None
+		await backend.release(key(1), token)
+		
+		await backend.delete(key(1))
+		
+		with pytest.raises(CacheMiss):
+			await backend.get(key(1))
+		
+		await collection.drop()
+	
+	run(exercise())
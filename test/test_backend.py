@@ -0,0 +1,422 @@
+# encoding: utf-8
+
+import os
+import pytest
+
+from bson import ObjectId
+from mongoengine import connect, Document, StringField, ObjectIdField
+
+from marrow.cache.exc import CacheMiss, CacheExpired
+from marrow.cache.model import CacheKey, Cache
+from marrow.cache.backend import Backend, MemoryBackend, MongoBackend, SQLiteBackend
+from marrow.cache.backend.base import textual
+from marrow.cache.util import utcnow, timedelta, sleep
+from .helper import keyed, future
+
+
+OFFLINE = bool(os.environ.get('MARROW_CACHE_OFFLINE'))  # Only exercise the backends not requiring a live server.
+
+
+key = keyed('test_backend')
+
+
+class Referenced(Document):
+	_id = ObjectIdField(primary_key=True, default=ObjectId)
+	name = StringField()
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'mongo', 'compact', 'document'])
+def backend(request):
+	if request.param == 'memory':
+		yield MemoryBackend()
+		return
+	
+	if request.param == 'sqlite':
+		backend = SQLiteBackend()
+		yield backend
+		backend.close()
+		return
+	
+	if OFFLINE:
+		pytest.skip("Live MongoDB tests disabled.")
+	
+	connect('test')
+	Cache.drop_collection()
+	Cache.ensure_indexes()
+	
+	if request.param == 'mongo':
+		yield MongoBackend(Cache._get_collection(), acknowledge=True)
+	elif request.param == 'compact':
+		backend = MongoBackend(Cache._get_collection(), acknowledge=True, compact=True)
+		backend.ensure_indexes()
+		yield backend
+	else:
+		yield Cache
+	
+	Cache.drop_collection()
+
+
+class TestBackendProtocol(object):
+	def test_miss(self, backend):
+		with pytest.raises(CacheMiss):
+			backend.get(key(1))
+	
+	def test_set_then_get(self, backend):
+		backend.set(key(1), dict(value=27), future())
+		assert backend.get(key(1)) == dict(value=27)
+	
+	def test_detail(self, backend):
+		expires = future()
+		backend.set(key(1), 27, expires)
+		
+		value, stored = backend.get(key(1), detail=True)
+		assert value == 27
+		assert abs((stored.replace(tzinfo=None) - expires).total_seconds()) < 1
+	
+	def test_expired_values_miss(self, backend):
+		backend.set(key(1), 27, utcnow() - timedelta(seconds=1))
+		
+		with pytest.raises(CacheMiss):
+			backend.get(key(1))
+	
+	def test_replacement(self, backend):
+		backend.set(key(1), 27, future())
+		backend.set(key(1), 42, future())
+		assert backend.get(key(1)) == 42
+	
+	def test_delete(self, backend):
+		backend.set(key(1), 27, future())
+		backend.delete(key(1))
+		
+		with pytest.raises(CacheMiss):
+			backend.get(key(1))
+	
+	def test_refresh(self, backend):
+		backend.set(key(1), 27, future())
+		backend.get(key(1), refresh=lambda: future(days=1))
+		
+		value, expires = backend.get(key(1), detail=True)
+		assert expires.replace(tzinfo=None) > future(hours=23)
+	
+	def test_refresh_does_not_revive_expired_values(self, backend):
+		backend.set(key(1), 27, utcnow() - timedelta(seconds=1))
+		
+		with pytest.raises(CacheMiss):
+			backend.get(key(1), refresh=lambda: future(days=1))
+		
+		with pytest.raises(CacheMiss):
+			backend.get(key(1))
+	
+	def test_touch(self, backend):
+		backend.set(key(1), 27, future())
+		backend.touch(key(1), future(days=1))
+		
+		value, expires = backend.get(key(1), detail=True)
+		assert expires.replace(tzinfo=None) > future(hours=23)
+	
+	def test_touch_many(self, backend):
+		backend.set(key(1), 27, future())
+		backend.set(key(2), 42, future(days=2))
+		backend.touch_many([(key(1), future(days=1)), (key(2), future(days=1)), (key(3), future(days=1))])
+		
+		assert backend.get(key(1), detail=True)[1].replace(tzinfo=None) > future(hours=23)
+		assert backend.get(key(2), detail=True)[1].replace(tzinfo=None) > future(days=1, hours=23)  # Never shortened.
+		
+		with pytest.raises(CacheMiss):
+			backend.get(key(3))
+	
+	def test_get_many(self, backend):
+		for i in range(5):
+			backend.set(key(i), i * 2, future())
+		
+		backend.set(key(5), 10, utcnow() - timedelta(seconds=1))
+		
+		result = backend.get_many([key(i) for i in range(8)])
+		assert result == dict((key(i).identity, i * 2) for i in range(5))
+	
+	def test_set_many(self, backend):
+		backend.set(key(0), 'replaced', future())
+		backend.set_many([(key(i), i * 2, future()) for i in range(5)])
+		
+		assert backend.get(key(0)) == 0
+		assert backend.get_many([key(i) for i in range(5)]) == dict((key(i).identity, i * 2) for i in range(5))
+		
+		backend.set_many([])
+	
+	def test_lease(self, backend):
+		token = backend.lease(key(1), 5)
+		assert token
+		
+		if not isinstance(backend, MemoryBackend):  # Process-local backends have nothing to coordinate with.
+			assert backend.lease(key(1), 5) is None
+		
+		backend.release(key(1), token)
+		token = backend.lease(key(1), 5)
+		assert token
+		
+		backend.release(key(1), token)
+	
+	def test_references_distinguish_keys(self, backend):
+		first, second = Referenced(name="first"), Referenced(name="second")
+		
+		backend.set(key(1, reference=first), 'first', future())
+		backend.set(key(1, reference=second), 'second', future())
+		
+		assert backend.get(key(1, reference=first)) == 'first'
+		assert backend.get(key(1, reference=second)) == 'second'
+	
+	
+	def test_invalidate(self, backend):
+		first, second = Referenced(name="first"), Referenced(name="second")
+		other = CacheKey.new('test_backend.other', first, (1, ), {})
+		
+		for i in range(3):
+			backend.set(key(i), i, future())
+			backend.set(key(i, reference=first), i, future())
+			backend.set(key(i, reference=second), i, future())
+		
+		backend.set(other, 'other', future())
+		
+		assert backend.invalidate(CacheKey(prefix='test_backend', reference=second)) == 3
+		assert backend.invalidate(CacheKey(reference=first)) == 4
+		assert backend.get(key(1)) == 1
+		
+		with pytest.raises(CacheMiss):
+			backend.get(other)
+		
+		assert backend.invalidate(CacheKey(prefix='test_backend')) == 3
+		assert backend.get_many([key(i) for i in range(3)]) == {}
+		
+		with pytest.raises(ValueError):
+			backend.invalidate(CacheKey())
+	
+	def test_invalidate_in_batches(self, backend):
+		for i in range(5):
+			backend.set(key(i), i, future())
+		
+		if hasattr(backend, 'raw'):
+			backend = backend.raw()
+		
+		backend.INVALIDATE = 2
+		
+		assert backend.invalidate(CacheKey(prefix='test_backend')) == 5
+
+
+class TestMemoryBackend(object):
+	def test_values_are_isolated(self):
+		backend = MemoryBackend()
+		value = [1, 2]
+		
+		backend.set(key(1), value, future())
+		value.append(3)
+		backend.get(key(1)).append(4)
+		
+		assert backend.get(key(1)) == [1, 2]
+	
+	def test_purge(self):
+		backend = MemoryBackend()
+		backend.set(key(1), 27, utcnow() - timedelta(seconds=1))
+		backend.set(key(2), 42, future())
+		backend.purge()
+		
+		assert len(backend.data) == 1
+		assert 'MemoryBackend' in repr(backend)
+	
+	def test_access_times_are_forgotten(self):
+		backend = MemoryBackend()
+		other = CacheKey.new('test_backend.other', None, (), {})
+		
+		backend.set(key(0), 0, utcnow() + timedelta(milliseconds=10))
+		backend.set(key(1), 1, future())
+		backend.set(key(2), 2, future())
+		backend.set(other, 3, future())
+		backend.access([(i, utcnow()) for i in (key(0), key(1), key(2), other)])
+		
+		sleep(0.02)
+		
+		with pytest.raises(CacheMiss):
+			backend.get(key(0))  # Expired.
+		
+		backend.delete(key(1))
+		backend.invalidate(other)
+		
+		assert list(backend.accessed) == [key(2).identity]
+		
+		backend.clear()
+		assert not backend.accessed
+
+
+class TestSQLiteBackend(object):
+	def test_persistence(self, tmpdir):
+		path = str(tmpdir.join('cache.db'))
+		
+		SQLiteBackend(path).set(key(1), dict(value=27), future())
+		assert SQLiteBackend(path).get(key(1)) == dict(value=27)
+	
+	def test_purge(self):
+		backend = SQLiteBackend()
+		backend.set(key(1), 27, utcnow() - timedelta(seconds=1))
+		backend.purge()
+		
+		assert backend._execute('SELECT COUNT(*) FROM "{0}"')[0][0] == 0
+
+
+def test_dropping_the_collection_drops_its_companions():
+	if OFFLINE:
+		pytest.skip("Live MongoDB tests disabled.")
+	
+	connect('test')
+	Cache.drop_collection()
+	
+	backend = Cache.raw()
+	backend.CHUNK = 20
+	
+	try:
+		assert Cache.lease(key(1), 5)
+		backend.set(key(2), b'x' * 100, future())
+		
+		Cache.drop_collection()
+		backend = Cache.raw()
+		
+		assert backend.leases.count_documents({}) == 0
+		assert backend.chunks.count_documents({}) == 0
+		assert Cache.lease(key(1), 5)
+	
+	finally:
+		Cache.drop_collection()
+
+
+def test_distinguishing_expired_values():
+	if OFFLINE:
+		pytest.skip("Live MongoDB tests disabled.")
+	
+	connect('test')
+	Cache.drop_collection()
+	
+	backend = MongoBackend(Cache._get_collection(), acknowledge=True, distinguish=True)
+	backend.collection.drop_index('e_1')  # Expired records linger until culled by the TTL index; ensure they survive.
+	backend.set(key(1), 27, utcnow() - timedelta(seconds=1))
+	
+	try:
+		with pytest.raises(CacheExpired):
+			backend.get(key(1))
+		
+		with pytest.raises(CacheExpired):
+			backend.get(key(1), refresh=lambda: future(days=1))
+		
+		with pytest.raises(CacheMiss) as miss:
+			backend.get(key(2))
+		
+		assert not isinstance(miss.value, CacheExpired)
+	
+	finally:
+		Cache.drop_collection()
+		Cache.ensure_indexes()
+
+
+def test_textual_keys():
+	instance = Referenced(name="Bob Dole")
+	
+	assert textual(key(1)) != textual(key(2))
+	assert str(instance.pk) in textual(key(1, reference=instance))
+
+
+def test_abstract_backend():
+	backend = Backend()
+	
+	with pytest.raises(NotImplementedError):
+		backend.get(key(1))
+	
+	with pytest.raises(NotImplementedError):
+		backend.set(key(1), 27, future())
+	
+	with pytest.raises(NotImplementedError):
+		backend.delete(key(1))
+	
+	with pytest.raises(NotImplementedError):
+		backend.invalidate(key(1))
+
+
+class TestMarksUsingBackends(object):
+	def test_memoize(self):
+		backend = MemoryBackend()
+		calls = []
+		
+		@Cache.memoize(prefix='test_backend.memoize', backend=backend)
+		def multiply(x, y):
+			calls.append((x, y))
+			return x * y
+		
+		assert multiply(2, 4) == 8
+		assert multiply(2, 4) == 8
+		assert multiply(3, 4) == 12
+		assert calls == [(2, 4), (3, 4)]
+		assert len(backend.data) == 2
+	
+	def test_global_backend(self):
+		backend = MemoryBackend()
+		
+		@Cache.memoize(prefix='test_backend.global')
+		def answer():
+			return 42
+		
+		Cache.BACKEND = backend
+		
+		try:
+			assert answer() == 42
+		finally:
+			Cache.BACKEND = None
+		
+		assert len(backend.data) == 1
+	
+	def test_method(self):
+		backend = MemoryBackend()
+		
+		class Multiply(object):
+			def __init__(self, x):
+				self.x = x
+			
+			@Cache.method('x', prefix='test_backend.method', backend=backend)
+			def do(self, y):
+				return self.x * y
+		
+		assert Multiply(2).do(4) == 8
+		assert Multiply(3).do(4) == 12
+		assert len(backend.data) == 2
+
+
+class TestLegacyKeys(object):
+	def test_migration(self):
+		backend = MemoryBackend()
+		legacy = CacheKey.new('test_backend.migrate', None, (2, ), dict(), legacy=True)
+		backend.set(legacy, 'cached', future())
+		
+		@Cache.memoize(prefix='test_backend.migrate', backend=backend)
+		def stale(x):
+			return 'computed'
+		
+		Cache.MIGRATE_KEYS = True
+		
+		try:
+			assert stale(2) == 'cached'
+		finally:
+			Cache.MIGRATE_KEYS = False
+		
+		assert stale(2) == 'cached'
+		assert len(backend.data) == 1
+	
+	def test_legacy_generation(self):
+		backend = MemoryBackend()
+		
+		@Cache.memoize(prefix='test_backend.legacy', backend=backend)
+		def answer():
+			return 42
+		
+		Cache.LEGACY_KEYS = True
+		
+		try:
+			assert answer() == 42
+		finally:
+			Cache.LEGACY_KEYS = False
+		
+		assert backend.get(CacheKey.new('test_backend.legacy', None, (), dict(), legacy=True)) == 42
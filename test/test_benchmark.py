@@ -0,0 +1,69 @@
+# encoding: utf-8
+
+import json
+import pytest
+
+from marrow.cache.model import Cache
+from marrow.cache.benchmark import BENCHMARKS, BUDGETS, run, compare, overhead, main
+
+
+def results(**timings):
+	return {'results': dict((name, {'best': best}) for name, best in timings.items())}
+
+
+class TestBenchmark(object):
+	def test_run(self):
+		backend = Cache.BACKEND
+		result = run(number=1, repeat=1)
+		
+		assert Cache.BACKEND is backend
+		assert result['backend'] == 'memory'
+		assert list(result['results']) == list(BENCHMARKS)
+		
+		for entry in result['results'].values():
+			assert entry['number'] == 1
+			assert entry['best'] > 0
+	
+	def test_filter(self):
+		result = run(['key.', 'contention.shared'], number=1, repeat=1)
+		assert [i for i in result['results'] if not i.startswith('key.')] == ['contention.shared']
+	
+	def test_document_class_is_not_registered_as_post(self):
+		from mongoengine.base import _document_registry
+		assert 'Post' not in _document_registry
+	
+	def test_compare(self):
+		result = dict((i[0], i[3:]) for i in compare(results(a=1.0, b=1.0, c=1.0), results(a=1.05, b=1.5, d=1.0)))
+		
+		assert sorted(result) == ['a', 'b']
+		assert result['a'] == (1.05, False)
+		assert result['b'] == (1.5, True)
+	
+	def test_main(self, tmpdir):
+		output = str(tmpdir.join('results.json'))
+		baseline = str(tmpdir.join('baseline.json'))
+		
+		assert main(['hit', '--number', '1', '--repeat', '1', '--output', output]) == 0
+		assert 'hit' in json.load(open(output))['results']
+		
+		with open(baseline, 'w') as fh:
+			json.dump(results(hit=1e-12), fh)
+		
+		assert main(['hit', '--number', '1', '--repeat', '1', '--compare', baseline]) == 1
+	
+	def test_overhead(self):
+		result = dict((i[0], i[1:]) for i in overhead(results(**{'call.bare': 1e-6, 'hit': 11e-6, 'hit.local': 1.0})))
+		
+		assert sorted(result) == ['hit', 'hit.local']
+		assert result['hit'][0] == pytest.approx(10e-6)
+		assert result['hit'][1:] == (BUDGETS['hit'], False)
+		assert result['hit.local'][2]
+		
+		assert not overhead(results(**{'call.bare': 1e-6, 'hit': 1.0}), 1e6)[0][3]
+		
+		with pytest.raises(ValueError):
+			overhead(results(hit=1.0))
+	
+	def test_budget(self):
+		assert main(['hit.local', '--number', '1', '--repeat', '1', '--budget', '1e6']) == 0
+		assert main(['hit.local', '--number', '1', '--repeat', '1', '--budget', '1e-6']) == 1
@@ -0,0 +1,241 @@
+# encoding: utf-8
+
+import gc
+import pytest
+
+from threading import Thread, Event
+from weakref import ref
+
+from marrow.cache.exc import CacheMiss
+from marrow.cache.model import Cache
+from marrow.cache.backend import MemoryBackend, WriteBehind
+from marrow.cache.util import utcnow, timedelta, sleep
+from .helper import keyed, future, eventually
+
+
+key = keyed('test_buffer')
+
+
+class RecordingBackend(MemoryBackend):
+	def __init__(self):
+		super(RecordingBackend, self).__init__()
+		self.batches = []
+		self.blocked = None
+	
+	def set_many(self, entries):
+		if self.blocked:
+			self.blocked.wait()
+		
+		self.batches.append(len(entries))
+		super(RecordingBackend, self).set_many(entries)
+
+
+@pytest.fixture
+def backend():
+	return RecordingBackend()
+
+
+@pytest.fixture
+def buffer(backend):
+	buffer = WriteBehind(backend, size=10, interval=60)
+	yield buffer
+	buffer.close()
+
+
+class TestWriteBehind(object):
+	def test_writes_are_queued(self, buffer, backend):
+		buffer.set(key(1), 27, future())
+		
+		assert not backend.data
+		assert buffer.get(key(1)) == 27
+		assert buffer.get_many([key(1)]) == {key(1).identity: 27}
+		
+		assert buffer.flush() == 1
+		assert backend.get(key(1)) == 27
+		assert buffer.get(key(1)) == 27
+	
+	def test_size_threshold(self, buffer, backend):
+		for i in range(10):
+			buffer.set(key(i), i, future())
+		
+		assert eventually(lambda: backend.batches == [10])
+		assert not buffer.pending
+	
+	def test_time_threshold(self, backend):
+		buffer = WriteBehind(backend, size=10, interval=0.05)
+		buffer.set(key(1), 27, future())
+		
+		try:
+			assert eventually(lambda: backend.batches == [1])
+		finally:
+			buffer.close()
+	
+	def test_repeated_writes_coalesce(self, buffer, backend):
+		buffer.set(key(1), 1, future())
+		buffer.set(key(1), 2, future())
+		buffer.flush()
+		
+		assert backend.batches == [1]
+		assert backend.get(key(1)) == 2
+	
+	def test_close_flushes(self, backend):
+		buffer = WriteBehind(backend, size=10, interval=60)
+		buffer.set(key(1), 27, future())
+		buffer.close()
+		
+		assert backend.get(key(1)) == 27
+		
+		buffer.set(key(2), 42, future())  # Writes made after closing are not buffered.
+		assert backend.get(key(2)) == 42
+	
+	def test_expired_queued_values_miss(self, buffer):
+		buffer.set(key(1), 27, utcnow() - timedelta(seconds=1))
+		
+		with pytest.raises(CacheMiss):
+			buffer.get(key(1))
+		
+		assert buffer.get_many([key(1)]) == {}
+	
+	def test_delete(self, buffer, backend):
+		backend.set(key(2), 42, future())
+		buffer.set(key(1), 27, future())
+		
+		buffer.delete(key(1))
+		buffer.delete(key(2))
+		buffer.flush()
+		
+		assert not backend.data
+	
+	def test_touch_and_refresh(self, buffer, backend):
+		buffer.set(key(1), 27, future())
+		buffer.touch(key(1), future(days=1))
+		
+		value, expires = buffer.get(key(1), detail=True)
+		assert expires > future(hours=23)
+		
+		buffer.get(key(1), refresh=lambda: future(days=2))
+		buffer.flush()
+		
+		value, expires = backend.get(key(1), detail=True)
+		assert expires > future(hours=47)
+	
+	def test_refreshing_values_being_flushed(self, buffer, backend):
+		buffer.set(key(1), 27, future())
+		backend.blocked = Event()
+		
+		thread = Thread(target=buffer.flush)
+		thread.start()
+		
+		try:
+			assert eventually(lambda: buffer.flushing)
+			assert buffer.get(key(1), refresh=lambda: future(days=1)) == 27
+			assert not buffer.pending  # Not queued to be written a second time.
+		
+		finally:
+			backend.blocked.set()
+			thread.join()
+		
+		value, expires = backend.get(key(1), detail=True)
+		
+		assert expires > future(hours=23)
+		assert backend.batches == [1]
+		assert buffer.flush() == 0
+	
+	def test_unused_buffers_are_collected(self, backend):
+		buffer = WriteBehind(backend)
+		reference = ref(buffer)
+		
+		del buffer
+		gc.collect()
+		
+		assert reference() is None
+	
+	def test_idle_thread_exits(self, backend):
+		buffer = WriteBehind(backend, size=1)
+		buffer.IDLE = 0.01
+		
+		try:
+			buffer.set(key(1), 27, future())
+			
+			assert eventually(lambda: buffer.thread is None)
+			assert backend.get(key(1)) == 27
+			
+			buffer.set(key(2), 42, future())  # Starts another.
+			
+			assert eventually(lambda: backend.data and len(backend.data) == 2)
+		
+		finally:
+			buffer.close()
+	
+	def test_passes_through(self, buffer, backend):
+		backend.set(key(1), 27, future())
+		
+		assert buffer.get(key(1)) == 27
+		assert buffer.get_many([key(1), key(2)]) == {key(1).identity: 27}
+		assert buffer.lease(key(1), 5)
+		assert 'WriteBehind' in repr(buffer)
+	
+	def test_backpressure(self, backend):
+		buffer = WriteBehind(backend, size=2, interval=60, limit=2)
+		backend.blocked = Event()
+		
+		def writer():
+			for i in range(6):
+				buffer.set(key(i), i, future())
+		
+		thread = Thread(target=writer)
+		thread.start()
+		
+		try:
+			assert eventually(lambda: buffer.flushing and len(buffer.pending) == 2)
+			sleep(0.05)
+			assert thread.is_alive()  # Blocked, awaiting the flush in progress.
+			assert buffer.get(key(0)) == 0  # Values being flushed remain visible.
+		
+		finally:
+			backend.blocked.set()
+			thread.join()
+			buffer.close()
+		
+		assert len(backend.data) == 6
+		assert max(backend.batches) <= 2
+	
+	def test_writers_blocked_when_closed(self, backend):
+		buffer = WriteBehind(backend, size=10, interval=60, limit=1)
+		buffer.set(key(1), 1, future())
+		backend.blocked = Event()
+		
+		writers = [Thread(target=buffer.set, args=(key(i), i, future())) for i in (2, 3)]
+		closer = Thread(target=buffer.close)
+		
+		for thread in writers:
+			thread.start()
+		
+		sleep(0.05)
+		assert all(thread.is_alive() for thread in writers)  # Blocked, awaiting the queue to drain.
+		
+		closer.start()
+		
+		try:
+			assert eventually(lambda: buffer.flushing)
+			sleep(0.05)
+		
+		finally:
+			backend.blocked.set()
+			
+			for thread in writers + [closer]:
+				thread.join()
+		
+		assert not buffer.pending
+		assert len(backend.data) == 3
+	
+	def test_marks(self, buffer, backend):
+		@Cache.memoize(prefix='test_buffer.mark', backend=buffer)
+		def answer():
+			return 42
+		
+		assert answer() == 42
+		assert answer.many([()]) == [42]
+		buffer.flush()
+		
+		assert len(backend.data) == 1
@@ -0,0 +1,124 @@
+# encoding: utf-8
+
+from enum import Enum, IntEnum
+from uuid import uuid4
+from decimal import Decimal
+from collections import namedtuple, OrderedDict
+
+from bson import ObjectId, DBRef
+from mongoengine import Document, StringField, ObjectIdField
+
+from marrow.cache.canonical import ENCODERS, canonical, digest, encode
+from marrow.cache.util import utcnow, timedelta
+
+
+
+Point = namedtuple('Point', ('x', 'y'))
+
+
+class Sample(Document):
+	_id = ObjectIdField(primary_key=True, default=ObjectId)
+	name = StringField()
+
+
+class Color(Enum):
+	RED = 1
+
+
+class Level(IntEnum):
+	LOW = 1
+
+
+class Rank(IntEnum):
+	LOW = 1
+
+
+class Opaque(object):
+	def __repr__(self):
+		return 'Opaque()'
+
+
+class Vector(object):
+	def __init__(self, x, y):
+		self.x, self.y = x, y
+
+
+def encode_vector(value, append):
+	append(b'V')
+	encode(value.x, append)
+	encode(value.y, append)
+
+
+def test_distinct_types_are_distinguished():
+	values = [None, True, False, 0, 1, 1.0, '1', b'1', (1, ), [1], set([1]), dict(a=1), Decimal('1'), timedelta(1)]
+	encoded = [canonical(i) for i in values]
+	
+	assert len(set(encoded)) == len(values)
+
+
+def test_length_prefixes_prevent_ambiguity():
+	assert canonical(('ab', 'c')) != canonical(('a', 'bc'))
+	assert canonical(('a', ('b', ))) != canonical((('a', ), 'b'))
+
+
+def test_mappings_are_order_independent():
+	assert canonical(dict(a=1, b=2)) == canonical(OrderedDict([('b', 2), ('a', 1)]))
+	assert canonical(set(['a', 'b', 'c'])) == canonical(frozenset(['c', 'b', 'a']))
+
+
+def test_rich_types():
+	now = utcnow()
+	oid = ObjectId()
+	uuid = uuid4()
+	
+	assert canonical(now) == canonical(now)
+	assert canonical(now) != canonical(now.date())
+	assert oid.binary in canonical(oid)
+	assert uuid.bytes in canonical(uuid)
+	assert canonical(DBRef('foo', oid)) != canonical(DBRef('bar', oid))
+
+
+def test_documents_are_identified_by_primary_key():
+	first = Sample(name="first")
+	second = Sample(name="second")
+	
+	assert canonical(first) != canonical(second)
+	
+	first.name = "changed"
+	assert canonical(first) == canonical(Sample(_id=first.pk, name="other"))
+
+
+def test_subclasses_use_the_nearest_registered_encoder():
+	assert canonical(Point(1, 2)) == canonical((1, 2))
+
+
+def test_enumerations_are_tagged():
+	assert canonical(Level.LOW) != canonical(1)
+	assert canonical(Level.LOW) != canonical(Rank.LOW)
+	assert canonical(Color.RED) != canonical(1)
+	assert canonical(Color.RED) == canonical(Color(1))
+
+
+def test_buffer_protocol():
+	assert b'raw data' in canonical(memoryview(b'raw data'))
+	assert canonical(bytearray(b'raw')) == canonical(b'raw')
+
+
+def test_fallback_representation():
+	assert b'Opaque()' in canonical(Opaque())
+
+
+def test_registration():
+	ENCODERS[Vector] = encode_vector
+	
+	try:
+		assert canonical(Vector(1, 2)) == canonical(Vector(1, 2))
+		assert canonical(Vector(1, 2)) != canonical(Vector(2, 1))
+	finally:
+		del ENCODERS[Vector]
+
+
+def test_digest():
+	assert len(digest(((), {}))) == 32
+	assert len(digest(((), {}), 8)) == 16
+	assert digest(((1, ), {})) != digest(((2, ), {}))
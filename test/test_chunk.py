@@ -0,0 +1,181 @@
+# encoding: utf-8
+
+import os
+import pytest
+
+from bson import BSON
+from bson.binary import Binary
+from mongoengine import connect
+from pymongo.errors import DocumentTooLarge
+
+from marrow.cache.exc import CacheMiss
+from marrow.cache.model import Cache
+from marrow.cache.codec import SUBTYPE, Serializer, decode
+from marrow.cache.backend import MongoBackend
+from .helper import keyed, future
+
+
+PAYLOAD = os.urandom(1000)  # Fifty chunks, at twenty bytes apiece.
+
+
+key = keyed('test_chunk')
+
+
+@pytest.fixture(params=[False, True], ids=['standard', 'compact'])
+def backend(request):
+	if os.environ.get('MARROW_CACHE_OFFLINE'):
+		pytest.skip("Live MongoDB tests disabled.")
+	
+	connect('test')
+	Cache.drop_collection()
+	Cache.ensure_indexes()
+	
+	backend = MongoBackend(Cache._get_collection(), acknowledge=True, compact=request.param)
+	backend.CHUNK = 20
+	backend.chunks.drop()
+	
+	yield backend
+	
+	Cache.drop_collection()
+	backend.chunks.drop()
+
+
+class Oversized(object):
+	"""Refuse to write records holding a value over 16MB, as a server would, regardless of the server in use."""
+	
+	def __init__(self, collection):
+		self.collection = collection
+	
+	def __getattr__(self, name):
+		return getattr(self.collection, name)
+	
+	def replace_one(self, criteria, document, **kw):
+		if len(BSON.encode(document)) > 16 * 1024 * 1024:
+			raise DocumentTooLarge("BSON document too large.")
+		
+		return self.collection.replace_one(criteria, document, **kw)
+
+
+def chunks(backend):
+	return backend.chunks.count_documents({})
+
+
+class TestChunkedStorage(object):
+	def test_small_values_are_not_chunked(self, backend):
+		backend.set(key(1), b'small', future())
+		
+		assert backend.get(key(1)) == b'small'
+		assert chunks(backend) == 0
+	
+	def test_roundtrip(self, backend):
+		backend.set(key(1), PAYLOAD, future())
+		
+		assert chunks(backend) == 50
+		assert backend.get(key(1)) == PAYLOAD
+		
+		value, expires = backend.get(key(1), detail=True)
+		assert value == PAYLOAD
+	
+	def test_binary_subtype_is_preserved(self, backend):
+		encoded = Serializer('pickle').encode(dict(payload=PAYLOAD))
+		backend.set(key(1), encoded, future())
+		
+		value = backend.get(key(1))
+		assert isinstance(value, Binary)
+		assert decode(value) == dict(payload=PAYLOAD)
+	
+	def test_stream(self, backend):
+		backend.set(key(1), PAYLOAD, future())
+		backend.set(key(2), b'small', future())
+		
+		parts = list(backend.stream(key(1)))
+		assert len(parts) == 50
+		assert b''.join(parts) == PAYLOAD
+		
+		assert list(backend.stream(key(2))) == [b'small']
+		
+		with pytest.raises(CacheMiss):
+			backend.stream(key(3))
+	
+	def test_replacement_removes_prior_chunks(self, backend):
+		backend.set(key(1), PAYLOAD, future())
+		backend.set(key(1), PAYLOAD[:100], future())
+		
+		assert chunks(backend) == 5
+		assert backend.get(key(1)) == PAYLOAD[:100]
+	
+	def test_delete(self, backend):
+		backend.set(key(1), PAYLOAD, future())
+		backend.delete(key(1))
+		
+		assert chunks(backend) == 0
+		
+		with pytest.raises(CacheMiss):
+			backend.get(key(1))
+	
+	def test_missing_chunks_miss(self, backend):
+		backend.set(key(1), PAYLOAD, future())
+		backend.chunks.delete_one({})
+		
+		with pytest.raises(CacheMiss):
+			backend.get(key(1))
+		
+		assert backend.get_many([key(1)]) == {}
+	
+	def test_expiry_is_shared(self, backend):
+		expires = future()
+		backend.set(key(1), PAYLOAD, expires)
+		
+		for part in backend.chunks.find():
+			assert abs((part['e'] - expires).total_seconds()) < 1
+		
+		backend.touch(key(1), future(days=1))
+		assert backend.chunks.count_documents({'e': {'$lt': future(hours=23)}}) == 0
+		
+		backend.get(key(1), refresh=lambda: future(days=2))
+		assert backend.chunks.count_documents({'e': {'$lt': future(hours=47)}}) == 0
+	
+	def test_get_many(self, backend):
+		backend.set_many([(key(1), PAYLOAD, future()), (key(2), b'small', future())])
+		
+		assert backend.get_many([key(1), key(2)]) == {key(1).identity: PAYLOAD, key(2).identity: b'small'}
+	
+	def test_document_class(self, backend):
+		Cache._raw = backend
+		
+		try:
+			Cache.set(key(1), PAYLOAD, future())
+			Cache.set_many([(key(2), PAYLOAD, future())])
+			
+			assert Cache.get(key(1)) == PAYLOAD
+			assert Cache.get(key(2)) == PAYLOAD
+			assert b''.join(Cache.stream(key(1))) == PAYLOAD
+		
+		finally:
+			Cache._raw = None
+	
+	def test_oversized_documents(self, backend):
+		value = dict(('field{0}'.format(i), os.urandom(1024 * 1024)) for i in range(20))  # Twenty megabytes.
+		backend.CHUNK = 4 * 1024 * 1024
+		backend.writer = Oversized(backend.writer)
+		backend.set(key(1), value, future())
+		
+		assert backend.collection.find_one()['s']
+		assert backend.get(key(1)) == value
+		assert backend.get_many([key(1)]) == {key(1).identity: value}
+		assert decode(Binary(b''.join(backend.stream(key(1))), SUBTYPE)) == value  # Streamed in the pickled form.
+	
+	def test_oversized_documents_through_the_document_class(self, backend):
+		value = dict(('field{0}'.format(i), os.urandom(1024 * 1024)) for i in range(20))  # Twenty megabytes.
+		backend.CHUNK = 4 * 1024 * 1024
+		backend.writer = Oversized(backend.writer)
+		Cache._raw, Cache.COMPACT = backend, backend.compact
+		
+		try:
+			Cache.set(key(1), value, future())
+			
+			assert Cache.get(key(1)) == value
+			assert Cache.get_many([key(1)]) == {key(1).identity: value}
+		
+		finally:
+			Cache._raw, Cache.COMPACT = None, False
@@ -0,0 +1,157 @@
+# encoding: utf-8
+
+import os
+import pytest
+
+from bson.binary import Binary
+from mongoengine import connect
+
+from marrow.cache.model import Cache, CacheKey
+from marrow.cache.codec import CODECS, SUBTYPE, Serializer, Codec, register, serializer, decode
+from marrow.cache.backend import MemoryBackend, SQLiteBackend
+
+
+VALUE = dict(name="Bob Dole", tags=['x', 'y'], count=27, text='x' * 2000)
+
+
+@pytest.fixture(params=sorted(name for name in CODECS if not isinstance(name, int)))
+def codec(request):
+	return request.param
+
+
+class TestSerializer(object):
+	def test_roundtrip(self, codec):
+		encoded = Serializer(codec).encode(VALUE)
+		
+		assert isinstance(encoded, Binary)
+		assert encoded.subtype == SUBTYPE
+		assert decode(encoded) == VALUE
+	
+	def test_compression_threshold(self, codec):
+		plain = Serializer(codec).encode(VALUE)
+		compressed = Serializer(codec, threshold=1024).encode(VALUE)
+		small = Serializer(codec, threshold=1024).encode(dict(name="Bob"))
+		
+		assert len(compressed) < len(plain)
+		assert decode(compressed) == VALUE
+		assert bytearray(small)[0] & 0x0F == 0  # Below the threshold; uncompressed.
+	
+	def test_incompressible_values_are_stored_uncompressed(self):
+		encoded = Serializer('pickle', threshold=0).encode(os.urandom(64))
+		assert bytearray(encoded)[0] & 0x0F == 0
+	
+	def test_inexact_codecs_roundtrip(self):
+		bson = Serializer('bson')
+		value = dict(pair=(1, 2))
+		
+		assert bson.roundtrip(value, bson.encode(value)) == dict(pair=[1, 2])
+		assert Serializer('pickle').roundtrip(value, None) is value
+	
+	def test_native_values_pass_through(self):
+		assert decode(27) == 27
+		assert decode(b'bytes') == b'bytes'
+		assert decode(Binary(b'data', 5)) == Binary(b'data', 5)
+	
+	def test_unknown(self):
+		with pytest.raises(LookupError):
+			Serializer('unknown')
+		
+		with pytest.raises(LookupError):
+			Serializer('pickle', 100, 'unknown')
+	
+	def test_registration(self):
+		with pytest.raises(ValueError):
+			register(CODECS, Codec('invalid', 16, None, None))
+	
+	def test_serializer_arguments(self):
+		assert serializer() is None
+		assert serializer(False) is False
+		assert serializer('json').codec.name == 'json'
+		assert serializer(compress=100).codec.name == 'pickle'
+		assert serializer(compress=100).compression.name == 'zlib'
+		assert 'json' in repr(serializer('json'))
+
+
+def listing(backend, **kw):
+	calls = []
+	
+	@Cache.memoize(prefix='test_codec', backend=backend, **kw)
+	def listing(count):
+		calls.append(count)
+		return tuple('x' * 100 for i in range(count))
+	
+	listing.calls = calls
+	
+	return listing
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'document'])
+def backend(request):
+	if request.param == 'memory':
+		return MemoryBackend()
+	
+	if request.param == 'sqlite':
+		return SQLiteBackend()
+	
+	if os.environ.get('MARROW_CACHE_OFFLINE'):
+		pytest.skip("Live MongoDB tests disabled.")
+	
+	connect('test')
+	Cache.drop_collection()
+	
+	return Cache
+
+
+class TestMarks(object):
+	def test_encoded_storage(self, backend):
+		fn = listing(backend, codec='json', compress=256)
+		
+		assert fn(10) == ['x' * 100] * 10  # The value returned by the miss matches that of later hits.
+		assert fn(10) == ['x' * 100] * 10
+		assert fn.calls == [10]
+		
+		stored = backend.get(CacheKey.new('test_codec', None, (10, ), dict()))
+		assert isinstance(stored, Binary)
+		assert len(stored) < 1000
+	
+	def test_exact_codecs(self, backend):
+		fn = listing(backend, codec='pickle')
+		
+		assert fn(2) == ('x' * 100, ) * 2
+		assert fn(2) == ('x' * 100, ) * 2
+	
+	def test_global_codec(self):
+		backend = MemoryBackend()
+		fn = listing(backend)
+		Cache.CODEC = Serializer('json')
+		
+		try:
+			assert fn(1) == ['x' * 100]
+		finally:
+			Cache.CODEC = None
+		
+		assert fn(1) == ['x' * 100]  # Decodable regardless of configuration.
+		
+		disabled = listing(backend, codec=False)
+		assert disabled(2) == ('x' * 100, ) * 2
+	
+	def test_many(self):
+		backend = MemoryBackend()
+		fn = listing(backend, codec='json')
+		
+		assert fn.many([1, 2]) == [['x' * 100], ['x' * 100] * 2]
+		assert fn.many([1, 2]) == [['x' * 100], ['x' * 100] * 2]
+		assert fn.calls == [1, 2]
+	
+	def test_method(self):
+		backend = MemoryBackend()
+		
+		class Multiply(object):
+			x = 2
+			
+			@Cache.method('x', prefix='test_codec.method', backend=backend, codec='bson')
+			def do(self):
+				return (self.x, self.x)
+		
+		assert Multiply().do() == [2, 2]
+		assert isinstance(list(backend.data.values())[0][0], Binary)
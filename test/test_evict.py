@@ -0,0 +1,280 @@
+# encoding: utf-8
+
+import gc
+import os
+import pytest
+
+from weakref import ref
+
+from mongoengine import connect
+
+from marrow.cache.exc import CacheMiss
+from marrow.cache.model import CacheKey, Cache
+from marrow.cache.backend import MemoryBackend, MongoBackend, Bounded, Quota
+from marrow.cache.tag import Generations
+from marrow.cache.util import utcnow, sleep
+from .helper import key, future, eventually
+
+
+OFFLINE = bool(os.environ.get('MARROW_CACHE_OFFLINE'))
+
+
+@pytest.fixture(params=['memory', 'mongo'])
+def backend(request):
+	if request.param == 'memory':
+		yield MemoryBackend()
+		return
+	
+	if OFFLINE:
+		pytest.skip("Live MongoDB tests disabled.")
+	
+	connect('test')
+	Cache.drop_collection()
+	Cache.ensure_indexes()
+	
+	yield MongoBackend(Cache._get_collection(), acknowledge=True)
+	
+	Cache.drop_collection()
+
+
+@pytest.fixture
+def bounded(backend):
+	result = Bounded(backend, {'small': Quota(entries=3)}, entries=8, sample=100, interval=3600)
+	result.close()  # Without a background thread, budgets are only enforced when explicitly requested.
+	
+	return result
+
+
+class TestQuota(object):
+	def test_unlimited(self):
+		assert not Quota()
+		assert Quota().excess(100, 10000) == 0
+	
+	def test_entries(self):
+		assert Quota(entries=10).excess(12, None) == 2
+		assert Quota(entries=10).excess(8, None) == 0
+	
+	def test_size(self):
+		assert Quota(size=1000).excess(10, 1500) == 4  # At an average of 150 bytes each.
+		assert Quota(entries=10, size=1000).excess(12, 1100) == 2
+	
+	def test_ratio(self):
+		assert Quota(entries=10).excess(11, None, 0.9) == 2
+		assert Quota(size=1000).excess(10, 1100, 0.9) == 2  # Down to 900 bytes, at 110 bytes each.
+
+
+class TestEvictionProtocol(object):
+	def test_usage(self, backend):
+		for i in range(3):
+			backend.set(key('a', i), i, future())
+		
+		backend.set(key('b', 0), 0, future())
+		
+		assert backend.usage('a', False)[0] == 3
+		assert backend.usage(None, False)[0] == 4
+	
+	def test_sample_and_evict(self, backend):
+		for i in range(5):
+			backend.set(key('a', i), i, future())
+		
+		backend.access([(key('a', 1), utcnow())])
+		candidates = backend.sample('a', 10)
+		
+		assert len(candidates) == 5
+		assert sum(1 for handle, accessed in candidates if accessed is not None) == 1
+		assert len(backend.sample('a', 2)) == 2
+		
+		assert backend.evict([handle for handle, accessed in candidates[:2]]) == 2
+		assert backend.usage('a', False)[0] == 3
+	
+	def test_tag_generations_are_excluded(self, backend):
+		tags = Generations()
+		tags.bump(backend, ['author'])
+		backend.set(key('a', 0), 0, future())
+		
+		assert backend.usage(None, False)[0] == 1
+		assert len(backend.sample(None, 10)) == 1
+
+
+class TestBounded(object):
+	def test_size_usage(self):
+		backend = MemoryBackend()
+		backend.set(key('a', 1), b'1234', future())
+		backend.set(key('a', 2), b'123456', future())
+		
+		assert backend.usage('a') == (2, 10)
+	
+	def test_passes_through(self, bounded):
+		bounded.set(key('small', 1), 27, future())
+		
+		assert bounded.get(key('small', 1)) == 27
+		assert bounded.get_many([key('small', 1), key('small', 2)]) == {key('small', 1).identity: 27}
+		
+		bounded.delete(key('small', 1))
+		
+		with pytest.raises(CacheMiss):
+			bounded.get(key('small', 1))
+	
+	def test_prefix_quota(self, bounded, backend):
+		for i in range(3):
+			bounded.set(key('small', i), i, future())
+		
+		bounded.flush()
+		sleep(0.01)
+		
+		bounded.get(key('small', 0))  # Recently used; survives.
+		bounded.set(key('small', 3), 3, future())
+		
+		assert bounded.due
+		assert bounded.enforce() == 2  # Down to the low-water mark of 90% of the budget.
+		assert backend.usage('small', False)[0] == 2
+		
+		assert bounded.get(key('small', 0)) == 0
+		assert bounded.get(key('small', 3)) == 3
+		assert not bounded.get_many([key('small', 1), key('small', 2)])  # The least recently used.
+	
+	def test_global_quota(self, bounded, backend):
+		for i in range(10):
+			bounded.set(key('large', i), i, future())
+		
+		assert bounded.enforce() == 3
+		assert backend.usage(None, False)[0] == 7
+	
+	def test_low_water_mark(self, backend):
+		bounded = Bounded(backend, entries=10, sample=100, interval=3600, low=1.0)
+		bounded.close()
+		
+		for i in range(12):
+			bounded.set(key('large', i), i, future())
+		
+		assert bounded.enforce() == 2  # Only the excess is evicted.
+		
+		bounded.set(key('large', 12), 12, future())
+		assert bounded.due  # Immediately over budget again.
+		
+		bounded.low = 0.5
+		assert bounded.enforce() == 6
+		
+		bounded.set(key('large', 13), 13, future())
+		assert not bounded.due
+	
+	def test_global_quota_spares_tag_generations(self, backend):
+		tags = Generations()
+		tags.bump(backend, ['author'])
+		
+		bounded = Bounded(backend, entries=2, sample=100, interval=3600)
+		bounded.close()
+		
+		for i in range(4):
+			bounded.set(key('large', i), i, future())
+		
+		assert bounded.enforce() == 3
+		assert backend.get(tags.key('author'))
+	
+	def test_size_quota(self):
+		backend = MemoryBackend()
+		bounded = Bounded(backend, {'blobs': Quota(size=1000)}, sample=100, interval=3600)
+		bounded.close()
+		
+		for i in range(15):
+			bounded.set(key('blobs', i), b'x' * 100, future())
+		
+		assert bounded.enforce() == 6
+		assert backend.usage('blobs') == (9, 900)
+	
+	def test_estimates_shrink(self, bounded):
+		for i in range(3):
+			bounded.set(key('small', i), i, future())
+		
+		bounded.delete(key('small', 0))
+		
+		assert bounded.estimates['small'][0] == 2
+		assert bounded.estimates[None][0] == 2
+		
+		bounded.set(key('other', 1), 1, future())
+		bounded.invalidate(CacheKey(prefix='small'))
+		
+		assert bounded.estimates['small'][0] == 0
+		assert bounded.estimates[None][0] == 1
+		
+		for i in range(3):
+			bounded.set(key('small', i), i, future())
+		
+		assert not bounded.due  # Removed values no longer count against the budget.
+	
+	def test_background_enforcement(self, backend):
+		bounded = Bounded(backend, {'small': (2, None)}, interval=3600, flush=0.01)
+		
+		try:
+			for i in range(4):
+				bounded.set(key('small', i), i, future())
+			
+			eventually(lambda: backend.usage('small', False)[0] <= 1)
+			
+			assert backend.usage('small', False)[0] == 1
+		
+		finally:
+			bounded.close()
+	
+	def test_prompt_enforcement_is_rate_limited(self):
+		backend = MemoryBackend()
+		bounded = Bounded(backend, {'small': (2, None)}, interval=3600, flush=0.5)
+		
+		try:
+			for i in range(4):
+				bounded.set(key('small', i), i, future())
+			
+			eventually(lambda: backend.usage('small', False)[0] <= 1, 1.0)
+			
+			for i in range(4, 7):
+				bounded.set(key('small', i), i, future())
+			
+			sleep(0.1)
+			assert backend.usage('small', False)[0] == 4  # Not yet measured again.
+			
+			eventually(lambda: backend.usage('small', False)[0] <= 1, 1.0)
+			
+			assert backend.usage('small', False)[0] == 1
+		
+		finally:
+			bounded.close()
+	
+	def test_unused_budgets_are_collected(self, backend):
+		bounded = Bounded(backend, entries=10)
+		bounded.set(key('large', 1), 1, future())
+		bounded.close()
+		reference = ref(bounded)
+		
+		del bounded
+		gc.collect()
+		
+		assert reference() is None
+	
+	def test_idle_thread_exits(self, backend):
+		bounded = Bounded(backend, entries=10, flush=0.01)
+		bounded.IDLE = 0.01
+		
+		try:
+			bounded.set(key('large', 1), 1, future())
+			
+			eventually(lambda: bounded.thread is None)
+			
+			assert bounded.thread is None
+			assert backend.sample(None, 10)[0][1] is not None  # The access time was written before exiting.
+			
+			bounded.get(key('large', 1))  # Starts another.
+			assert bounded.thread is not None
+		
+		finally:
+			bounded.close()
+	
+	def test_memoized(self, bounded, backend):
+		@Cache.memoize(prefix='small', backend=bounded)
+		def double(value):
+			return value * 2
+		
+		assert [double(i) for i in range(5)] == [0, 2, 4, 6, 8]
+		
+		bounded.enforce()
+		
+		assert backend.usage('small', False)[0] == 2
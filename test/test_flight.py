@@ -0,0 +1,196 @@
+# encoding: utf-8
+
+from time import sleep
+from threading import Thread, Event
+
+from marrow.cache.flight import Flight
+from marrow.cache.model import Cache, CacheKey
+from marrow.cache.backend import MemoryBackend, SQLiteBackend
+from marrow.cache.util import utcnow, timedelta
+
+
+
+def run_threads(count, target):
+	threads = [Thread(target=target) for i in range(count)]
+	
+	for thread in threads: thread.start()
+	for thread in threads: thread.join()
+
+
+class TestFlight(object):
+	def test_concurrent_calls_are_coalesced(self):
+		flight = Flight()
+		release = Event()
+		calls = []
+		results = []
+		
+		def compute():
+			calls.append(1)
+			release.wait()
+			return 27
+		
+		def worker():
+			results.append(flight.run('key', compute))
+		
+		threads = [Thread(target=worker) for i in range(8)]
+		for thread in threads: thread.start()
+		
+		sleep(0.05)  # Allow the workers to queue up behind the first.
+		release.set()
+		
+		for thread in threads: thread.join()
+		
+		assert calls == [1]
+		assert results == [27] * 8
+		assert len(flight) == 0
+	
+	def test_exceptions_are_shared(self):
+		flight = Flight()
+		release = Event()
+		errors = []
+		
+		def compute():
+			release.wait()
+			raise ValueError()
+		
+		def worker():
+			try:
+				flight.run('key', compute)
+			except ValueError as e:
+				errors.append(e)
+		
+		threads = [Thread(target=worker) for i in range(4)]
+		for thread in threads: thread.start()
+		
+		sleep(0.05)
+		release.set()
+		
+		for thread in threads: thread.join()
+		
+		assert len(errors) == 4
+		assert len(flight) == 0
+	
+	def test_base_exceptions_are_shared(self):
+		class Abort(BaseException):
+			pass
+		
+		flight = Flight()
+		release = Event()
+		outcomes = []
+		
+		def compute():
+			release.wait()
+			raise Abort()
+		
+		def worker():
+			try:
+				outcomes.append(flight.run('key', compute))
+			except Abort as e:
+				outcomes.append(e)
+		
+		threads = [Thread(target=worker) for i in range(4)]
+		for thread in threads: thread.start()
+		
+		sleep(0.05)
+		release.set()
+		
+		for thread in threads: thread.join()
+		
+		assert len(outcomes) == 4
+		assert all(isinstance(outcome, Abort) for outcome in outcomes)
+		assert len(flight) == 0
+	
+	def test_sequential_calls_recompute(self):
+		flight = Flight()
+		
+		assert flight.run('key', lambda: 1) == 1
+		assert flight.run('key', lambda: 2) == 2
+
+
+class TestCoalescingMarks(object):
+	def test_concurrent_misses_compute_once(self):
+		backend = MemoryBackend()
+		calls = []
+		
+		@Cache.memoize(prefix='test_flight.coalesce', backend=backend, coalesce=True)
+		def expensive():
+			calls.append(1)
+			sleep(0.05)
+			return 27
+		
+		run_threads(8, expensive)
+		
+		assert calls == [1]
+		assert expensive() == 27
+	
+	def test_uncoalesced_by_default(self):
+		mark = Cache.memoize()
+		assert mark.flight is None
+		
+		mark = Cache.memoize(lease=5)
+		assert mark.flight is not None
+		assert mark.lease == timedelta(seconds=5)
+
+
+class TestLeases(object):
+	def key(self):
+		return CacheKey.new('test_flight.lease', None, (), dict())
+	
+	def test_memory_backend_always_grants(self):
+		backend = MemoryBackend()
+		
+		assert backend.lease(self.key(), 5)
+		assert backend.lease(self.key(), 5)
+	
+	def test_sqlite_leases_are_exclusive(self, tmpdir):
+		path = str(tmpdir.join('cache.db'))
+		first, second = SQLiteBackend(path), SQLiteBackend(path)  # As if held by different processes.
+		
+		token = first.lease(self.key(), 5)
+		assert token
+		assert second.lease(self.key(), 5) is None
+		
+		first.release(self.key(), token)
+		assert second.lease(self.key(), 5)
+	
+	def test_sqlite_leases_expire(self):
+		backend = SQLiteBackend()
+		
+		assert backend.lease(self.key(), -1)
+		assert backend.lease(self.key(), 5)
+	
+	def test_waits_for_lease_holder(self, tmpdir):
+		path = str(tmpdir.join('cache.db'))
+		holder, backend = SQLiteBackend(path), SQLiteBackend(path)
+		calls = []
+		
+		@Cache.memoize(prefix='test_flight.lease', backend=backend, lease=5)
+		def expensive():
+			calls.append(1)
+			return 42
+		
+		token = holder.lease(self.key(), 5)
+		
+		def other_process():
+			sleep(0.1)
+			holder.set(self.key(), 27, utcnow() + timedelta(minutes=1))
+			holder.release(self.key(), token)
+		
+		thread = Thread(target=other_process)
+		thread.start()
+		
+		assert expensive() == 27
+		assert not calls
+		
+		thread.join()
+	
+	def test_computes_once_lease_lapses(self, tmpdir):
+		path = str(tmpdir.join('cache.db'))
+		holder, backend = SQLiteBackend(path), SQLiteBackend(path)
+		
+		@Cache.memoize(prefix='test_flight.lease', backend=backend, lease=0.1)
+		def expensive():
+			return 42
+		
+		assert holder.lease(self.key(), 5)
+		assert expensive() == 42
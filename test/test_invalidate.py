@@ -0,0 +1,93 @@
+# encoding: utf-8
+
+import pytest
+
+from marrow.cache.model import Cache, CacheKey
+from marrow.cache.local import LocalCache
+from marrow.cache.backend import MemoryBackend
+
+
+def counter(backend, **kw):
+	calls = []
+	
+	@Cache.memoize(prefix='test_invalidate', backend=backend, **kw)
+	def count(value):
+		calls.append(value)
+		return len(calls)
+	
+	return count
+
+
+class Counter(object):
+	calls = 0
+	
+	def __init__(self, x):
+		self.x = x
+	
+	@Cache.method('x', prefix='test_invalidate.method', backend=MemoryBackend())
+	def count(self, y):
+		Counter.calls += 1
+		return Counter.calls
+
+
+class TestInvalidation(object):
+	def test_callable(self):
+		backend = MemoryBackend()
+		count = counter(backend)
+		backend.set(CacheKey.new('test_invalidate.other', None, (), {}), 27, None)
+		
+		assert (count(1), count(2), count(1)) == (1, 2, 1)
+		assert Cache.invalidate(count) == 2
+		assert len(backend.data) == 1
+		assert count(1) == 3
+	
+	def test_single_call(self):
+		local = LocalCache()
+		count = counter(MemoryBackend(), local=local)
+		
+		assert (count(1), count(2)) == (1, 2)
+		
+		count.invalidate(1)
+		
+		assert len(local) == 1
+		assert count(1) == 3
+		assert count(2) == 2
+	
+	def test_method(self):
+		first, second = Counter(1), Counter(2)
+		
+		a, b = first.count(5), second.count(5)
+		
+		first.count.invalidate(5)
+		assert first.count(5) != a
+		
+		Counter.count.invalidate(second, 5)
+		assert second.count(5) != b
+		
+		assert Cache.invalidate(Counter.count) == 2
+	
+	def test_prefix_and_local(self):
+		backend = Cache.BACKEND = MemoryBackend()
+		local = Cache.LOCAL = LocalCache()
+		
+		try:
+			count = counter(None)
+			count(1)
+			count(2)
+			
+			assert len(local) == 2
+			assert Cache.invalidate(prefix='test_invalidate') == 2
+			assert len(local) == 0
+			assert len(backend.data) == 0
+		
+		finally:
+			Cache.BACKEND = Cache.LOCAL = None
+	
+	def test_requires_criteria(self):
+		Cache.BACKEND = MemoryBackend()
+		
+		try:
+			with pytest.raises(ValueError):
+				Cache.invalidate()
+		finally:
+			Cache.BACKEND = None
@@ -0,0 +1,127 @@
+# encoding: utf-8
+
+from threading import Thread
+from unittest import TestCase
+
+from marrow.cache.exc import CacheMiss
+from marrow.cache.local import LocalCache, sizeof
+from marrow.cache.util import utcnow, timedelta
+
+
+
+class TestLocalCacheBasics(TestCase):
+	def test_miss(self):
+		cache = LocalCache()
+		
+		try:
+			cache.get('missing')
+		except CacheMiss:
+			pass
+		else:
+			assert False, "Failed to raise CacheMiss."
+	
+	def test_hit(self):
+		cache = LocalCache()
+		cache.set('key', 27)
+		
+		assert cache.get('key') == 27
+		assert 'key' in cache
+		assert len(cache) == 1
+	
+	def test_delete_and_clear(self):
+		cache = LocalCache()
+		cache.set('foo', 1)
+		cache.set('bar', 2)
+		
+		cache.delete('foo')
+		assert 'foo' not in cache
+		assert len(cache) == 1
+		
+		cache.clear()
+		assert len(cache) == 0
+		assert cache.size == 0
+	
+	def test_programmers_representation(self):
+		assert 'LocalCache' in repr(LocalCache())
+
+
+class TestLocalCacheExpiry(TestCase):
+	def test_respects_stored_expiry(self):
+		cache = LocalCache()
+		cache.set('key', 27, utcnow() - timedelta(seconds=1))
+		
+		assert 'key' not in cache
+		assert cache.size == 0
+	
+	def test_local_ttl_bounds_stored_expiry(self):
+		cache = LocalCache(ttl=-1)  # Already expired on arrival.
+		cache.set('key', 27, utcnow() + timedelta(days=1))
+		
+		assert 'key' not in cache
+	
+	def test_per_entry_ttl(self):
+		cache = LocalCache()
+		cache.set('key', 27, utcnow() + timedelta(days=1), ttl=timedelta(seconds=-1))
+		
+		assert 'key' not in cache
+
+
+class TestLocalCacheEviction(TestCase):
+	def test_entry_bound(self):
+		cache = LocalCache(entries=2)
+		cache.set('a', 1)
+		cache.set('b', 2)
+		cache.get('a')  # Mark "a" as recently used.
+		cache.set('c', 3)
+		
+		assert 'a' in cache
+		assert 'b' not in cache
+		assert 'c' in cache
+	
+	def test_size_bound(self):
+		cache = LocalCache(entries=None, size=sizeof('x' * 100) * 2)
+		cache.set('a', 'x' * 100)
+		cache.set('b', 'x' * 100)
+		cache.set('c', 'x' * 100)
+		
+		assert len(cache) == 2
+		assert 'a' not in cache
+		assert cache.size <= cache.limit
+	
+	def test_oversized_values_are_not_stored(self):
+		cache = LocalCache(size=10)
+		assert cache.set('a', 'x' * 100) == 'x' * 100
+		assert 'a' not in cache
+	
+	def test_replacement_accounts_size(self):
+		cache = LocalCache()
+		cache.set('a', 'x' * 100)
+		cache.set('a', 'x')
+		
+		assert cache.size == sizeof('x')
+
+
+def test_sizeof_nested():
+	assert sizeof([['x' * 100]]) > sizeof(['x'])
+	assert sizeof(dict(a='x' * 100)) > sizeof(dict(a='x'))
+
+
+def test_threaded_access():
+	cache = LocalCache(entries=50)
+	
+	def worker(n):
+		for i in range(500):
+			cache.set((n, i % 75), i)
+			
+			try:
+				cache.get((n, (i * 7) % 75))
+			except CacheMiss:
+				pass
+	
+	threads = [Thread(target=worker, args=(n, )) for n in range(8)]
+	
+	for thread in threads: thread.start()
+	for thread in threads: thread.join()
+	
+	assert len(cache) <= 50
+	assert cache.size == sum(record[2] for record in cache._data.values())
@@ -0,0 +1,132 @@
+# encoding: utf-8
+
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor
+
+from marrow.cache.exc import CacheMiss
+from marrow.cache.model import Cache
+from .helper import CountingBackend
+
+
+
+def doubler(**kw):
+	backend = CountingBackend()
+	calls = []
+	
+	@Cache.memoize(prefix='test_many', backend=backend, **kw)
+	def double(value, extra=0):
+		calls.append(value)
+		return value * 2 + extra
+	
+	double.calls = calls
+	double.backend = backend
+	
+	return double
+
+
+class TestMany(object):
+	def test_all_misses(self):
+		double = doubler()
+		
+		assert double.many(range(5)) == [0, 2, 4, 6, 8]
+		assert double.calls == [0, 1, 2, 3, 4]
+		assert double.backend.requests == ['get_many', ('set_many', 5)]
+	
+	def test_only_misses_are_computed(self):
+		double = doubler()
+		double(1)
+		double(3)
+		del double.backend.requests[:]
+		
+		assert double.many([1, 2, 3, 4]) == [2, 4, 6, 8]
+		assert double.calls == [1, 3, 2, 4]
+		assert double.backend.requests == ['get_many', ('set_many', 2)]
+		
+		assert double(4) == 8  # Values stored in bulk are retrieved individually, too.
+		assert double.calls == [1, 3, 2, 4]
+	
+	def test_all_hits(self):
+		double = doubler()
+		double.many([1, 2])
+		del double.backend.requests[:]
+		
+		assert double.many([2, 1]) == [4, 2]
+		assert double.backend.requests == ['get_many']
+	
+	def test_tuples_are_positional_arguments(self):
+		double = doubler()
+		
+		assert double.many([(1, ), (1, 10), 1]) == [2, 12, 2]
+		assert double.calls == [1, 1]
+	
+	def test_duplicates_are_computed_once(self):
+		double = doubler()
+		
+		assert double.many([1, 1, 1]) == [2, 2, 2]
+		assert double.calls == [1]
+		assert double.backend.requests == ['get_many', ('set_many', 1)]
+	
+	def test_empty(self):
+		double = doubler()
+		
+		assert double.many([]) == []
+		assert double.backend.requests == []
+	
+	def test_executor(self):
+		double = doubler()
+		
+		with ThreadPoolExecutor(max_workers=4) as executor:
+			assert double.many(range(20), executor=executor) == [i * 2 for i in range(20)]
+		
+		assert sorted(double.calls) == list(range(20))
+		assert double.backend.requests == ['get_many', ('set_many', 20)]
+	
+	def test_shared_executor(self):
+		double = doubler()
+		
+		assert double.many(range(5), executor=True) == [0, 2, 4, 6, 8]
+		assert Cache.EXECUTOR is not None
+	
+	def test_local_tier(self):
+		double = doubler(local=True)
+		double(1)
+		del double.backend.requests[:]
+		
+		assert double.many([1, 2]) == [2, 4]
+		assert double.many([1, 2]) == [2, 4]
+		assert double.backend.requests == ['get_many', ('set_many', 1)]
+	
+	def test_populate_false(self):
+		double = doubler(populate=False)
+		
+		with pytest.raises(CacheMiss):
+			double.many([1])
+	
+	def test_leases_generate_individually(self):
+		double = doubler(lease=5)
+		
+		assert double.many([1, 2]) == [2, 4]
+		assert double.backend.requests == ['get_many', 'set', 'set']
+	
+	def test_method(self):
+		backend = CountingBackend()
+		
+		class Multiply(object):
+			def __init__(self, x):
+				self.x = x
+			
+			@Cache.method('x', prefix='test_many.method', backend=backend)
+			def do(self, y):
+				return self.x * y
+		
+		instances = [Multiply(i) for i in range(5)]
+		
+		assert Multiply.do.many([(instance, 2) for instance in instances]) == [0, 2, 4, 6, 8]
+		assert Multiply(3).do(2) == 6
+		assert Multiply(3).do.many([2]) == [6]
+		assert len(backend.data) == 5
+	
+	def test_mark(self):
+		double = doubler(minutes=5)
+		assert double.mark.prefix == 'test_many'
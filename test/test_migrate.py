@@ -0,0 +1,212 @@
+# encoding: utf-8
+
+import os
+import pytest
+
+from bson import ObjectId
+from bson.binary import Binary
+from mongoengine import connect, Document, DynamicField, StringField, ObjectIdField
+
+from marrow.cache.exc import CacheMiss
+from marrow.cache.model import CacheKey, Key, Cache
+from marrow.cache.backend import MongoBackend
+from marrow.cache.backend.mongo import compact
+from marrow.cache.migrate import migrate, main
+from marrow.cache.util import utcnow, timedelta
+from .helper import keyed, future
+
+
+PAYLOAD = os.urandom(100)  # Five chunks, at twenty bytes apiece.
+
+
+key = keyed('test_migrate')
+
+
+class Owner(Document):
+	_id = ObjectIdField(primary_key=True, default=ObjectId)
+	name = StringField()
+
+
+@pytest.fixture
+def collection():
+	if os.environ.get('MARROW_CACHE_OFFLINE'):
+		pytest.skip("Live MongoDB tests disabled.")
+	
+	connect('test')
+	Cache.drop_collection()
+	
+	collection = Cache._get_collection()
+	collection.database[collection.name + '.chunk'].drop()
+	
+	yield collection
+	
+	Cache.drop_collection()
+	collection.database[collection.name + '.chunk'].drop()
+
+
+@pytest.fixture
+def standard(collection):
+	return MongoBackend(collection, acknowledge=True)
+
+
+@pytest.fixture
+def compacted(collection):
+	return MongoBackend(collection, acknowledge=True, compact=True)
+
+
+def test_identifiers_are_fixed_width_and_stable():
+	owner = Owner()
+	identifier = compact(key(1, reference=owner).to_mongo())
+	
+	assert isinstance(identifier, Binary)
+	assert len(identifier) == 16
+	assert compact(Key('test_migrate', owner, key(1).hash).to_mongo()) == identifier
+	assert compact(key(2, reference=owner).to_mongo()) != identifier
+	assert compact(key(1).to_mongo()) != identifier
+
+
+class Numbered(Document):
+	_id = DynamicField(primary_key=True)
+
+
+def test_identifiers_distinguish_types():
+	assert compact(CacheKey(prefix='', hash='abc').to_mongo()) != compact(CacheKey(hash='abc').to_mongo())
+	assert compact(key(1, reference=Numbered(pk='1')).to_mongo()) != compact(key(1, reference=Numbered(pk=1)).to_mongo())
+
+
+class TestCompactLayout(object):
+	def test_record(self, compacted):
+		owner = Owner()
+		compacted.set(key(1, reference=owner), 27, future())
+		
+		record = compacted.collection.find_one()
+		
+		assert bytes(record['_id']) == bytes(compact(key(1, reference=owner).to_mongo()))
+		assert record['p'] == 'test_migrate'
+		assert record['r']['_ref'].id == owner.pk
+		assert record['h'] == key(1).hash
+	
+	def test_absent_fields_are_omitted(self, compacted):
+		compacted.set(CacheKey(hash='abc'), 27, future())
+		
+		record = compacted.collection.find_one()
+		
+		assert 'p' not in record
+		assert 'r' not in record
+	
+	def test_layouts_are_distinct(self, standard, compacted):
+		standard.set(key(1), 27, future())
+		
+		with pytest.raises(CacheMiss):
+			compacted.get(key(1))
+	
+	def test_scan(self, compacted):
+		compacted.set_many([(key(i), i, future()) for i in range(3)])
+		
+		found = dict((identity, value) for identity, value, expires in compacted.scan())
+		
+		assert found == dict((key(i).identity, i) for i in range(3))
+		assert len(list(compacted.scan(keys=[key(1).to_mongo()]))) == 1
+	
+	def test_usage_by_prefix(self, compacted):
+		compacted.CHUNK = 20
+		compacted.set(key(1), 27, future())
+		compacted.set(key(2), PAYLOAD, future())
+		compacted.set(key(3, prefix='other'), 27, future())
+		
+		assert compacted.usage('test_migrate', False) == (2, None)
+	
+	def test_the_document_class(self, collection):
+		Cache.COMPACT = True
+		
+		try:
+			Cache.set(key(1), 27, future())
+			
+			assert Cache.raw().compact
+			assert Cache.get(key(1)) == 27
+			assert isinstance(collection.find_one()['_id'], bytes)
+		
+		finally:
+			Cache.COMPACT = False
+		
+		assert not Cache.raw().compact
+
+
+class TestMigration(object):
+	def test_conversion(self, standard, compacted):
+		owner = Owner()
+		standard.set_many([(key(i), i, future()) for i in range(5)])
+		standard.set(key(1, reference=owner), 'owned', future())
+		
+		assert migrate(standard.collection) == 6
+		
+		assert standard.collection.count_documents({}) == 6
+		assert standard.collection.count_documents({'_id': {'$type': 'object'}}) == 0
+		assert compacted.get(key(3)) == 3
+		assert compacted.get(key(1, reference=owner)) == 'owned'
+		
+		with pytest.raises(CacheMiss):
+			standard.get(key(3))
+	
+	def test_batches(self, standard, compacted):
+		standard.set_many([(key(i), i, future()) for i in range(5)])
+		
+		assert migrate(standard.collection, batch=2) == 5
+		assert compacted.get_many([key(i) for i in range(5)]) == dict((key(i).identity, i) for i in range(5))
+	
+	def test_expired_values_are_removed(self, standard, compacted):
+		standard.set(key(1), 1, future())
+		standard.set(key(2), 2, utcnow() - timedelta(minutes=1))
+		
+		assert migrate(standard.collection) == 1
+		assert standard.collection.count_documents({}) == 1
+	
+	def test_newer_values_are_retained(self, standard, compacted):
+		standard.set(key(1), 'old', future())
+		compacted.set(key(1), 'new', future())
+		
+		migrate(standard.collection)
+		
+		assert compacted.get(key(1)) == 'new'
+		assert standard.collection.count_documents({}) == 1
+	
+	def test_chunked_values(self, standard, compacted):
+		standard.CHUNK = compacted.CHUNK = 20
+		standard.set(key(1), PAYLOAD, future())
+		
+		migrate(standard.collection)
+		
+		assert compacted.get(key(1)) == PAYLOAD
+		assert compacted.chunks.count_documents({}) == 5
+	
+	def test_invalidation(self, standard, compacted):
+		owner = Owner()
+		standard.set_many([(key(i, reference=owner), i, future()) for i in range(3)])
+		standard.set(key(1, prefix='other'), 27, future())
+		
+		migrate(standard.collection)
+		compacted.ensure_indexes()
+		
+		assert compacted.invalidate(CacheKey(reference=owner)) == 3
+		assert compacted.invalidate(CacheKey(prefix='other')) == 1
+	
+	def test_expansion(self, standard, compacted):
+		standard.CHUNK = compacted.CHUNK = 20
+		compacted.set(key(1), 27, future())
+		compacted.set(key(2), PAYLOAD, future())
+		
+		assert migrate(standard.collection, compact=False) == 2
+		assert standard.get(key(1)) == 27
+		assert standard.get(key(2)) == PAYLOAD
+		
+		with pytest.raises(CacheMiss):
+			compacted.get(key(1))
+
+
+def test_command(capsys, monkeypatch, standard, compacted):
+	monkeypatch.setattr('mongoengine.connect', lambda host: None)  # Retain the connection already made.
+	standard.set_many([(key(i), i, future()) for i in range(4)])
+	
+	assert main(['--mongo', 'mongodb://localhost/test', '--batch', '3', '--pause', '0']) == 0
+	assert 'Converted 4 records' in capsys.readouterr().err
+	assert compacted.get(key(2)) == 2
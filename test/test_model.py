@@ -4,16 +4,17 @@ import pytest
 from unittest import TestCase
 
 from bson import ObjectId
-from mongoengine import connect, Document, StringField, ObjectIdField
+from mongoengine import connect, Document, EmbeddedDocument, StringField, ObjectIdField
 
 from marrow.cache.exc import CacheMiss
-from marrow.cache.model import CacheKey, Cache
+from marrow.cache.model import CacheKey, Key, Cache
 from marrow.cache.util import utcnow, timedelta, contextmanager
 
 
 
 # [But, I came here for an argument! #python -ed]
-NO_ARGUMENTS = '4f888e090430fea81ed3e2f31a2824445a98e2877f0048502d57d8ead350cb5b'
+NO_ARGUMENTS = 'ecc3c5213fa269d94d249ad1e6e25e55'
+LEGACY_NO_ARGUMENTS = '4f888e090430fea81ed3e2f31a2824445a98e2877f0048502d57d8ead350cb5b'
 
 
 @pytest.yield_fixture(scope="module", autouse=True)
@@ -67,6 +68,15 @@ def bare():
 	return "Hello world!"
 
 
+class Greeting(EmbeddedDocument):
+	text = StringField()
+
+
+@Cache.memoize(prefix='greeting')
+def greeting():
+	return Greeting(text="Hello world!")
+
+
 class TestCacheKey(TestCase):
 	ck = new_ck()
 	
@@ -81,6 +91,53 @@ class TestCacheKey(TestCase):
 		assert 'test' in rep
 		assert 'None' in rep
 		assert NO_ARGUMENTS in rep
+	
+	def test_legacy_hash(self):
+		assert CacheKey.new('test', None, tuple(), dict(), legacy=True).hash == LEGACY_NO_ARGUMENTS
+	
+	def test_argument_sensitivity(self):
+		assert CacheKey.new('test', None, (1, ), dict()).hash != CacheKey.new('test', None, (1.0, ), dict()).hash
+		assert CacheKey.new('test', None, ('1', ), dict()).hash != CacheKey.new('test', None, (1, ), dict()).hash
+		
+		ordered = CacheKey.new('test', None, tuple(), dict(a=1, b=2))
+		assert ordered.hash == CacheKey.new('test', None, tuple(), dict(b=2, a=1)).hash
+
+
+class TestKey(TestCase):
+	def test_equivalence(self):
+		key = Key.new('test', None, tuple(), dict())
+		
+		assert key.hash == NO_ARGUMENTS
+		assert key == new_ck()
+		assert key.identity == new_ck().identity
+		assert key.to_mongo() == new_ck().to_mongo()
+		assert key.document().to_mongo() == new_ck().to_mongo()
+		assert repr(key) == repr(new_ck())
+	
+	def test_reference(self):
+		instance = ExampleDocument(name="Bob Dole").save()
+		
+		try:
+			key = Key.new('test', instance, (1, ), dict())
+			document = CacheKey.new('test', instance, (1, ), dict())
+			
+			assert key.identity == document.identity
+			assert list(key.to_mongo().items()) == list(document.to_mongo().items())
+		
+		finally:
+			instance.delete()
+	
+	def test_storage(self):
+		key = Key.new('test_key', None, (1, ), dict())
+		
+		try:
+			Cache.set(key, 27, utcnow() + timedelta(minutes=1))
+			
+			assert Cache.get(key) == 27
+			assert Cache.get(CacheKey.new('test_key', None, (1, ), dict())) == 27
+		
+		finally:
+			Cache.objects(key__prefix='test_key').delete()
 
 
 class TestCacheGeneral(TestCase):
@@ -128,7 +185,8 @@ class TestCacheGeneral(TestCase):
 	
 	def test_refreshing_on_cache_hit(self):
 		with saved_cv() as cv:
-			Cache.get(cv.key, refresh=lambda: utcnow() + Cache.DEFAULT_DELTA)
+			# Stored times have millisecond precision; ensure the refreshed expiry is distinguishable.
+			Cache.get(cv.key, refresh=lambda: utcnow() + Cache.DEFAULT_DELTA + timedelta(seconds=1))
 			assert cv.expires < cv.reload().expires
 
 
@@ -182,6 +240,40 @@ class TestCacheMemoize(TestCase):
 				assert False, "Failed to raise CacheMiss."
 			
 			assert Cache.objects.count() == 0
+	
+	def test_embedded_documents_survive_hits(self):
+		try:
+			miss = greeting()
+			hit = greeting()
+			
+			assert isinstance(miss, Greeting)
+			assert isinstance(hit, Greeting)
+			assert hit == miss
+			
+			key = Cache.objects(key__prefix='greeting').first().key
+			assert Cache.get(key) == miss
+			assert Cache.get_many([key], detail=True)[key.identity][0] == miss
+		finally:
+			Cache.objects(key__prefix='greeting').delete()
+	
+	def test_local_tier_serves_repeated_hits(self):
+		with acfunc(local=True) as inner:
+			assert inner() == 27
+			assert inner.called == True
+			
+			Cache.objects(key__prefix='acfunc').delete()  # Only the local tier can satisfy the next call.
+			
+			inner.called = False
+			assert inner() == 27
+			assert inner.called == False
+	
+	def test_local_tier_respects_stored_expiry(self):
+		with acfunc(local=True, seconds=-1) as inner:
+			assert inner() == 27
+			
+			inner.called = False
+			assert inner() == 27
+			assert inner.called == True
 
 
 class Example(object):
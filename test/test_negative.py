@@ -0,0 +1,193 @@
+# encoding: utf-8
+
+import pytest
+
+from marrow.cache.model import CacheMark, Cache, Raised
+from marrow.cache.local import LocalCache
+from marrow.cache.backend import MemoryBackend
+from marrow.cache.util import utcnow, timedelta
+from .helper import keyed
+
+
+key = keyed('test_negative')
+
+
+class Unavailable(Exception):
+	pass
+
+
+class Refused(Unavailable):
+	pass
+
+
+def expiry(backend, *args):
+	return backend.get(key(*args), detail=True)[1]
+
+
+def fetcher(backend, error=None, **kw):
+	"""Produce a memoized function returning its argument, or raising the given exception, counting calls."""
+	
+	calls = []
+	
+	@Cache.memoize(prefix='test_negative', backend=backend, days=1, **kw)
+	def fetch(value):
+		calls.append(value)
+		
+		if error is not None:
+			raise error
+		
+		return value
+	
+	fetch.calls = calls
+	return fetch
+
+
+class TestExceptions(object):
+	def test_not_cached_by_default(self):
+		backend = MemoryBackend()
+		fetch = fetcher(backend, Unavailable("down"))
+		
+		for i in range(2):
+			with pytest.raises(Unavailable):
+				fetch(1)
+		
+		assert len(fetch.calls) == 2
+		assert not backend.data
+	
+	def test_cached_and_raised_again(self):
+		backend = MemoryBackend()
+		fetch = fetcher(backend, Unavailable("down", 503), exceptions=Unavailable, exception_ttl=30)
+		
+		for i in range(3):
+			with pytest.raises(Unavailable) as info:
+				fetch(1)
+			
+			assert info.value.args == ("down", 503)
+		
+		assert len(fetch.calls) == 1
+		assert expiry(backend, 1) < utcnow() + timedelta(seconds=31)
+	
+	def test_default_expiry(self):
+		backend = MemoryBackend()
+		fetch = fetcher(backend, Unavailable(), exceptions=[Unavailable])
+		
+		with pytest.raises(Unavailable):
+			fetch(1)
+		
+		assert expiry(backend, 1) < utcnow() + CacheMark.NEGATIVE + timedelta(seconds=1)
+	
+	def test_subclasses(self):
+		fetch = fetcher(MemoryBackend(), Refused(object()), exceptions=[Unavailable])
+		
+		with pytest.raises(Refused):
+			fetch(1)
+		
+		with pytest.raises(Refused) as info:
+			fetch(1)
+		
+		assert info.value.args[0].startswith('<object object')  # Arguments not of basic types are represented.
+		assert len(fetch.calls) == 1
+	
+	def test_others_propagate(self):
+		backend = MemoryBackend()
+		fetch = fetcher(backend, ValueError(), exceptions=[Unavailable])
+		
+		with pytest.raises(ValueError):
+			fetch(1)
+		
+		assert not backend.data
+	
+	def test_no_longer_cached(self):
+		backend = MemoryBackend()
+		
+		with pytest.raises(Unavailable):
+			fetcher(backend, Unavailable(), exceptions=[Unavailable])(1)
+		
+		fetch = fetcher(backend)
+		
+		assert fetch(1) == 1
+		assert fetch.calls == [1]
+	
+	def test_codec(self):
+		fetch = fetcher(MemoryBackend(), Unavailable("down"), exceptions=[Unavailable], codec='pickle')
+		
+		for i in range(2):
+			with pytest.raises(Unavailable):
+				fetch(1)
+		
+		assert len(fetch.calls) == 1
+	
+	def test_local_tier(self):
+		fetch = fetcher(MemoryBackend(), Unavailable("down"), exceptions=[Unavailable], local=LocalCache())
+		
+		raised = []
+		
+		for i in range(3):
+			with pytest.raises(Unavailable) as info:
+				fetch(1)
+			
+			raised.append(info.value)
+		
+		assert len(fetch.calls) == 1
+		assert len(set(map(id, raised))) == 3  # Copies are raised, rather than accumulating tracebacks.
+	
+	def test_many(self):
+		fetch = fetcher(MemoryBackend(), Unavailable(), exceptions=[Unavailable])
+		
+		with pytest.raises(Unavailable):
+			fetch.many([1, 2])
+		
+		with pytest.raises(Unavailable):
+			fetch.many([1, 2])
+		
+		assert fetch.calls == [1, 2]
+	
+	def test_not_refreshed(self):
+		backend = MemoryBackend()
+		fetch = fetcher(backend, Unavailable(), exceptions=[Unavailable], refresh=True)
+		
+		for i in range(2):
+			with pytest.raises(Unavailable):
+				fetch(1)
+		
+		assert expiry(backend, 1) < utcnow() + CacheMark.NEGATIVE + timedelta(seconds=1)
+	
+	def test_record(self):
+		record = Raised(Refused("a", 1, [2])).record()
+		
+		assert record == {'__raised__': 'test.test_negative:Refused', 'args': ["a", 1, "[2]"]}
+		assert isinstance(Raised.restore(record, [Exception]).exception, Refused)
+
+
+class TestEmpty(object):
+	def test_shortened(self):
+		backend = MemoryBackend()
+		fetch = fetcher(backend, empty_ttl=10)
+		
+		for value in (None, [], 'a', 0):
+			assert fetch(value) == value
+			assert fetch(value) == value
+		
+		assert len(fetch.calls) == 4
+		assert expiry(backend, None) < utcnow() + timedelta(seconds=11)
+		assert expiry(backend, []) < utcnow() + timedelta(seconds=11)
+		assert expiry(backend, 'a') > utcnow() + timedelta(hours=23)
+		assert expiry(backend, 0) > utcnow() + timedelta(hours=23)  # Falsy is not empty.
+	
+	def test_predicate(self):
+		backend = MemoryBackend()
+		fetch = fetcher(backend, empty_ttl=10, empty=lambda value: value == 0)
+		
+		fetch(0)
+		fetch(None)
+		
+		assert expiry(backend, 0) < utcnow() + timedelta(seconds=11)
+		assert expiry(backend, None) > utcnow() + timedelta(hours=23)
+	
+	def test_many(self):
+		backend = MemoryBackend()
+		fetch = fetcher(backend, empty_ttl=10)
+		
+		assert fetch.many([None, 'a']) == [None, 'a']
+		assert expiry(backend, None) < utcnow() + timedelta(seconds=11)
+		assert expiry(backend, 'a') > utcnow() + timedelta(hours=23)
@@ -0,0 +1,167 @@
+# encoding: utf-8
+
+import gc
+import pytest
+
+from weakref import ref
+
+from marrow.cache.model import Cache
+from marrow.cache.backend import Refresher
+from marrow.cache.util import timedelta
+from .helper import CountingBackend, keyed, future, eventually
+
+
+key = keyed('test_refresh')
+
+
+def age(backend, seconds):
+	"""Bring every stored value closer to expiry by the given number of seconds."""
+	
+	for identity, (value, expires) in list(backend.data.items()):
+		backend.data[identity] = (value, expires - timedelta(seconds=seconds))
+
+
+def doubler(backend, **kw):
+	@Cache.memoize(prefix='test_refresh', backend=backend, minutes=10, **kw)
+	def double(value):
+		return value * 2
+	
+	return double
+
+
+@pytest.fixture
+def refresher():
+	previous = Cache.REFRESH
+	Cache.REFRESH = Refresher(interval=60)  # Only flushed explicitly.
+	
+	try:
+		yield Cache.REFRESH
+	finally:
+		Cache.REFRESH.close()
+		Cache.REFRESH = previous
+
+
+class TestRefresher(object):
+	def test_merges_and_flushes(self):
+		backend = CountingBackend()
+		refresher = Refresher(interval=60)
+		
+		try:
+			backend.set(key(1), 27, future())
+			backend.set(key(2), 42, future())
+			
+			for i in range(10):
+				refresher.touch(backend, key(1), future(days=1))
+			
+			refresher.touch(backend, key(2), future(days=1))
+			refresher.touch(backend, key(2), future(hours=1))  # The latest expiry time is retained.
+			
+			assert len(refresher.pending) == 2
+			assert refresher.flush() == 2
+			assert backend.batches == [2]
+			assert backend.touches == 0
+			assert backend.get(key(2), detail=True)[1] > future(hours=23)
+		
+		finally:
+			refresher.close()
+	
+	def test_background_flush(self):
+		backend = CountingBackend()
+		backend.set(key(1), 27, future())
+		refresher = Refresher(interval=0.01)
+		
+		try:
+			refresher.touch(backend, key(1), future(days=1))
+			
+			eventually(lambda: backend.batches)
+			
+			assert backend.batches == [1]
+		
+		finally:
+			refresher.close()
+	
+	def test_closed(self):
+		backend = CountingBackend()
+		backend.set(key(1), 27, future())
+		refresher = Refresher()
+		refresher.close()
+		
+		refresher.touch(backend, key(1), future(days=1))
+		
+		assert backend.touches == 1
+		assert not refresher.pending
+	
+	def test_unused_refreshers_are_collected(self):
+		backend = CountingBackend()
+		backend.set(key(1), 27, future())
+		refresher = Refresher(interval=0.01)
+		refresher.IDLE = 0.01
+		refresher.touch(backend, key(1), future(days=1))
+		
+		eventually(lambda: refresher.thread is None)
+		
+		assert backend.batches == [1]
+		
+		reference = ref(refresher)
+		del refresher
+		gc.collect()
+		
+		assert reference() is None
+
+
+class TestThreshold(object):
+	def test_every_hit(self, refresher):
+		backend = CountingBackend()
+		double = doubler(backend, refresh=True)
+		double(2)
+		
+		age(backend, 60)
+		double(2)
+		
+		assert backend.get(key(2), detail=True)[1] > future(minutes=9, seconds=30)  # Extended as part of the read.
+		assert not refresher.pending
+	
+	def test_not_below_threshold(self, refresher):
+		backend = CountingBackend()
+		double = doubler(backend, refresh=0.5)
+		
+		for i in range(3):
+			double(2)
+		
+		assert backend.touches == 0
+		assert not refresher.pending
+	
+	def test_below_threshold(self, refresher):
+		backend = CountingBackend()
+		double = doubler(backend, refresh=0.5)
+		double(2)
+		
+		age(backend, 6 * 60)  # Four of ten minutes remain.
+		
+		for i in range(5):
+			assert double(2) == 4
+		
+		assert len(refresher.pending) == 1
+		assert backend.touches == 0
+		
+		refresher.flush()
+		
+		assert backend.batches == [1]
+		assert backend.get(key(2), detail=True)[1] > future(minutes=9)
+	
+	def test_unbuffered(self):
+		previous, Cache.REFRESH = Cache.REFRESH, None
+		
+		try:
+			backend = CountingBackend()
+			double = doubler(backend, refresh=0.5)
+			double(2)
+			
+			age(backend, 6 * 60)
+			double(2)
+			
+			assert backend.touches == 1
+			assert backend.batches == []
+		
+		finally:
+			Cache.REFRESH = previous
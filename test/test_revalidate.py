@@ -0,0 +1,107 @@
+# encoding: utf-8
+
+from time import sleep
+from threading import Event
+
+from marrow.cache.model import Cache
+from marrow.cache.backend import MemoryBackend
+from marrow.cache.util import utcnow, timedelta
+from .helper import eventually
+
+
+
+def counter(**kw):
+	"""Produce a memoized function returning the number of times it has been called."""
+	
+	backend = MemoryBackend()
+	calls = []
+	
+	@Cache.memoize(prefix='test_revalidate', backend=backend, **kw)
+	def count():
+		calls.append(1)
+		return len(calls)
+	
+	count.calls = calls
+	count.backend = backend
+	
+	return count
+
+
+class TestStaleWhileRevalidate(object):
+	def test_fresh_values_are_not_regenerated(self):
+		count = counter(minutes=5, stale=60)
+		
+		assert count() == 1
+		assert count() == 1
+		
+		sleep(0.05)
+		assert len(count.calls) == 1
+	
+	def test_stale_values_are_served_while_regenerating(self):
+		count = counter(seconds=-1, stale=60)  # Stale from the moment it is stored.
+		
+		assert count() == 1
+		assert count() == 1  # Served stale, regenerated in the background.
+		
+		assert eventually(lambda: len(count.calls) == 2)
+		assert eventually(lambda: list(count.backend.data.values())[0][0] == 2)
+	
+	def test_stale_grace_extends_stored_expiry(self):
+		count = counter(minutes=5, stale=60)
+		count()
+		
+		value, expires = list(count.backend.data.values())[0]
+		assert expires > utcnow() + timedelta(minutes=5, seconds=50)
+	
+	def test_values_beyond_grace_are_regenerated_synchronously(self):
+		count = counter(seconds=-10, stale=5)  # Already beyond its grace period when stored.
+		
+		assert count() == 1
+		assert count() == 2
+	
+	def test_concurrent_revalidation_is_deduplicated(self):
+		release = Event()
+		backend = MemoryBackend()
+		calls = []
+		
+		@Cache.memoize(prefix='test_revalidate.dedupe', backend=backend, seconds=-1, stale=60)
+		def slow():
+			calls.append(1)
+			
+			if len(calls) > 1:
+				release.wait()
+			
+			return len(calls)
+		
+		assert slow() == 1
+		
+		for i in range(5):
+			assert slow() == 1
+		
+		release.set()
+		
+		assert eventually(lambda: len(calls) == 2)
+		sleep(0.05)
+		assert len(calls) == 2
+
+
+class TestEarlyRefresh(object):
+	def test_no_early_refresh_without_timing(self):
+		count = counter(minutes=5, early=1.0)
+		
+		assert count() == 1
+		assert count() == 1
+		
+		sleep(0.05)
+		assert len(count.calls) == 1
+	
+	def test_likely_early_refresh(self):
+		count = counter(minutes=5, early=1.0)
+		
+		assert count() == 1
+		
+		mark = count.mark
+		mark.delta = 60 * 60 * 24 * 365  # Pretend this takes a year to calculate, making early refresh near-certain.
+		
+		assert count() == 1
+		assert eventually(lambda: len(count.calls) == 2)
@@ -0,0 +1,317 @@
+# encoding: utf-8
+
+import pytest
+
+from threading import Event, Thread
+
+from bson import ObjectId
+from mongoengine import Document, StringField
+
+from marrow.cache.model import Cache
+from marrow.cache.scope import ContextVar, MEMO, SCOPES, ScopeMiddleware, vetoed
+from marrow.cache.backend import MemoryBackend
+
+
+class Account(Document):
+	meta = dict(collection='test_scope_account', allow_inheritance=True)
+	
+	name = StringField()
+	
+	@Cache.method('name', prefix='test_scope.greeting', backend=MemoryBackend())
+	def greeting(self):
+		self.calls = getattr(self, 'calls', 0) + 1
+		return "Hello " + self.name
+	
+	@classmethod
+	def saved(cls):
+		"""An instance treated as saved, without requiring a database."""
+		
+		result = cls(id=ObjectId(), name="Alice")
+		result._created = False
+		return result
+
+
+class Administrator(Account):
+	pass
+
+
+class Counting(MemoryBackend):
+	"""A memory backend counting the values retrieved from it."""
+	
+	def __init__(self):
+		super(Counting, self).__init__()
+		self.gets = 0
+	
+	def get(self, key, refresh=None, detail=False):
+		self.gets += 1
+		return super(Counting, self).get(key, refresh, detail)
+	
+	def get_many(self, keys, detail=False):
+		keys = list(keys)
+		self.gets += len(keys)
+		return super(Counting, self).get_many(keys, detail)
+
+
+def counted(backend):
+	calls = []
+	
+	@Cache.memoize(prefix='test_scope.double', backend=backend)
+	def double(value):
+		calls.append(value)
+		return value * 2
+	
+	return double, calls
+
+
+class TestVeto(object):
+	def test_default(self):
+		assert SCOPES.get() == ()
+		assert not vetoed(Account.saved())
+	
+	def test_global(self):
+		instance = Account.saved()
+		
+		with Cache.disable():
+			assert vetoed(instance)
+			
+			with Cache.enable():
+				assert not vetoed(instance)
+			
+			assert vetoed(instance)
+		
+		assert SCOPES.get() == ()
+	
+	def test_specificity(self):
+		instance, other = Administrator.saved(), Administrator.saved()
+		
+		with Cache.disable(Administrator):
+			with Cache.enable():  # Less specific than the class.
+				assert vetoed(instance)
+			
+			with Cache.enable(instance):
+				assert not vetoed(instance)
+				assert vetoed(other)
+			
+			with Cache.enable(Account):
+				assert vetoed(instance)
+		
+		with Cache.disable(Administrator):
+			assert not vetoed(Account.saved())
+	
+	def test_exception(self):
+		with pytest.raises(ValueError):
+			with Cache.disable():
+				raise ValueError()
+		
+		assert SCOPES.get() == ()
+
+
+class TestIsolation(object):
+	def test_calls(self):
+		instance = Account.saved()
+		instance.greeting()
+		
+		with Cache.disable(instance):
+			assert instance.greeting() == "Hello Alice"
+		
+		assert instance.calls == 2
+		
+		instance.greeting()
+		assert instance.calls == 2
+	
+	def test_threads(self):
+		instance = Account.saved()
+		entered, checked = Event(), Event()
+		seen = []
+		
+		def other():
+			entered.wait()
+			seen.append(vetoed(instance))
+			checked.set()
+		
+		thread = Thread(target=other)
+		thread.start()
+		
+		with Cache.disable():
+			entered.set()
+			checked.wait()
+			assert vetoed(instance)
+		
+		thread.join()
+		
+		assert seen == [False]
+	
+	@pytest.mark.skipif(ContextVar is None, reason="Requires contextvars.")
+	def test_tasks(self):
+		import asyncio
+		
+		instance = Account.saved()
+		
+		async def disabled(ready, proceed):
+			with Cache.disable():
+				ready.set()
+				await proceed.wait()
+				return vetoed(instance)
+		
+		async def enabled(ready, proceed):
+			await ready.wait()
+			result = vetoed(instance)
+			proceed.set()
+			return result
+		
+		async def main():
+			ready, proceed = asyncio.Event(), asyncio.Event()
+			return await asyncio.gather(disabled(ready, proceed), enabled(ready, proceed))
+		
+		assert asyncio.new_event_loop().run_until_complete(main()) == [True, False]
+
+
+class TestMemo(object):
+	def test_repeated(self):
+		backend = Counting()
+		double, calls = counted(backend)
+		
+		with Cache.scope() as memo:
+			assert [double(2) for i in range(5)] == [4] * 5
+			assert len(memo) == 1
+		
+		assert calls == [2]
+		assert backend.gets == 1
+		assert backend.get(double.mark.key(double.__wrapped__, None, (2, ), {})[0]) == 4  # Written through.
+		assert MEMO.get() is None
+		
+		double(2)
+		assert backend.gets == 3  # Retrieved again, beyond the scope.
+	
+	def test_hits(self):
+		backend = Counting()
+		double, calls = counted(backend)
+		double(3)
+		
+		with Cache.scope():
+			double(3)
+			double(3)
+		
+		assert calls == [3]
+		assert backend.gets == 2
+	
+	def test_nested(self):
+		with Cache.scope() as outer:
+			with Cache.scope() as inner:
+				assert inner is outer
+			
+			assert MEMO.get() is outer
+	
+	def test_many(self):
+		backend = Counting()
+		double, calls = counted(backend)
+		
+		with Cache.scope() as memo:
+			assert double(1) == 2
+			assert double.many([1, 2, 3]) == [2, 4, 6]
+			assert double(3) == 6
+			assert len(memo) == 3
+		
+		assert backend.gets == 3  # Once for the first call, then for the two values not yet memoized.
+	
+	def test_invalidate(self):
+		backend = Counting()
+		double, calls = counted(backend)
+		
+		with Cache.scope() as memo:
+			double(1)
+			double(2)
+			
+			double.invalidate(1)
+			assert len(memo) == 1
+			
+			Cache.invalidate(double)
+			assert not memo
+		
+		assert calls == [1, 2]
+	
+	def test_uncacheable(self):
+		instance = Account(name="Unsaved")
+		
+		with Cache.scope() as memo:
+			instance.greeting()
+			instance.greeting()
+		
+		assert not memo
+		assert instance.calls == 2
+	
+	def test_threads(self):
+		seen = []
+		
+		with Cache.scope():
+			thread = Thread(target=lambda: seen.append(MEMO.get()))
+			thread.start()
+			thread.join()
+		
+		assert seen == [None]
+	
+	@pytest.mark.skipif(ContextVar is None, reason="Requires contextvars.")
+	def test_coroutines(self):
+		import asyncio
+		
+		backend = Counting()
+		calls = []
+		
+		@Cache.memoize(prefix='test_scope.coroutine', backend=backend)
+		async def triple(value):
+			calls.append(value)
+			return value * 3
+		
+		async def main():
+			with Cache.scope():
+				return [await triple(2), await triple(2)] + (await triple.many([2, 3]))
+		
+		assert asyncio.new_event_loop().run_until_complete(main()) == [6, 6, 6, 9]
+		assert calls == [2, 3]
+
+
+class TestMiddleware(object):
+	def test_request(self):
+		backend = Counting()
+		double, calls = counted(backend)
+		seen = []
+		
+		def application(environ, start_response):
+			start_response('200 OK', [])
+			double(5)
+			
+			yield b'a'
+			
+			double(5)
+			seen.append(MEMO.get())
+			
+			yield b'b'
+		
+		app = ScopeMiddleware(application)
+		response = app({}, lambda status, headers: None)
+		
+		assert b''.join(response) == b'ab'
+		assert MEMO.get() is not None
+		
+		response.close()
+		
+		assert MEMO.get() is None
+		assert seen[0] == {double.mark.key(double.__wrapped__, None, (5, ), {})[0].identity: 10}
+		assert calls == [5]
+		assert backend.gets == 1
+	
+	def test_error(self):
+		def application(environ, start_response):
+			raise ValueError()
+		
+		with pytest.raises(ValueError):
+			ScopeMiddleware(application)({}, None)
+		
+		assert MEMO.get() is None
+	
+	def test_nested(self):
+		def application(environ, start_response):
+			return [b'']
+		
+		with Cache.scope():
+			assert ScopeMiddleware(application)({}, None) == [b'']
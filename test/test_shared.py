@@ -0,0 +1,250 @@
+# encoding: utf-8
+
+import os
+import pytest
+
+from multiprocessing import Process
+from threading import Thread
+
+from marrow.cache.exc import CacheMiss
+from marrow.cache.model import Cache, CacheKey
+from marrow.cache.shared import SharedCache
+from marrow.cache.backend import MemoryBackend
+from marrow.cache.backend.base import matches
+from marrow.cache.util import utcnow, timedelta
+from .helper import keyed
+
+
+key = keyed('test_shared')
+
+
+@pytest.fixture
+def path(tmpdir):
+	return str(tmpdir.join('shared'))
+
+
+@pytest.fixture
+def cache(path):
+	result = SharedCache(path, slots=64, slot=256)
+	yield result
+	result.close()
+
+
+def populate(path, count):
+	cache = SharedCache(path)
+	
+	for i in range(count):
+		cache.set(key(i).identity, i * 2)
+
+
+class TestSharedCache(object):
+	def test_miss(self, cache):
+		with pytest.raises(CacheMiss):
+			cache.get('missing')
+	
+	def test_hit(self, cache):
+		cache.set('key', {'value': [1, 2]})
+		
+		assert cache.get('key') == {'value': [1, 2]}
+		assert 'key' in cache
+		assert len(cache) == 1
+	
+	def test_replace(self, cache):
+		cache.set('key', 1)
+		cache.set('key', 2)
+		
+		assert cache.get('key') == 2
+		assert len(cache) == 1
+	
+	def test_expiry(self, cache):
+		cache.set('past', 1, utcnow() - timedelta(seconds=1))
+		cache.set('future', 2, utcnow() + timedelta(minutes=1))
+		cache.set('limited', 3, utcnow() + timedelta(minutes=1), ttl=-1)
+		
+		assert 'past' not in cache
+		assert cache.get('future') == 2
+		assert 'limited' not in cache
+	
+	def test_oversized(self, cache):
+		cache.set('large', 'x' * 1024)
+		assert 'large' not in cache
+	
+	def test_delete_and_clear(self, cache):
+		cache.set('foo', 1)
+		cache.set('bar', 2)
+		
+		cache.delete('foo')
+		assert 'foo' not in cache
+		assert len(cache) == 1
+		
+		cache.clear()
+		assert len(cache) == 0
+	
+	def test_full(self, cache):
+		for i in range(256):
+			cache.set(i, i)
+		
+		assert len(cache) == 64
+		assert all(cache.get(i) == i for i in range(256) if i in cache)
+	
+	def test_soonest_replaced(self, cache):
+		fingerprint, first = cache._locate('key')
+		cache.set('key', 1, utcnow() + timedelta(minutes=1))
+		
+		for i in range(10000):  # Fill the rest of the set this key occupies with values never expiring.
+			if cache._locate(i)[1] == first:
+				cache.set(i, i)
+		
+		assert 'key' not in cache
+	
+	def test_invalidate(self, cache):
+		cache.set(key(1).identity, 1)
+		cache.set(CacheKey.new('other', None, (1, ), {}).identity, 2)
+		
+		assert cache.invalidate(matches(CacheKey(prefix='test_shared'))) == 1
+		assert len(cache) == 1
+	
+	def test_invalidate_reads_only_matching_keys(self, cache):
+		for i in range(10):
+			cache.set(key(i).identity, i)
+			cache.set(CacheKey.new('other', None, (i, ), {}).identity, i)
+		
+		cache.set('plain', 27)  # Keys not of the form of an identity are always tested.
+		
+		loaded = []
+		load = cache._load
+		cache._load = lambda data: loaded.append(data) or load(data)
+		
+		assert cache.invalidate(matches(CacheKey(prefix='test_shared'))) == 10
+		assert len(loaded) == 11
+		assert len(cache) == 11
+		
+		del loaded[:]
+		
+		assert cache.invalidate(lambda identity: identity == 'plain') == 1
+		assert len(loaded) == 11
+	
+	def test_geometry(self, cache, path):
+		other = SharedCache(path, slots=1024, slot=4096)
+		
+		try:
+			assert (other.slots, other.slot) == (64, 256)
+		finally:
+			other.close()
+	
+	def test_invalid_geometry(self, path):
+		with pytest.raises(ValueError):
+			SharedCache(path, slots=4, ways=8)
+		
+		with pytest.raises(ValueError):
+			SharedCache(path, ways=0)
+		
+		with pytest.raises(ValueError):
+			SharedCache(path, slot=48)
+		
+		assert not os.path.exists(path)
+	
+	def test_invalid(self, path):
+		with open(path, 'wb') as fh:
+			fh.write(b'\0' * 64)
+		
+		with pytest.raises(ValueError):
+			SharedCache(path)
+
+
+class TestSharing(object):
+	def test_instances(self, cache, path):
+		other = SharedCache(path)
+		
+		try:
+			cache.set('key', 27)
+			assert other.get('key') == 27
+			
+			other.delete('key')
+			assert 'key' not in cache
+		
+		finally:
+			other.close()
+	
+	@pytest.mark.skipif(not hasattr(os, 'fork'), reason="Requires fork.")
+	def test_processes(self, cache, path):
+		worker = Process(target=populate, args=(path, 10))
+		worker.start()
+		worker.join()
+		
+		assert [cache.get(key(i).identity) for i in range(10)] == [i * 2 for i in range(10)]
+	
+	def test_consistent(self, cache):
+		"""Readers never observe a partially written value."""
+		
+		cache.set('key', (0, '0' * 100))
+		torn = []
+		running = [True]
+		
+		def write():
+			for i in range(2000):
+				cache.set('key', (i, str(i % 10) * 100))
+			
+			running[0] = False
+		
+		def read():
+			while running[0]:
+				try:
+					i, text = cache.get('key')
+				except CacheMiss:
+					continue
+				
+				if text != str(i % 10) * 100:
+					torn.append(i)
+		
+		threads = [Thread(target=write)] + [Thread(target=read) for i in range(2)]
+		
+		for thread in threads:
+			thread.start()
+		
+		for thread in threads:
+			thread.join()
+		
+		assert not torn
+	
+	def test_stripes_are_locked_independently(self, cache):
+		blocked = []
+		
+		def write(first):
+			with cache._stripe(first):
+				blocked.append(first)
+		
+		with cache._stripe(0):
+			other = Thread(target=write, args=(cache.ways, ))  # The first set of the next stripe.
+			other.start()
+			other.join(2)
+			
+			assert blocked == [cache.ways]  # Not held up by the stripe held here.
+			
+			same = Thread(target=write, args=(0, ))
+			same.start()
+			same.join(0.05)
+			
+			assert same.is_alive()  # Waits for the stripe held here.
+		
+		same.join()
+		
+		assert blocked == [cache.ways, 0]
+	
+	def test_memoize(self, cache):
+		calls = []
+		
+		@Cache.memoize(prefix='test_shared', local=cache, backend=MemoryBackend())
+		def double(value):
+			calls.append(value)
+			return value * 2
+		
+		assert double(4) == 8
+		
+		@Cache.memoize(prefix='test_shared', local=SharedCache(cache.path), backend=MemoryBackend())
+		def elsewhere(value):
+			calls.append(value)
+			return value * 2
+		
+		assert elsewhere(4) == 8
+		assert calls == [4]
@@ -0,0 +1,113 @@
+# encoding: utf-8
+
+import pytest
+
+from bson import ObjectId
+from mongoengine import Document, StringField, IntField
+
+from marrow.cache import signals
+from marrow.cache.model import Cache
+from marrow.cache.local import LocalCache
+from marrow.cache.backend import MemoryBackend
+
+
+@pytest.fixture
+def models(monkeypatch):
+	monkeypatch.setattr(signals, 'connect', lambda: None)  # Signal handlers are invoked directly, below.
+	
+	backend = MemoryBackend()
+	local = LocalCache()
+	
+	class Article(Document):
+		meta = dict(collection='test_signals_article', allow_inheritance=False)
+		
+		title = StringField(db_field='t')
+		views = IntField()
+		
+		@Cache.method('title', prefix='test_signals.heading', backend=backend, local=local, invalidate='changed')
+		def heading(self, size):
+			return '{0}:{1}'.format(self.title, size)
+		
+		@Cache.method(prefix='test_signals.summary', backend=backend, invalidate=True)
+		def summary(self):
+			return self.title[:3]
+		
+		@Cache.method(prefix='test_signals.untracked', backend=backend)
+		def untracked(self):
+			return self.title
+	
+	article = Article(id=ObjectId(), title="Hello")
+	article._created = False
+	
+	article.heading(1)
+	article.summary()
+	article.untracked()
+	article._clear_changed_fields()
+	
+	assert len(backend.data) == 3
+	
+	return Article, article, backend, local
+
+
+def prefixes(backend):
+	return sorted(identity[0] for identity in backend.data)
+
+
+class TestSignals(object):
+	def test_tracked(self, models):
+		Article = models[0]
+		assert sorted(mark.prefix for mark in signals.tracked(Article)) == ['test_signals.heading', 'test_signals.summary']
+	
+	def test_delete(self, models):
+		Article, article, backend, local = models
+		signals.deleted(Article, article)
+		
+		assert prefixes(backend) == ['test_signals.untracked']  # Only the values of tracking marks are removed.
+		assert len(local) == 0
+	
+	def test_save_without_relevant_changes(self, models):
+		Article, article, backend, local = models
+		article.views = 27
+		signals.saved(Article, article)
+		
+		assert prefixes(backend) == ['test_signals.heading', 'test_signals.untracked']
+		assert len(local) == 1
+	
+	def test_save_with_relevant_changes(self, models):
+		Article, article, backend, local = models
+		article.title = "Goodbye"
+		signals.saved(Article, article)
+		
+		assert prefixes(backend) == ['test_signals.untracked']
+		assert len(local) == 0
+	
+	def test_creation(self, models):
+		Article, article, backend, local = models
+		signals.saved(Article, article, created=True)
+		
+		assert len(backend.data) == 3
+	
+	def test_failures_are_logged(self, models):
+		Article, article, backend, local = models
+		
+		def fail(key):
+			raise ValueError()
+		
+		backend.invalidate = fail
+		signals.deleted(Article, article)  # Does not raise.
+	
+	def test_changed(self, models):
+		article = models[1]
+		article.title = "Goodbye"
+		
+		assert signals.changed(article, ['title'])
+		assert signals.changed(article, ['title.length'])
+		assert not signals.changed(article, ['views'])
+
+
+def test_requires_blinker():
+	if signals.signals.signals_available:
+		pytest.skip("The blinker package is installed.")
+	
+	with pytest.raises(ImportError):
+		signals.connect()
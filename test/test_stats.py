@@ -0,0 +1,242 @@
+# encoding: utf-8
+
+import os
+import socket
+
+import pytest
+
+from mongoengine import connect
+
+from marrow.cache.model import Cache
+from marrow.cache.local import LocalCache
+from marrow.cache.backend import MemoryBackend
+from marrow.cache.stats import Histogram, Stats, StatsdSink, LATENCY
+from marrow.cache.util import utcnow, timedelta
+
+
+@pytest.fixture
+def stats():
+	Cache.STATS = Stats()
+	
+	try:
+		yield Cache.STATS
+	finally:
+		Cache.STATS = None
+
+
+class Recorder(object):
+	def __init__(self):
+		self.events = []
+	
+	def count(self, prefix, event, amount):
+		self.events.append((prefix, event, amount))
+	
+	def observe(self, prefix, metric, value):
+		self.events.append((prefix, metric))
+
+
+class Failing(object):
+	def count(self, prefix, event, amount):
+		raise ValueError()
+	
+	observe = count
+
+
+class FailingBackend(MemoryBackend):
+	def set(self, key, value, expires):
+		raise ValueError()
+
+
+def doubler(**kw):
+	@Cache.memoize(prefix='test_stats', **kw)
+	def double(value):
+		return value * 2
+	
+	return double
+
+
+class TestHistogram(object):
+	def test_buckets(self):
+		histogram = Histogram((1, 10))
+		
+		for value in (0.5, 1, 5, 50):
+			histogram.add(value)
+		
+		assert histogram.buckets == [2, 1, 1]
+		assert histogram.count == 4
+		assert histogram.min == 0.5
+		assert histogram.max == 50
+		assert histogram.mean == 56.5 / 4
+	
+	def test_empty(self):
+		result = Histogram().as_dict()
+		
+		assert result['count'] == 0
+		assert result['mean'] is None
+		assert len(result['buckets']) == len(LATENCY) + 1
+
+
+class TestStats(object):
+	def test_counts_and_observations(self):
+		stats = Stats()
+		stats.count('a', 'hit')
+		stats.count('a', 'hit', 2)
+		stats.observe('a', 'lookup', 0.002)
+		stats.size('b', b'12345')
+		
+		result = stats.snapshot()
+		assert result['a']['hit'] == 3
+		assert result['a']['lookup']['count'] == 1
+		assert result['b']['size']['total'] == 5
+		
+		stats.reset()
+		assert stats.snapshot() == {}
+	
+	def test_sinks(self):
+		recorder = Recorder()
+		stats = Stats([Failing(), recorder])
+		
+		stats.count('a', 'miss')
+		stats.observe('a', 'compute', 1.0)
+		
+		assert recorder.events == [('a', 'miss', 1), ('a', 'compute')]
+		assert stats.snapshot()['a']['miss'] == 1
+	
+	def test_prometheus(self):
+		stats = Stats()
+		assert stats.prometheus() == ''
+		
+		stats.count('a"b', 'hit')
+		stats.count(None, 'miss')
+		stats.observe('a"b', 'lookup', 0.002)
+		stats.size('a"b', b'1' * 100)
+		
+		text = stats.prometheus()
+		
+		assert 'marrow_cache_events_total{prefix="a\\"b",event="hit"} 1\n' in text
+		assert 'marrow_cache_events_total{prefix="",event="miss"} 1\n' in text
+		assert '# TYPE marrow_cache_lookup_seconds histogram\n' in text
+		assert 'marrow_cache_lookup_seconds_bucket{prefix="a\\"b",le="0.001"} 0\n' in text
+		assert 'marrow_cache_lookup_seconds_bucket{prefix="a\\"b",le="0.0025"} 1\n' in text
+		assert 'marrow_cache_lookup_seconds_bucket{prefix="a\\"b",le="+Inf"} 1\n' in text
+		assert 'marrow_cache_lookup_seconds_count{prefix="a\\"b"} 1\n' in text
+		assert 'marrow_cache_size_bytes_sum{prefix="a\\"b"} 100\n' in text
+	
+	def test_statsd(self):
+		server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		server.bind(('127.0.0.1', 0))
+		server.settimeout(2)
+		
+		try:
+			sink = StatsdSink('127.0.0.1', server.getsockname()[1])
+			stats = Stats([sink])
+			
+			stats.count('app:fn', 'hit')
+			stats.observe('app:fn', 'lookup', 0.0015)
+			stats.size('app:fn', b'1234')
+			
+			assert server.recv(512) == b'marrow.cache.app_fn.hit:1|c'
+			assert server.recv(512) == b'marrow.cache.app_fn.lookup:1.500|ms'
+			assert server.recv(512) == b'marrow.cache.app_fn.size:4|h'
+		
+		finally:
+			server.close()
+
+
+class TestInstrumentation(object):
+	def test_disabled(self):
+		assert Cache.STATS is None
+		assert Cache.stats() == {}
+		
+		double = doubler(backend=MemoryBackend())
+		assert double(2) == 4
+		assert Cache.stats() == {}
+	
+	def test_miss_then_hit(self, stats):
+		double = doubler(backend=MemoryBackend())
+		
+		assert double(2) == 4
+		assert double(2) == 4
+		
+		result = Cache.stats()['test_stats']
+		assert result['miss'] == 1
+		assert result['hit'] == 1
+		assert 'expired' not in result
+		assert result['lookup']['count'] == 2
+		assert result['compute']['count'] == 1
+		assert result['size']['count'] == 1
+	
+	def test_local(self, stats):
+		double = doubler(backend=MemoryBackend(), local=LocalCache())
+		
+		double(2)
+		double(2)
+		
+		result = Cache.stats()['test_stats']
+		assert result['miss'] == 1
+		assert result['local'] == 1
+		assert 'hit' not in result
+	
+	def test_expired(self, stats):
+		backend = MemoryBackend()
+		double = doubler(backend=backend)
+		
+		double(2)
+		
+		for identity, (value, expires) in list(backend.data.items()):
+			backend.data[identity] = (value, utcnow() - timedelta(seconds=1))
+		
+		double(2)
+		
+		result = Cache.stats()['test_stats']
+		assert result['miss'] == 2
+		assert result['expired'] == 1
+	
+	def test_expired_in_mongodb(self, stats):
+		if os.environ.get('MARROW_CACHE_OFFLINE'):
+			pytest.skip("Live MongoDB tests disabled.")
+		
+		connect('test')
+		Cache.drop_collection()
+		double = doubler()
+		
+		try:
+			double(2)
+			Cache._get_collection().drop_index('e_1')  # Expired records linger until culled by the TTL index.
+			Cache.objects.update(expires=utcnow() - timedelta(seconds=1))
+			double(2)
+			
+			result = Cache.stats()['test_stats']
+			assert result['miss'] == 2
+			assert result['expired'] == 1
+		
+		finally:
+			Cache.drop_collection()
+			Cache.ensure_indexes()
+	
+	def test_refresh(self, stats):
+		double = doubler(backend=MemoryBackend(), refresh=True, minutes=5)
+		
+		double(2)
+		double(2)
+		
+		assert Cache.stats()['test_stats']['refresh'] == 1
+	
+	def test_set_failure(self, stats):
+		double = doubler(backend=FailingBackend())
+		
+		with pytest.raises(ValueError):
+			double(2)
+		
+		assert Cache.stats()['test_stats']['error'] == 1
+	
+	def test_many(self, stats):
+		double = doubler(backend=MemoryBackend())
+		double(1)
+		
+		assert double.many([1, 2, 3]) == [2, 4, 6]
+		
+		result = Cache.stats()['test_stats']
+		assert result['hit'] == 1
+		assert result['miss'] == 3
+		assert result['compute']['count'] == 3
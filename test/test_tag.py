@@ -0,0 +1,128 @@
+# encoding: utf-8
+
+from marrow.cache.model import Cache, CacheKey
+from marrow.cache.tag import Generations
+from marrow.cache.backend import MemoryBackend
+
+
+def counter(**kw):
+	backend = kw.pop('backend', None) or MemoryBackend()
+	calls = []
+	
+	@Cache.memoize(prefix=kw.pop('prefix', 'test_tag'), backend=backend, **kw)
+	def count(value=None):
+		calls.append(value)
+		return len(calls)
+	
+	count.backend = backend
+	
+	return count
+
+
+class TestGenerations(object):
+	def test_unbumped_tags_are_absent(self):
+		assert Generations().get(MemoryBackend(), ['a', 'b']) == ()
+	
+	def test_bump(self):
+		backend = MemoryBackend()
+		generations = Generations()
+		
+		generations.bump(backend, ['a'])
+		first = generations.get(backend, ['a', 'b'])
+		
+		assert [tag for tag, generation in first] == ['a']
+		
+		generations.bump(backend, ['a'])
+		assert generations.get(backend, ['a', 'b']) != first
+	
+	def test_generations_are_cached_briefly(self):
+		backend = MemoryBackend()
+		local, remote = Generations(ttl=60), Generations()
+		
+		before = local.get(backend, ['a'])
+		remote.bump(backend, ['a'])
+		
+		assert local.get(backend, ['a']) == before
+		assert Generations().get(backend, ['a']) == remote.get(backend, ['a'])
+	
+	def test_backends_are_distinct(self):
+		first, second = MemoryBackend(), MemoryBackend()
+		generations = Generations()
+		
+		generations.bump(first, ['a'])
+		
+		assert generations.get(first, ['a'])
+		assert generations.get(second, ['a']) == ()
+
+
+class TestTaggedMarks(object):
+	def test_unbumped_tags_do_not_alter_keys(self):
+		tagged, untagged = counter(tags=['test_tag.unbumped']), counter()
+		
+		assert tagged.mark.key(tagged.__wrapped__, None, (1, ), {})[0].hash == \
+				untagged.mark.key(untagged.__wrapped__, None, (1, ), {})[0].hash
+	
+	def test_static_tags(self):
+		backend = MemoryBackend()
+		count = counter(tags=['test_tag.static'], backend=backend)
+		other = counter(prefix='test_tag.other', tags=['test_tag.other'], backend=backend)
+		
+		assert count(1) == count(1) == 1
+		assert other(1) == 1
+		
+		Cache.bump('test_tag.static', backend=backend)
+		
+		assert count(1) == count(1) == 2
+		assert other(1) == 1
+		assert len(backend.data) == 4  # Two values for count, one for other, and the generation of the tag.
+	
+	def test_computed_tags(self):
+		count = counter(tags=lambda value: ['test_tag.value:{0}'.format(value)])
+		
+		assert (count(1), count(2)) == (1, 2)
+		
+		Cache.bump('test_tag.value:1', backend=count.backend)
+		
+		assert count(1) == 3
+		assert count(2) == 2
+	
+	def test_method_tags(self):
+		backend = MemoryBackend()
+		calls = []
+		
+		class Widget(object):
+			def __init__(self, id):
+				self.id = id
+			
+			@Cache.method('id', prefix='test_tag.method', backend=backend,
+					tags=lambda self, size: ['test_tag.widget:{0}'.format(self.id)])
+			def render(self, size):
+				calls.append((self.id, size))
+				return len(calls)
+		
+		first, second = Widget(1), Widget(2)
+		assert (first.render(10), second.render(10), first.render(10)) == (1, 2, 1)
+		
+		Cache.bump('test_tag.widget:1', backend=backend)
+		
+		assert first.render(10) == 3
+		assert second.render(10) == 2
+	
+	def test_global_backend(self):
+		backend = Cache.BACKEND = MemoryBackend()
+		
+		try:
+			@Cache.memoize(prefix='test_tag.global', tags=['test_tag.global'])
+			def answer():
+				backend.calls = getattr(backend, 'calls', 0) + 1
+				return 42
+			
+			answer()
+			Cache.bump('test_tag.global')
+			answer()
+			
+			assert backend.calls == 2
+			assert backend.get(CacheKey(prefix=Generations.PREFIX, hash='test_tag.global'))
+		
+		finally:
+			Cache.BACKEND = None
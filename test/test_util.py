@@ -1,6 +1,8 @@
 # encoding: utf-8
 
-from marrow.cache.util import stack
+import pytest
+
+from marrow.cache.util import stack, as_delta, getter, timedelta
 
 
 
@@ -20,3 +22,26 @@ def test_stack():
 		assert list(Example.stack) == [27]
 	
 	assert not hasattr(Example, 'stack')
+
+
+def test_as_delta():
+	assert as_delta(None) is None
+	assert as_delta(60) == timedelta(minutes=1)
+	assert as_delta(timedelta(hours=1)) == timedelta(hours=1)
+
+
+def test_getter():
+	class Example(object):
+		name = 'example'
+		items = ['a', 'b']
+		nested = {'key': 42}
+	
+	instance = Example()
+	
+	assert getter([])(instance) == ()
+	assert getter(['name'])(instance) == ('example', )
+	assert getter(['name', 'items.1', 'nested.key'])(instance) == ('example', 'b', 42)
+	assert getter(['nested.key'])(instance) == (42, )  # Falls back on array dereferencing.
+	
+	with pytest.raises(LookupError):
+		getter(['missing'])(instance)
@@ -0,0 +1,210 @@
+# encoding: utf-8
+
+import os
+import pytest
+
+from bson import ObjectId
+from mongoengine import connect, Document, ObjectIdField
+
+from marrow.cache.exc import CacheMiss
+from marrow.cache.local import LocalCache
+from marrow.cache.model import CacheKey, Cache, Key, Raised
+from marrow.cache.backend import MemoryBackend, MongoBackend
+from marrow.cache.warm import HotKeys, load, stream, warm, main
+from marrow.cache.util import utcnow, timedelta
+from .helper import key, future
+
+
+OFFLINE = bool(os.environ.get('MARROW_CACHE_OFFLINE'))
+
+
+class Parent(Document):
+	meta = dict(allow_inheritance=True)
+	
+	_id = ObjectIdField(primary_key=True, default=ObjectId)
+
+
+class Child(Parent):
+	pass
+
+
+@pytest.fixture(params=['memory', 'mongo'])
+def backend(request):
+	if request.param == 'memory':
+		yield MemoryBackend()
+		return
+	
+	if OFFLINE:
+		pytest.skip("Live MongoDB tests disabled.")
+	
+	connect('test')
+	Cache.drop_collection()
+	Cache.ensure_indexes()
+	
+	yield MongoBackend(Cache._get_collection(), acknowledge=True)
+	
+	Cache.drop_collection()
+
+
+@pytest.fixture
+def populated(backend):
+	backend.set_many([(key('warm.a', i), i * 2, future()) for i in range(5)])
+	backend.set_many([(key('warm.b', i), i * 3, future()) for i in range(3)])
+	backend.set(key('warm.a', 'stale'), 'stale', utcnow() - timedelta(minutes=1))
+	
+	return backend
+
+
+class TestScan(object):
+	def test_everything(self, populated):
+		found = dict((identity, value) for identity, value, expires in populated.scan())
+		
+		assert len(found) == 8
+		assert found[key('warm.a', 2).identity] == 4
+		assert key('warm.a', 'stale').identity not in found
+	
+	def test_prefix(self, populated):
+		found = list(populated.scan('warm.b'))
+		
+		assert sorted(value for identity, value, expires in found) == [0, 3, 6]
+		assert all(expires is not None for identity, value, expires in found)
+	
+	def test_limit(self, populated):
+		assert len(list(populated.scan(limit=3))) == 3
+	
+	def test_keys(self, populated):
+		keys = [key('warm.a', 1).to_mongo(), key('warm.b', 2).to_mongo(), key('warm.a', 'missing').to_mongo()]
+		found = dict((identity, value) for identity, value, expires in populated.scan(keys=keys))
+		
+		assert found == {key('warm.a', 1).identity: 2, key('warm.b', 2).identity: 6}
+	
+	def test_since(self, populated):
+		populated.access([(key('warm.a', 3), utcnow())])
+		
+		found = list(populated.scan(since=utcnow() - timedelta(minutes=1)))
+		
+		assert [identity for identity, value, expires in found] == [key('warm.a', 3).identity]
+
+
+class TestWarm(object):
+	def test_warm(self, populated):
+		local = LocalCache()
+		
+		assert warm(populated, local, 'warm.a') == 5
+		assert local.get(key('warm.a', 4).identity) == 8
+		
+		with pytest.raises(CacheMiss):
+			local.get(key('warm.b', 0).identity)
+	
+	def test_fresh_expiry(self, backend):
+		backend.set(key('warm.e', 1), 1, future(minutes=10))
+		backend.set(key('warm.e', 2), 2, future(minutes=1))  # Already stale.
+		local = LocalCache()
+		
+		assert warm(backend, local, 'warm.e', stale=timedelta(minutes=5), local_ttl=60) == 1
+		
+		expires = local._data[key('warm.e', 1).identity][1]
+		assert future(seconds=55) < expires <= future(seconds=60)  # Capped by the local TTL.
+		
+		with pytest.raises(CacheMiss):
+			local.get(key('warm.e', 2).identity)
+		
+		assert Cache.warm('warm.e', local=local, backend=backend, stale=300) == 1
+		
+		expires = local._data[key('warm.e', 1).identity][1]
+		assert future(minutes=4) < expires <= future(minutes=5)  # The fresh deadline.
+	
+	def test_raised(self, backend):
+		backend.set(key('warm.c', 1), Raised(ValueError('nope')).record(), future())
+		backend.set(key('warm.c', 2), 'fine', future())
+		
+		assert [value for identity, value, expires in stream(backend, 'warm.c')] == ['fine']
+	
+	def test_model(self, populated):
+		local = LocalCache()
+		
+		assert Cache.warm('warm.b', local=local, backend=populated) == 3
+		assert local.get(key('warm.b', 1).identity) == 3
+	
+	def test_inherited_reference(self, backend):
+		criteria = CacheKey.new('warm.d', Child(), (), dict())
+		backend.set(criteria, 27, future())
+		
+		local = LocalCache()
+		
+		assert warm(backend, local, 'warm.d') == 1
+		assert local.get(criteria.identity) == 27
+		assert local.get(Key.new('warm.d', criteria.reference, (), dict()).identity) == 27
+	
+	def test_no_tier(self, populated):
+		with pytest.raises(ValueError):
+			Cache.warm(backend=populated)
+
+
+class TestHotKeys(object):
+	def test_record(self):
+		hot = HotKeys(capacity=2)
+		
+		for i in (1, 2, 2, 3, 3, 3):
+			hot.record(key('warm.a', i))
+		
+		assert [(k.identity, count) for k, count in hot.top()] == [(key('warm.a', 3).identity, 3),
+				(key('warm.a', 2).identity, 2)]
+	
+	def test_capacity(self):
+		hot = HotKeys(capacity=2)
+		
+		for i in (1, 1, 2, 3, 4, 5):
+			hot.record(key('warm.a', i))
+		
+		assert len(hot.counts) <= 4
+		assert key('warm.a', 1).identity in hot.counts
+	
+	def test_decorated(self):
+		hot = Cache.HOT = HotKeys()
+		
+		try:
+			@Cache.memoize(prefix='warm.d', backend=MemoryBackend())
+			def double(value):
+				return value * 2
+			
+			double(1)
+			double(1)
+			double(2)
+		
+		finally:
+			Cache.HOT = None
+		
+		assert [count for k, count in hot.top()] == [2, 1]
+	
+	def test_round_trip(self, populated, tmpdir):
+		path = str(tmpdir.join('hot.json'))
+		hot = HotKeys()
+		
+		for i in (1, 4, 4):
+			hot.record(key('warm.a', i))
+		
+		assert hot.save(path) == 2
+		assert [dict(criteria) for criteria in load(path)] == [dict(key('warm.a', 4).to_mongo()),
+				dict(key('warm.a', 1).to_mongo())]
+		
+		local = LocalCache()
+		
+		assert warm(populated, local, keys=path) == 2
+		assert local.get(key('warm.a', 1).identity) == 2
+
+
+@pytest.mark.skipif(OFFLINE, reason="Live MongoDB tests disabled.")
+def test_command(capsys, monkeypatch):
+	connect('test')
+	monkeypatch.setattr('mongoengine.connect', lambda host: None)  # Retain the connection already made.
+	Cache.drop_collection()
+	
+	try:
+		Cache.raw().set_many([(key('warm.e', i), i, future()) for i in range(4)])
+		
+		assert main(['--mongo', 'mongodb://localhost/test', '--prefix', 'warm.e']) == 0
+		assert 'Streamed 4 values' in capsys.readouterr().err
+	
+	finally:
+		Cache.drop_collection()